@@ -1,5 +1,5 @@
 resource "aws_cloudwatch_event_rule" "pull" {
-    for_each                = local.pull_peers
+    for_each                = var.pull_batch_schedule == null ? local.pull_peers : {}
     name                    = "${local.resource_prefix}-${each.key}"
     description             = "triggers SFTP pull for ${each.value["name"]}"
     schedule_expression     = "cron(${each.value["schedule"]})"
@@ -19,7 +19,7 @@ resource "aws_cloudwatch_event_rule" "api" {
 }
 
 resource "aws_cloudwatch_event_target" "pull" {
-    for_each = local.pull_peers
+    for_each = var.pull_batch_schedule == null ? local.pull_peers : {}
     arn      = module.lambda_function_pull.lambda_function_arn
     rule     = aws_cloudwatch_event_rule.pull[each.key].name
     input    = jsonencode({
@@ -37,7 +37,7 @@ resource "aws_cloudwatch_event_target" "api" {
 }
 
 resource "aws_lambda_permission" "allow_eventbridge_pull_trigger" {
-    for_each        = local.pull_peers
+    for_each        = var.pull_batch_schedule == null ? local.pull_peers : {}
     statement_id    = "${local.resource_prefix}-allow-cloudwatch-${each.key}"
     action          = "lambda:InvokeFunction"
     function_name   = module.lambda_function_pull.lambda_function_name
@@ -52,4 +52,30 @@ resource "aws_lambda_permission" "allow_eventbridge_api_trigger" {
     function_name   = module.lambda_function_api.lambda_function_name
     principal       = "events.amazonaws.com"
     source_arn      = aws_cloudwatch_event_rule.api[each.key].arn
-}
\ No newline at end of file
+}
+
+resource "aws_cloudwatch_event_rule" "pull_batch" {
+    count                   = var.pull_batch_schedule == null ? 0 : 1
+    name                    = "${local.resource_prefix}-pull-batch"
+    description             = "triggers SFTP pull for all pull peers"
+    schedule_expression     = "cron(${var.pull_batch_schedule})"
+    depends_on              = [aws_s3_bucket_notification.on_upload, aws_s3_bucket_notification.on_incoming]
+}
+
+resource "aws_cloudwatch_event_target" "pull_batch" {
+    count    = var.pull_batch_schedule == null ? 0 : 1
+    arn      = module.lambda_function_pull.lambda_function_arn
+    rule     = aws_cloudwatch_event_rule.pull_batch[0].name
+    input    = jsonencode({
+        ids = null,
+    })
+}
+
+resource "aws_lambda_permission" "allow_eventbridge_pull_batch_trigger" {
+    count           = var.pull_batch_schedule == null ? 0 : 1
+    statement_id    = "${local.resource_prefix}-allow-cloudwatch-pull-batch"
+    action          = "lambda:InvokeFunction"
+    function_name   = module.lambda_function_pull.lambda_function_name
+    principal       = "events.amazonaws.com"
+    source_arn      = aws_cloudwatch_event_rule.pull_batch[0].arn
+}
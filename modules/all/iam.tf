@@ -58,7 +58,9 @@ resource "aws_iam_policy" "lambda_pull" {
         ],
         Resource = [
           "${aws_s3_bucket.upload.arn}",
-          "${aws_s3_bucket.upload.arn}/*"
+          "${aws_s3_bucket.upload.arn}/*",
+          "${aws_s3_bucket.pull_state.arn}",
+          "${aws_s3_bucket.pull_state.arn}/*"
         ]
       },
       {
@@ -68,6 +70,16 @@ resource "aws_iam_policy" "lambda_pull" {
           "appconfig:StartConfigurationSession"
         ],
         Resource = ["*"]
+      },
+      {
+        # pulls that run out of time continue in a new invocation
+        Effect = "Allow",
+        Action = [
+          "lambda:InvokeFunction"
+        ],
+        Resource = [
+          "arn:aws:lambda:${data.aws_region.current.region}:${data.aws_caller_identity.current.account_id}:function:${local.resource_prefix}-pull"
+        ]
       }
     ]
   })
@@ -397,6 +409,8 @@ resource "aws_iam_policy" "lambda_admin_tasks" {
           "${aws_s3_bucket.files.arn}/*",
           "${aws_s3_bucket.backfill_categories_temp.arn}",
           "${aws_s3_bucket.backfill_categories_temp.arn}/*",
+          "${aws_s3_bucket.pull_state.arn}",
+          "${aws_s3_bucket.pull_state.arn}/*",
         ]
       },
       {
@@ -19,6 +19,8 @@ module "lambda_function_pull" {
     AWS_APPCONFIG_EXTENSION = "true"
     APP_CONFIG_PEERS_URL    = local.appconfig_extension_url
     BUCKET_NAME_UPLOAD      = aws_s3_bucket.upload.id
+    BUCKET_NAME_PULL_STATE  = aws_s3_bucket.pull_state.id
+    PULL_BATCH_CONCURRENCY  = var.pull_batch_concurrency
     METRIC_NAMESPACE        = local.resource_prefix
     LOG_LEVEL               = "INFO"
   }
@@ -193,6 +195,7 @@ module "lambda_function_admin_tasks" {
     BUCKET_NAME_BACKFILL_CATEGORIES_TEMP  = aws_s3_bucket.backfill_categories_temp.id
     BUCKET_NAME_UPLOAD                    = aws_s3_bucket.upload.id
     BUCKET_NAME_FILES                     = aws_s3_bucket.files.id
+    BUCKET_NAME_PULL_STATE                = aws_s3_bucket.pull_state.id
     METRIC_NAMESPACE                      = local.resource_prefix
     LOG_LEVEL                             = "INFO"
   }
@@ -47,6 +47,42 @@ resource "aws_s3_bucket" "files" {
   force_destroy = var.features.s3.can_be_deleted_if_not_empty
 }
 
+resource "aws_s3_bucket" "pull_state" {
+  bucket        = "${local.resource_prefix}-pull-state"
+  force_destroy = var.features.s3.can_be_deleted_if_not_empty
+}
+
+resource "aws_s3_bucket_versioning" "pull_state" {
+  bucket = aws_s3_bucket.pull_state.id
+  versioning_configuration {
+    status = "Enabled"
+  }
+}
+
+# pull state is rewritten by every pull and the lease whenever it is renewed, previous versions are only kept to recover
+# from a broken manifest and removed after a few days, as are the delete markers of released leases
+resource "aws_s3_bucket_lifecycle_configuration" "pull_state" {
+  bucket     = aws_s3_bucket.pull_state.id
+  depends_on = [aws_s3_bucket_versioning.pull_state]
+
+  rule {
+    id = "remove-previous-versions"
+    status = "Enabled"
+
+    filter {
+      prefix = ""
+    }
+
+    noncurrent_version_expiration {
+      noncurrent_days = 3
+    }
+
+    expiration {
+      expired_object_delete_marker = true
+    }
+  }
+}
+
 resource "aws_s3_bucket" "backfill_categories_temp" {
   bucket        = "${local.resource_prefix}-backfill-categories-temp"
   force_destroy = true
@@ -67,4 +103,27 @@ resource "aws_s3_bucket_lifecycle_configuration" "backfill_categories_temp" {
       days = 30
     }
   }
-}
\ No newline at end of file
+}
+# multipart uploads which could not be aborted, e.g. because the Lambda timed out, are removed after a day
+resource "aws_s3_bucket_lifecycle_configuration" "abort_incomplete_multipart_uploads" {
+  for_each = {
+    upload      = aws_s3_bucket.upload.id
+    incoming    = aws_s3_bucket.incoming.id
+    categorized = aws_s3_bucket.categorized.id
+    files       = aws_s3_bucket.files.id
+  }
+  bucket = each.value
+
+  rule {
+    id = "abort-incomplete-multipart-uploads"
+    status = "Enabled"
+
+    filter {
+      prefix = ""
+    }
+
+    abort_incomplete_multipart_upload {
+      days_after_initiation = 1
+    }
+  }
+}
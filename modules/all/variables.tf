@@ -47,6 +47,93 @@ variable "peers_config" {
         alert_window                      = optional(string)
         alert_threshold                   = optional(string)
         add-timestamp-to-downloaded-files = optional(bool)
+        download-concurrency              = optional(number)
+        # Number of SFTP channels used to download files in parallel (pull peers only, at most 10)
+        sftp-read                         = optional(
+          object({
+            prefetch                         = optional(bool)
+            max-concurrent-prefetch-requests = optional(number)
+            read-size                        = optional(number)
+            buffer-size                      = optional(number)
+          })
+        )
+        # Tunes how remote files are read (pull peers only), see README
+        sftp-transport                    = optional(
+          object({
+            profile         = optional(string)
+            ciphers         = optional(list(string))
+            macs            = optional(list(string))
+            compress        = optional(bool)
+            window-size     = optional(number)
+            max-packet-size = optional(number)
+          })
+        )
+        # Tunes how the SSH connection is negotiated (pull peers only), see README
+        sftp-walk                         = optional(
+          object({
+            folders      = optional(list(string))
+            include      = optional(list(string))
+            exclude      = optional(list(string))
+            max-depth    = optional(number)
+            max-age-days = optional(number)
+          })
+        )
+        # Restricts which remote folders and files are listed (pull peers only), see README
+        listing-cache                     = optional(bool)
+        # Only lists remote folders that changed since the previous pull (pull peers only, needs a pull state bucket)
+        after-download                    = optional(
+          object({
+            action         = optional(string)
+            archive-folder = optional(string)
+          })
+        )
+        # What happens to remote files once stored in S3: "none" (default), "archive" or "delete" (pull peers only)
+        content-dedup                     = optional(
+          object({
+            enabled      = optional(bool)
+            remote-check = optional(bool)
+          })
+        )
+        # Skips storing content already pulled under another name (pull peers only, needs a pull state bucket)
+        appending-files                   = optional(list(string))
+        # Remote files which only ever grow, only their new bytes are read (pull peers only, needs a pull state bucket)
+        sftp-stripes                      = optional(
+          object({
+            min-size    = optional(number)
+            connections = optional(number)
+            stripe-size = optional(number)
+          })
+        )
+        # Reads large files over multiple SSH connections in parallel (pull peers only), see README
+        sftp-retry                        = optional(
+          object({
+            attempts            = optional(number)
+            backoff-seconds     = optional(number)
+            max-backoff-seconds = optional(number)
+          })
+        )
+        # Retries files on a new SSH connection once the connection dropped (pull peers only), see README
+        pull-lock                         = optional(
+          object({
+            enabled     = optional(bool)
+            ttl-seconds = optional(number)
+          })
+        )
+        # Prevents overlapping pulls of the same peer (pull peers only, needs a pull state bucket), see README
+        adaptive-schedule                 = optional(
+          object({
+            enabled              = optional(bool)
+            min-history          = optional(number)
+            threshold            = optional(number)
+            backoff-minutes      = optional(number)
+            max-interval-minutes = optional(number)
+          })
+        )
+        # Skips polls outside the times new files usually arrive (pull peers only, needs a pull state bucket), see README
+        download-order                    = optional(string)
+        # One of "listing" (default), "smallest-first" or "oldest-first" (pull peers only)
+        reuse-connections                 = optional(bool)
+        # Keeps the SSH connection open for subsequent pulls in the same Lambda container (pull peers only)
         ssh-public-key                    = optional(string)
         config                            = optional(
           object({
@@ -117,6 +204,18 @@ variable "peers_config" {
   }
 }
 
+variable "pull_batch_schedule" {
+  default     = null
+  type        = string
+  description = "When set, all pull peers are pulled together by a single invocation on this schedule (cron expression) instead of one invocation per peer on the peer's schedule."
+}
+
+variable "pull_batch_concurrency" {
+  default     = 4
+  type        = number
+  description = "Number of peers pulled concurrently by a batch pull, see pull_batch_schedule."
+}
+
 variable "features" {
   type = object({
     push_server = object({
@@ -1,9 +1,13 @@
 import json
 import logging
 import os
+import threading
 import uuid
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
-from typing import Any, Callable, Dict, List, Optional
+from itertools import islice
+from typing import Any, Callable, Deque, Dict, List, Optional
 
 from aws_lambda_typing.context import Context
 from mypy_boto3_s3 import S3Client
@@ -13,6 +17,7 @@ from admin_tasks.entities.backfill_api_arch import BackfillApiArch
 from admin_tasks.entities.backfill_api_wise import BackfillApiWise
 from admin_tasks.entities.backfill_categories import BackfillCategories
 from admin_tasks.entities.backfill_incoming import BackfillIncoming
+from admin_tasks.entities.rebuild_pull_manifest import RebuildPullManifest
 from api.api_facade import ArchApiFacade, WiseApiFacade
 from api.utils.datetime_range_calculator import BackfillDatetimeRangeCalculator
 from clients import get_s3_client, get_ssm_client
@@ -20,7 +25,17 @@ from entities.context_under_test import ContextUnderTest
 from utils.common import attempt_categorisation_and_transformation, peer_secret_id
 from utils.config import fetch_configured_categories, fetch_peers_config
 from utils.crypt import post_process_incoming_file
-from utils.s3 import DELETE_OBJECTS_CHUNK_SIZE, BucketItem, copy_object, delete_objects, list_bucket
+from utils.listing_index import ListingIndex
+from utils.pull_manifest import load_pull_manifest, rebuild_pull_manifest, save_pull_manifest
+from utils.s3 import (
+    COPY_OBJECTS_DEFAULT_CONCURRENCY,
+    DELETE_OBJECTS_CHUNK_SIZE,
+    BucketItem,
+    ObjectCopy,
+    copy_objects,
+    delete_objects,
+    iter_bucket_sharded,
+)
 from utils.secrets import fetch_secret
 
 logger = logging.getLogger()
@@ -28,6 +43,9 @@ logger.setLevel(os.environ.get("LOG_LEVEL", "INFO"))
 
 MAX_ALLOWED_DATE_RANGE_ARCH = 31
 
+# number of files transformed concurrently while backfilling categories, each of them is held in memory
+TRANSFORM_DEFAULT_CONCURRENCY = 2
+
 
 def handler(event: Dict[str, Any], context: Context, test_context: Optional[ContextUnderTest] = None) -> Dict[str, Any]:
     """This functions perform certain admin tasks based on the instructions in the given `AdminTaskEvent`.
@@ -94,6 +112,14 @@ def handler(event: Dict[str, Any], context: Context, test_context: Optional[Cont
                 backfill=backfill,
                 current_datetime=current_datetime,
             )
+        elif event.get("name") == "rebuild_pull_manifest":
+            s3_client = getattr(test_context, "s3_client", None) or get_s3_client()
+            try:
+                rebuild = RebuildPullManifest.from_dict(event.get("task", {}))
+            except KeyError:
+                raise ValueError(f"Unable to deserialize RebuildPullManifest from: {event.get('task', {})}")
+
+            responses = _on_rebuild_pull_manifest_request(s3_client=s3_client, rebuild=rebuild)
         else:
             raise ValueError(f"Unsupported AdminTask: {event.get('name')}")
 
@@ -109,26 +135,6 @@ def handler(event: Dict[str, Any], context: Context, test_context: Optional[Cont
         }
 
 
-def _satisfies_start_and_end_range(
-    item: BucketItem, start_timestamp: Optional[datetime], end_timestamp: Optional[datetime]
-) -> bool:
-    """Returns True if the specified BucketItem:
-     - does not have it's last_modified date attribute populated OR
-     - was last modified after the given start_timestamp or start_timestamp is None AND
-     - was last modified before the end_timestamp or end_timestamp is None
-
-    :param item: a BucketItem
-    :return: boolean
-    """
-    if item.last_modified is None:
-        return True
-
-    if start_timestamp is not None and item.last_modified < start_timestamp:
-        return False
-
-    return not (end_timestamp is not None and item.last_modified > end_timestamp)
-
-
 def _on_backfill_incoming_request(
     ssm_client: SSMClient, s3_client: S3Client, backfill: BackfillIncoming, current_datetime: Callable[[], datetime]
 ) -> Dict[str, Any]:
@@ -142,23 +148,19 @@ def _on_backfill_incoming_request(
         return os.path.splitext(object_key)[-1] == extension
 
     upload_bucket = os.environ["BUCKET_NAME_UPLOAD"]
-    previously_uploaded = [
+    previously_uploaded = ListingIndex.from_bucket_items(
         item
-        for item in list_bucket(client=s3_client, bucket_name=upload_bucket, prefix=peer_id)
+        for item in iter_bucket_sharded(client=s3_client, bucket_name=upload_bucket, prefix=peer_id)
         if endswith_extension(object_key=item.key, extension=extension)
-    ]
-
-    responses: Dict[str, List[str]] = dict()
+    )
 
-    for bucket_item in previously_uploaded:
-        if not bucket_item.last_modified:
-            raise ValueError(f"Unable to backfill ({bucket_item.key}) which does not have last modification date set.")
+    undated_item = next(iter(previously_uploaded.without_last_modified()), None)
+    if undated_item:
+        raise ValueError(f"Unable to backfill ({undated_item.key}) which does not have last modification date set.")
 
-        if not _satisfies_start_and_end_range(
-            item=bucket_item, start_timestamp=start_timestamp, end_timestamp=end_timestamp
-        ):
-            continue
+    responses: Dict[str, List[str]] = dict()
 
+    for bucket_item in previously_uploaded.modified_between(start=start_timestamp, end=end_timestamp):
         item_response = post_process_incoming_file(
             s3_client=s3_client,
             ssm_client=ssm_client,
@@ -310,24 +312,33 @@ def _on_backfill_categories_request(
         ]
 
     incoming_bucket = os.environ["BUCKET_NAME_INCOMING"]
+    copy_concurrency = max(1, int(os.environ.get("COPY_CONCURRENCY", COPY_OBJECTS_DEFAULT_CONCURRENCY)))
+    transform_concurrency = max(1, int(os.environ.get("TRANSFORM_CONCURRENCY", TRANSFORM_DEFAULT_CONCURRENCY)))
 
     categorized_bucket = os.environ["BUCKET_NAME_CATEGORIZED"]
-    previously_categorized = list_bucket(client=s3_client, bucket_name=categorized_bucket, prefix=peer_id)
-    chunk_size = DELETE_OBJECTS_CHUNK_SIZE
-    chunks = [previously_categorized[i : i + chunk_size] for i in range(0, len(previously_categorized), chunk_size)]
+    previously_categorized = iter_bucket_sharded(client=s3_client, bucket_name=categorized_bucket, prefix=peer_id)
+    # S3 continues listings after the last key returned, so deleting the listed objects does not disturb the listing
+    chunks = iter(lambda: list(islice(previously_categorized, DELETE_OBJECTS_CHUNK_SIZE)), [])
     for items_chunk in chunks:
-        if items_chunk:
-            # backup the files in the temporary location before deleting them from the 'categorized' bucket
-            temp_bucket = os.environ["BUCKET_NAME_BACKFILL_CATEGORIES_TEMP"]
-            for deletion_candidate in items_chunk:
-                destination_key = os.path.join(request_id, deletion_candidate.key)
-                copy_object(
-                    client=s3_client,
+        # backup the files in the temporary location before deleting them from the 'categorized' bucket
+        temp_bucket = os.environ["BUCKET_NAME_BACKFILL_CATEGORIES_TEMP"]
+        backups = copy_objects(
+            client=s3_client,
+            copies=(
+                ObjectCopy(
                     source_bucket_name=categorized_bucket,
                     source_key=deletion_candidate.key,
                     destination_bucket_name=temp_bucket,
-                    destination_key=destination_key,
+                    destination_key=os.path.join(request_id, deletion_candidate.key),
                 )
+                for deletion_candidate in items_chunk
+            ),
+            concurrency=copy_concurrency,
+        )
+        failed_backups = [backup.copy.source_key for backup in backups if backup.error]
+        if failed_backups:
+            logger.error(f"Unable to back up {len(failed_backups)} object(s), e.g. {failed_backups[0]}.")
+            raise ValueError("Copying S3 object failed.")
 
         if category_id:
             # if a single category is backfilled, we only want to delete objects in that category
@@ -336,21 +347,51 @@ def _on_backfill_categories_request(
 
         delete_objects(client=s3_client, bucket_name=categorized_bucket, items=items_chunk)
 
-    bucket_items = list_bucket(client=s3_client, bucket_name=incoming_bucket, prefix=peer_id)
-    bucket_items = [
-        item
-        for item in bucket_items
-        if _satisfies_start_and_end_range(item=item, start_timestamp=start_timestamp, end_timestamp=end_timestamp)
-    ]
-
-    responses = list()
-    for item in bucket_items:
-        object_key = item.key
-        responses += attempt_categorisation_and_transformation(
+    bucket_items = ListingIndex.from_bucket_items(
+        iter_bucket_sharded(client=s3_client, bucket_name=incoming_bucket, prefix=peer_id)
+    ).modified_between(start=start_timestamp, end=end_timestamp)
+
+    transformation_slots = threading.BoundedSemaphore(transform_concurrency)
+
+    def categorize(item: BucketItem) -> List[Dict[str, Any]]:
+        return attempt_categorisation_and_transformation(
             s3_client=s3_client,
             peer_configured_categories=configured_categories,
             bucket=incoming_bucket,
-            object_key=object_key,
+            object_key=item.key,
+            transformation_slots=transformation_slots,
         )
 
+    # objects are categorized concurrently, most of them by copying, while only a few of them are transformed at a
+    # time since transformations hold whole files in memory, responses keep the order of the listing. Objects are
+    # taken from the index as categorizations complete, so only those in flight are held as `BucketItem`s.
+    responses: List[Dict[str, Any]] = []
+    in_flight: Deque[Future] = deque()
+    with ThreadPoolExecutor(max_workers=copy_concurrency) as executor:
+        for item in bucket_items:
+            if len(in_flight) >= copy_concurrency:
+                responses.extend(in_flight.popleft().result())
+            in_flight.append(executor.submit(categorize, item))
+        for future in in_flight:
+            responses.extend(future.result())
+
     return {"categorized": responses}
+
+
+def _on_rebuild_pull_manifest_request(s3_client: S3Client, rebuild: RebuildPullManifest) -> Dict[str, Any]:
+    peer_id = rebuild.peer_id
+
+    logger.info(f"Rebuilding pull manifest for {peer_id}")
+
+    upload_bucket = os.environ["BUCKET_NAME_UPLOAD"]
+    pull_state_bucket = os.environ["BUCKET_NAME_PULL_STATE"]
+
+    manifest = rebuild_pull_manifest(client=s3_client, upload_bucket_name=upload_bucket, peer_id=peer_id)
+    existing = load_pull_manifest(client=s3_client, bucket_name=pull_state_bucket, peer_id=peer_id)
+    if existing:
+        # replace exactly the version we have seen, a concurrent pull will then merge its files into the rebuild
+        manifest.etag = existing.etag
+        manifest.added = dict(manifest.files)
+
+    save_pull_manifest(client=s3_client, bucket_name=pull_state_bucket, manifest=manifest)
+    return {"rebuilt": {"peer_id": peer_id, "files": len(manifest.files)}}
@@ -4,10 +4,11 @@ from typing import Literal
 from admin_tasks.entities.backfill_categories import BackfillCategories
 from admin_tasks.entities.backfill_incoming import BackfillIncoming
 from admin_tasks.entities.backfill_api_wise import BackfillApiWise
+from admin_tasks.entities.rebuild_pull_manifest import RebuildPullManifest
 from dataclasses_json import DataClassJsonMixin
 
 
 @dataclass
 class AdminTask(DataClassJsonMixin):
-    name: Literal["backfill_categories", "backfill_incoming"]
-    task: BackfillCategories | BackfillIncoming | BackfillApiWise
+    name: Literal["backfill_categories", "backfill_incoming", "rebuild_pull_manifest"]
+    task: BackfillCategories | BackfillIncoming | BackfillApiWise | RebuildPullManifest
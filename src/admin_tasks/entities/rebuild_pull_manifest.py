@@ -0,0 +1,8 @@
+from dataclasses import dataclass
+
+from dataclasses_json import DataClassJsonMixin
+
+
+@dataclass
+class RebuildPullManifest(DataClassJsonMixin):
+    peer_id: str
@@ -4,6 +4,7 @@ from datetime import datetime
 from typing import Callable
 
 import boto3
+from botocore.client import BaseClient
 from mypy_boto3_s3 import S3Client
 from mypy_boto3_secretsmanager import SecretsManagerClient
 from mypy_boto3_ssm import SSMClient
@@ -26,6 +27,10 @@ def get_secretsmanager_client() -> SecretsManagerClient:
     return boto3.client("secretsmanager")
 
 
+def get_lambda_client() -> BaseClient:
+    return boto3.client("lambda")
+
+
 def get_metric_client(ssm_client: SSMClient, current_datetime: Callable[[], datetime]) -> MetricClient:
     # todo: how to handle metrics
     return LocalMetricClient()
@@ -1,50 +1,97 @@
+import json
 import logging
 import os
 import typing
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Any, Callable, Dict, List, Optional
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 
 from aws_lambda_typing.context import Context
 from botocore.client import BaseClient
+from botocore.exceptions import ClientError
 from dataclasses_json import DataClassJsonMixin
 from paramiko import MissingHostKeyPolicy
 
-from clients import get_metric_client, get_s3_client, get_ssm_client
+from clients import get_lambda_client, get_metric_client, get_s3_client, get_ssm_client
 from entities.context_under_test import ContextUnderTest
+from pull.entities.sftp_pull_batch_event import SftpPullBatchEvent
 from pull.entities.sftp_pull_event import SftpPullEvent
 from utils.common import peer_secret_id
 from utils.config import fetch_peers_config
+from utils.deadline import DEADLINE_DEFAULT_SAFETY_MARGIN_SECONDS, Deadline
 from utils.logs import redacted_ssh_private_key
-from utils.metrics import metric_lambda_pull
-from utils.s3 import BucketItem, list_bucket, upload_file
+from utils.metrics import MetricClient, metric_lambda_pull
+from utils.pull_continuation import PULL_MAX_CONTINUATIONS, load_pull_continuation, save_pull_continuation
+from utils.pull_listing_cache import PullListingCache, load_pull_listing_cache, save_pull_listing_cache
+from utils.pull_lock import PullLease, PullLockSettings, acquire_pull_lock
+from utils.pull_manifest import (
+    PullManifest,
+    load_pull_manifest,
+    pull_manifest_from_bucket_items,
+    rebuild_pull_manifest,
+    save_pull_manifest,
+)
+from utils.pull_schedule import (
+    AdaptiveScheduleSettings,
+    PullArrivals,
+    load_pull_arrivals,
+    poll_decision,
+    save_pull_arrivals,
+)
+from utils.s3 import (
+    MULTIPART_UPLOAD_MIN_PART_SIZE,
+    BucketItem,
+    iter_bucket,
+    upload_appended_stream,
+    upload_parts,
+    upload_stream,
+)
 from utils.secrets import fetch_secret
 from utils.sftp import (
     FingerprintEnforcingPolicy,
     FingerprintVerificationPolicy,
+    SftpAfterDownloadSettings,
+    SftpDownloadOrder,
+    SftpDownloadOutcome,
     SftpFileItem,
+    SftpReadSettings,
+    SftpRetrySettings,
+    SftpStripe,
+    SftpStripeSettings,
+    SftpTransportSettings,
+    SftpWalkSettings,
     assemble_object_key,
     download_new_files,
     is_useable_private_key,
+    path_matcher,
+    sftp_transport_settings,
 )
 
 logger = logging.getLogger()
 logger.setLevel(os.environ.get("LOG_LEVEL", "INFO"))
 logging.getLogger("paramiko").setLevel(logging.WARNING)
 
+# number of peers pulled concurrently by a batch, unless configured otherwise
+PULL_BATCH_DEFAULT_CONCURRENCY = 4
+
 
 @dataclass
 class PullTestContext(DataClassJsonMixin):
     context_under_test: ContextUnderTest
     fingerprint_verification_policy: Optional[FingerprintVerificationPolicy] = field(default=None)
+    lambda_client: Optional[BaseClient] = field(default=None)
 
 
 def handler(
     cloudwatch_event: Dict[str, Any], context: Context, pull_test_context: Optional[PullTestContext] = None
 ) -> Dict[str, Any]:
     """Using the specified `cloudwatch_event`, this function connects to an SFTP, identifies new files and downloads
-    them into an S3 bucket.
+    them into an S3 bucket. Downloads that are not expected to complete before the Lambda times out are not started,
+    instead the pull continues in a new invocation. A pull started while another pull of the same peer is still running
+    is skipped, as are scheduled pulls at times no new files are expected (see `poll_decision`). Events carrying
+    `ids` (see `SftpPullBatchEvent`) pull multiple peers concurrently.
 
     Args:
         cloudwatch_event (Dict[str, Any]): event payload from AWS Eventbridge
@@ -58,16 +105,117 @@ def handler(
 
     test_context = getattr(pull_test_context, "context_under_test", None)
     ssm_client = getattr(test_context, "ssm_client", None) or get_ssm_client()
+    s3_client = getattr(test_context, "s3_client", None) or get_s3_client()
     current_datetime = getattr(test_context, "current_datetime", None) or (lambda: datetime.now())
     metric_client = getattr(test_context, "metric_client", None) or get_metric_client(
         ssm_client=ssm_client, current_datetime=current_datetime
     )
 
+    def pull_peer(event: Dict[str, Any], config: Optional[List[Dict[str, Any]]]) -> Dict[str, Any]:
+        return _pull_peer(
+            cloudwatch_event=event,
+            context=context,
+            pull_test_context=pull_test_context,
+            ssm_client=ssm_client,
+            s3_client=s3_client,
+            metric_client=metric_client,
+            current_datetime=current_datetime,
+            config=config,
+        )
+
+    if "ids" in cloudwatch_event:
+        return _pull_batch(
+            cloudwatch_event=cloudwatch_event, context=context, pull_test_context=pull_test_context, pull_peer=pull_peer
+        )
+    return pull_peer(cloudwatch_event, None)
+
+
+def _pull_batch(
+    cloudwatch_event: Dict[str, Any],
+    context: Context,
+    pull_test_context: Optional[PullTestContext],
+    pull_peer: Callable[[Dict[str, Any], Optional[List[Dict[str, Any]]]], Dict[str, Any]],
+) -> Dict[str, Any]:
+    """Pulls the peers listed in the given `SftpPullBatchEvent` concurrently, sharing clients and configuration.
+    A failing peer does not affect the others. Peers are only started while the Lambda has more than the deadline's
+    safety margin left, the remaining peers are deferred to a new invocation.
+
+    Args:
+        cloudwatch_event (Dict[str, Any]): event payload from AWS Eventbridge
+        context (Context): contains AWS Lambda runtime information
+        pull_test_context (Optional[PullTestContext]): used in testing for dependency injection
+        pull_peer (Callable[[Dict[str, Any], Optional[List[Dict[str, Any]]]], Dict[str, Any]]): pulls a single peer
+            given its `SftpPullEvent` and the peers config
+
+    Returns:
+        Dict[str, Any]: summary of the pull of every peer
+    """
+    try:
+        batch = SftpPullBatchEvent.from_dict(cloudwatch_event)
+        config = fetch_peers_config()
+    except (KeyError, ValueError) as e:
+        logger.exception("Lambda (pull) failed to start batch.")
+        return {"statusCode": 500, "headers": {}, "body": {"message": str(e)}}
+
+    peer_ids = batch.ids or [p["id"] for p in config if p.get("method") == "pull"]
+    concurrency = batch.concurrency or int(os.environ.get("PULL_BATCH_CONCURRENCY", PULL_BATCH_DEFAULT_CONCURRENCY))
+    logger.info(f"Pulling {len(peer_ids)} peer(s) using up to {concurrency} concurrent pull(s) ...")
+
+    def pull_in_time(peer_id: str) -> Optional[Dict[str, Any]]:
+        """Pulls the peer unless the Lambda is about to time out, in which case None is returned"""
+        remaining_millis = _remaining_time_in_millis(context=context)
+        if remaining_millis is not None and remaining_millis / 1000 <= DEADLINE_DEFAULT_SAFETY_MARGIN_SECONDS:
+            return None
+        return pull_peer(SftpPullEvent(id=peer_id).to_dict(), config)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(peer_ids)))) as executor:
+        responses = dict(zip(peer_ids, executor.map(pull_in_time, peer_ids)))
+
+    peers = {peer_id: {"statusCode": r["statusCode"], **r["body"]} for peer_id, r in responses.items() if r}
+    failed = [peer_id for peer_id, r in responses.items() if r and r["statusCode"] != 200]
+    deferred = [peer_id for peer_id, r in responses.items() if r is None]
+    if failed:
+        logger.warning(f"Pulling {len(failed)} of {len(peer_ids)} peer(s) failed: {failed}")
+
+    body: Dict[str, Any] = {
+        "peers": peers,
+        "failed": failed,
+    }
+    if deferred:
+        lambda_client = getattr(pull_test_context, "lambda_client", None) or get_lambda_client()
+        body["deferred"] = deferred
+        body["continuation"] = _continue_batch(
+            lambda_client=lambda_client, context=context, batch=batch, deferred_ids=deferred
+        )
+
+    return {
+        "statusCode": 500 if failed else 200,
+        "headers": {},
+        "body": body,
+    }
+
+
+def _pull_peer(
+    cloudwatch_event: Dict[str, Any],
+    context: Context,
+    pull_test_context: Optional[PullTestContext],
+    ssm_client: BaseClient,
+    s3_client: BaseClient,
+    metric_client: MetricClient,
+    current_datetime: Callable[[], datetime],
+    config: Optional[List[Dict[str, Any]]] = None,
+) -> Dict[str, Any]:
+    """Pulls the peer denoted by the given `SftpPullEvent`, see `handler`. The peers config is fetched unless given.
+
+    Returns:
+        Dict[str, Any]: Summary of the pull
+    """
     peer_id: Optional[str] = None
+    lease: Optional[PullLease] = None
     try:
         event = SftpPullEvent.from_dict(cloudwatch_event)
 
-        config = fetch_peers_config()
+        config = config if config is not None else fetch_peers_config()
         peer = next(iter([p for p in config if p["id"] == event.id]), None)
         if peer is None:
             logger.warning(f"No peer '{event.id}' configured.")
@@ -80,6 +228,22 @@ def handler(
         sftp_port = peer["port"]
         remote_folder = peer.get("folder", "")
         tag_with_timestamp = peer.get("add-timestamp-to-downloaded-files", False)
+        download_concurrency = peer.get("download-concurrency") or 1
+        read_settings = SftpReadSettings.from_dict(_configured_values(peer.get("sftp-read")))
+        download_order: SftpDownloadOrder = peer.get("download-order") or "listing"
+        reuse_connections = peer.get("reuse-connections") or False
+        transport_settings = sftp_transport_settings(config=_configured_values(peer.get("sftp-transport")))
+        walk_settings = SftpWalkSettings.from_dict(_configured_values(peer.get("sftp-walk")))
+        use_listing_cache = peer.get("listing-cache") or False
+        after_download = SftpAfterDownloadSettings.from_dict(_configured_values(peer.get("after-download")))
+        content_dedup = _configured_values(peer.get("content-dedup"))
+        skip_duplicate_content = content_dedup.get("enabled", False)
+        check_remote_content = skip_duplicate_content and content_dedup.get("remote-check", False)
+        is_appending_file = path_matcher(patterns=peer.get("appending-files"))
+        stripe_settings = SftpStripeSettings.from_dict(_configured_values(peer.get("sftp-stripes")))
+        retry_settings = SftpRetrySettings.from_dict(_configured_values(peer.get("sftp-retry")))
+        lock_settings = PullLockSettings.from_dict(_configured_values(peer.get("pull-lock")))
+        schedule_settings = AdaptiveScheduleSettings.from_dict(_configured_values(peer.get("adaptive-schedule")))
         fingerprints = peer.get("host-sha256-fingerprints", [])
         if not fingerprints:
             logger.warning(
@@ -89,19 +253,57 @@ def handler(
                 f"for production deployments."
             )
 
-        s3_client = getattr(test_context, "s3_client", None) or get_s3_client()
         fingerprint_verification_policy = getattr(
             pull_test_context, "fingerprint_verification_policy", None
         ) or FingerprintEnforcingPolicy(peer_id=peer_id, allowed_fingerprints=fingerprints)
 
         metric_client.rate(metric_name=metric_lambda_pull, value=1, tags={"peer": event.id})
 
-        # get all previously downloaded files for this peer from the "upload" bucket
         upload_bucket = os.environ["BUCKET_NAME_UPLOAD"]
-        previously_downloaded_items = _list_previously_downloaded_items(
-            s3_client=s3_client, peer_id=peer_id, bucket_name=upload_bucket
-        )
-        previously_imported_file_names = {os.path.basename(f.key): f for f in previously_downloaded_items}
+        pull_state_bucket = os.environ.get("BUCKET_NAME_PULL_STATE")
+        arrivals: Optional[PullArrivals] = None
+        polled_at = 0.0
+        if pull_state_bucket and schedule_settings.enabled and not event.continuations:
+            # continuations always go ahead, they pull files found by the poll they continue
+            polled_at = current_datetime().timestamp()
+            arrivals = load_pull_arrivals(client=s3_client, bucket_name=pull_state_bucket, peer_id=peer_id)
+            poll, reason = poll_decision(arrivals=arrivals, settings=schedule_settings, now=polled_at)
+            if not poll:
+                logger.info(f"Skipping poll of {peer_id}, no new files are expected at this time.")
+                return {
+                    "statusCode": 200,
+                    "headers": {},
+                    "body": {"skipped": "off-schedule"},
+                }
+            logger.info(f"Polling {peer_id} ({reason}).")
+
+        if pull_state_bucket and lock_settings.enabled:
+            lease = acquire_pull_lock(
+                client=s3_client,
+                bucket_name=pull_state_bucket,
+                peer_id=peer_id,
+                owner=getattr(context, "aws_request_id", None) or str(uuid.uuid4()),
+                ttl_seconds=lock_settings.ttl_seconds,
+            )
+            if lease is None:
+                return {
+                    "statusCode": 200,
+                    "headers": {},
+                    "body": {"skipped": "locked"},
+                }
+            lease.start_heartbeat()
+
+        if pull_state_bucket:
+            manifest = _load_pull_manifest(
+                s3_client=s3_client, peer_id=peer_id, bucket_name=pull_state_bucket, upload_bucket_name=upload_bucket
+            )
+        else:
+            # without a pull state bucket, index all previously downloaded files for this peer in the "upload" bucket
+            previously_downloaded_items = _list_previously_downloaded_items(
+                s3_client=s3_client, peer_id=peer_id, bucket_name=upload_bucket
+            )
+            manifest = pull_manifest_from_bucket_items(peer_id=peer_id, items=previously_downloaded_items)
+            logger.info(f"Found {len(manifest.files)} previously pulled file(s) in {upload_bucket}.")
 
         # fetch private key from secretsmanager
         secret_id = peer_secret_id(peer_id=event.id)
@@ -112,12 +314,29 @@ def handler(
                 f"You must enter a valid private key into the Secrets Manager secret: {secret_id}. Skipping attempt."
             )
 
+        remaining_items: Optional[List[SftpFileItem]] = None
+        if event.continuation and pull_state_bucket:
+            remaining_items = load_pull_continuation(
+                client=s3_client, bucket_name=pull_state_bucket, peer_id=peer_id, token=event.continuation
+            )
+
+        listing_cache: Optional[PullListingCache] = None
+        if use_listing_cache and pull_state_bucket and remaining_items is None:
+            listing_cache = load_pull_listing_cache(client=s3_client, bucket_name=pull_state_bucket, peer_id=peer_id)
+
+        deadline = Deadline(remaining_millis=lambda: _remaining_time_in_millis(context=context))
+        deferred_items: List[SftpFileItem] = []
+        after_download_failed_items: List[SftpFileItem] = []
+        duplicate_items: List[SftpFileItem] = []
+        appending_to: Dict[str, Tuple[BucketItem, int]] = {}
+        retried_items: Dict[str, int] = {}
+        failed_items: List[SftpFileItem] = []
+
         def is_new_file(sftp_item: SftpFileItem) -> bool:
             """Callback to check if SFTP file shall be downloaded"""
-            return sftp_item.filename not in previously_imported_file_names
+            return not manifest.contains(sftp_file_item=sftp_item)
 
-        def send_to_upload_bucket(sftp_file_item: SftpFileItem, file_content: typing.BinaryIO) -> None:
-            """Uploads the file into S3"""
+        def object_key_of(sftp_file_item: SftpFileItem) -> str:
             object_key = assemble_object_key(
                 peer_id=peer_id,
                 timestamp_tagging=tag_with_timestamp,
@@ -125,25 +344,187 @@ def handler(
                 sftp_file_item=sftp_file_item,
             )
             logger.debug(f"Using the following S3 object key: {object_key}")
-            upload_file(client=s3_client, bucket_name=upload_bucket, key=object_key, data=file_content)
-
-        downloaded_files = _download_new_sftp_files(
-            sftp_user=sftp_user,
-            sftp_host=sftp_host,
-            sftp_port=sftp_port,
-            ssh_private_key=ssh_private_key,
-            remote_folder=remote_folder,
-            download_eligable=is_new_file,
-            download_handler=send_to_upload_bucket,
-            missing_host_key_policy=fingerprint_verification_policy,
-        )
+            return object_key
+
+        def send_to_upload_bucket(sftp_file_item: SftpFileItem, file_content: typing.BinaryIO) -> None:
+            """Streams the file into S3"""
+            object_key = object_key_of(sftp_file_item)
+            previous = appending_to.pop(sftp_file_item.convert_to_object_key(), None)
+            if previous:
+                previous_object, previous_size = previous
+                stored = upload_appended_stream(
+                    client=s3_client,
+                    bucket_name=upload_bucket,
+                    key=object_key,
+                    previous=previous_object,
+                    previous_size=previous_size,
+                    data=file_content,
+                )
+            else:
+                stored = upload_stream(
+                    client=s3_client,
+                    bucket_name=upload_bucket,
+                    key=object_key,
+                    data=file_content,
+                    metadata=lambda: {"sha256": sftp_file_item.sha256} if sftp_file_item.sha256 else {},
+                    should_store=(lambda: not is_duplicate(sftp_file_item)) if skip_duplicate_content else None,
+                )
+            if stored is None:
+                duplicate_items.append(sftp_file_item)
+            manifest.add(sftp_file_item=sftp_file_item, stored=stored if is_appending(sftp_file_item) else None)
+            deadline.record_transfer(size=(sftp_file_item.size or 0) - (previous[1] if previous else 0))
+
+        def send_stripes_to_upload_bucket(sftp_file_item: SftpFileItem, stripes: typing.Iterator[SftpStripe]) -> None:
+            """Uploads the stripes of a large file into S3 as the parts of a multipart upload"""
+            stored = upload_parts(
+                client=s3_client,
+                bucket_name=upload_bucket,
+                key=object_key_of(sftp_file_item),
+                parts=((stripe.index + 1, stripe.data, stripe.sha256) for stripe in stripes),
+                max_in_flight_parts=stripe_settings.connections,
+            )
+            manifest.add(sftp_file_item=sftp_file_item, stored=stored if is_appending(sftp_file_item) else None)
+            deadline.record_transfer(size=sftp_file_item.size)
+
+        def is_appending(sftp_file_item: SftpFileItem) -> bool:
+            """Callback to check if a file only ever grows by appending to it"""
+            return bool(is_appending_file and is_appending_file(sftp_file_item.convert_to_object_key()))
+
+        def appended_offset(sftp_file_item: SftpFileItem) -> int:
+            """Callback returning the number of leading bytes of a growing file which are stored in S3 already"""
+            previous = manifest.stored_version(sftp_file_item=sftp_file_item)
+            if not previous or not _is_appendable(
+                s3_client=s3_client,
+                bucket_name=upload_bucket,
+                previous=previous[0],
+                previous_size=previous[1],
+                size=sftp_file_item.size,
+            ):
+                return 0
+            appending_to[sftp_file_item.convert_to_object_key()] = previous
+            return previous[1]
+
+        def is_duplicate(sftp_file_item: SftpFileItem) -> bool:
+            """Callback to check if the content of a file has been pulled before"""
+            if not manifest.contains_content(sha256=sftp_file_item.sha256):
+                return False
+            logger.info(
+                f"Skipping {sftp_file_item.location}, its content has been pulled before from "
+                f"{manifest.contents[str(sftp_file_item.sha256)]}."
+            )
+            return True
+
+        def skip_known_content(sftp_file_item: SftpFileItem) -> bool:
+            """Callback to skip downloading files whose content has been pulled before"""
+            if not is_duplicate(sftp_file_item):
+                return False
+            duplicate_items.append(sftp_file_item)
+            manifest.add(sftp_file_item=sftp_file_item)
+            return True
+
+        def record_outcome(sftp_file_item: SftpFileItem, outcome: SftpDownloadOutcome, retries: int) -> None:
+            """Callback collecting files which needed retries or failed"""
+            if retries:
+                retried_items[sftp_file_item.convert_to_object_key()] = retries
+            if outcome == "failed":
+                failed_items.append(sftp_file_item)
+            if outcome in ("failed", "skipped"):
+                # downloads which were started but did not complete no longer share the throughput
+                deadline.record_incomplete()
+
+        def has_time_for(sftp_file_item: SftpFileItem) -> bool:
+            """Callback to check if the download can complete before the Lambda times out"""
+            if lease and lease.lost:
+                # another pull took over, it will pull the remaining files
+                return False
+            if deadline.may_start(size=sftp_file_item.size):
+                return True
+            deferred_items.append(sftp_file_item)
+            return False
+
+        manifest_saved = False
+
+        def save_manifest(_: List[SftpFileItem]) -> None:
+            """Callback recording the pulled files before remote files are archived or deleted, which may run out of
+            time"""
+            nonlocal manifest, manifest_saved
+            if pull_state_bucket and (manifest.added or not manifest.etag):
+                manifest = save_pull_manifest(client=s3_client, bucket_name=pull_state_bucket, manifest=manifest)
+            manifest_saved = True
+
+        try:
+            downloaded_files = _download_new_sftp_files(
+                sftp_user=sftp_user,
+                sftp_host=sftp_host,
+                sftp_port=sftp_port,
+                ssh_private_key=ssh_private_key,
+                remote_folder=remote_folder,
+                download_eligable=is_new_file,
+                download_handler=send_to_upload_bucket,
+                missing_host_key_policy=fingerprint_verification_policy,
+                concurrency=download_concurrency,
+                read_settings=read_settings,
+                download_order=download_order,
+                may_start_download=has_time_for,
+                sftp_file_items=remaining_items,
+                reuse_connection=reuse_connections,
+                transport_settings=transport_settings,
+                walk_settings=walk_settings,
+                listing_cache=listing_cache,
+                after_download=after_download,
+                after_download_failed=after_download_failed_items.append,
+                skip_known_content=skip_known_content if check_remote_content else None,
+                resume_offset=appended_offset if is_appending_file else None,
+                stripe_settings=stripe_settings,
+                striped_download_handler=send_stripes_to_upload_bucket,
+                retry_settings=retry_settings,
+                download_outcome=record_outcome,
+                downloads_stored=save_manifest if pull_state_bucket else None,
+                may_apply_after_download=deadline.has_time_left,
+                may_continue_walk=deadline.has_time_left,
+            )
+        finally:
+            # also record files that have been uploaded before a failure, so they won't be pulled again
+            if pull_state_bucket and not manifest_saved and (manifest.added or not manifest.etag):
+                save_pull_manifest(client=s3_client, bucket_name=pull_state_bucket, manifest=manifest)
+
+        if listing_cache and pull_state_bucket:
+            save_pull_listing_cache(client=s3_client, bucket_name=pull_state_bucket, cache=listing_cache)
+
+        if arrivals and pull_state_bucket:
+            arrivals.record(polled_at=polled_at, modified=[f.last_modified for f in downloaded_files])
+            save_pull_arrivals(client=s3_client, bucket_name=pull_state_bucket, arrivals=arrivals)
+
+        duplicates = {f.convert_to_object_key() for f in duplicate_items}
+        body: Dict[str, Any] = {
+            "imported": [key for key in (f.convert_to_object_key() for f in downloaded_files) if key not in duplicates]
+        }
+        if duplicates:
+            body["duplicates"] = sorted(duplicates)
+        if retried_items:
+            body["retried"] = dict(sorted(retried_items.items()))
+        if failed_items:
+            body["download-failed"] = sorted(f.convert_to_object_key() for f in failed_items)
+        if after_download_failed_items:
+            body["after-download-failed"] = [f.convert_to_object_key() for f in after_download_failed_items]
+        if lease:
+            # before continuing, the continuing pull must be able to acquire the lock
+            lease.release()
+        if deferred_items:
+            lambda_client = getattr(pull_test_context, "lambda_client", None) or get_lambda_client()
+            body["continuation"] = _continue_pull(
+                lambda_client=lambda_client,
+                s3_client=s3_client,
+                context=context,
+                event=event,
+                pull_state_bucket=pull_state_bucket,
+                remaining_items=deferred_items,
+            )
 
         return {
             "statusCode": 200,
             "headers": {},
-            "body": {
-                "imported": [f.convert_to_object_key() for f in downloaded_files],
-            },
+            "body": body,
         }
     except Exception as e:
         metric_client.lambda_error(
@@ -160,6 +541,9 @@ def handler(
                 "message": str(e),
             },
         }
+    finally:
+        if lease:
+            lease.release()
 
 
 def _download_new_sftp_files(
@@ -171,6 +555,26 @@ def _download_new_sftp_files(
     download_eligable: Callable[[SftpFileItem], bool],
     download_handler: Callable[[SftpFileItem, typing.BinaryIO], None],
     missing_host_key_policy: Optional[MissingHostKeyPolicy] = None,
+    concurrency: int = 1,
+    read_settings: Optional[SftpReadSettings] = None,
+    download_order: SftpDownloadOrder = "listing",
+    may_start_download: Optional[Callable[[SftpFileItem], bool]] = None,
+    sftp_file_items: Optional[List[SftpFileItem]] = None,
+    reuse_connection: bool = False,
+    transport_settings: Optional[SftpTransportSettings] = None,
+    walk_settings: Optional[SftpWalkSettings] = None,
+    listing_cache: Optional[PullListingCache] = None,
+    after_download: Optional[SftpAfterDownloadSettings] = None,
+    after_download_failed: Optional[Callable[[SftpFileItem], None]] = None,
+    skip_known_content: Optional[Callable[[SftpFileItem], bool]] = None,
+    resume_offset: Optional[Callable[[SftpFileItem], int]] = None,
+    stripe_settings: Optional[SftpStripeSettings] = None,
+    striped_download_handler: Optional[Callable[[SftpFileItem, typing.Iterator[SftpStripe]], None]] = None,
+    retry_settings: Optional[SftpRetrySettings] = None,
+    download_outcome: Optional[Callable[[SftpFileItem, SftpDownloadOutcome, int], None]] = None,
+    downloads_stored: Optional[Callable[[List[SftpFileItem]], None]] = None,
+    may_apply_after_download: Optional[Callable[[], bool]] = None,
+    may_continue_walk: Optional[Callable[[], bool]] = None,
 ) -> List[SftpFileItem]:
     return download_new_files(
         sftp_user=sftp_user,
@@ -181,11 +585,187 @@ def _download_new_sftp_files(
         download_eligable=download_eligable,
         download_handler=download_handler,
         missing_host_key_policy=missing_host_key_policy,
+        concurrency=concurrency,
+        read_settings=read_settings,
+        download_order=download_order,
+        may_start_download=may_start_download,
+        sftp_file_items=sftp_file_items,
+        reuse_connection=reuse_connection,
+        transport_settings=transport_settings,
+        walk_settings=walk_settings,
+        listing_cache=listing_cache,
+        after_download=after_download,
+        after_download_failed=after_download_failed,
+        skip_known_content=skip_known_content,
+        resume_offset=resume_offset,
+        stripe_settings=stripe_settings,
+        striped_download_handler=striped_download_handler,
+        retry_settings=retry_settings,
+        download_outcome=download_outcome,
+        downloads_stored=downloads_stored,
+        may_apply_after_download=may_apply_after_download,
+        may_continue_walk=may_continue_walk,
     )
 
 
-def _list_previously_downloaded_items(s3_client: BaseClient, peer_id: str, bucket_name: str) -> List[BucketItem]:
-    """Returns a list of `BucketItem`s found in the specified S3 bucket for the specified peer.
+def _is_appendable(
+    s3_client: BaseClient, bucket_name: str, previous: BucketItem, previous_size: int, size: Optional[int]
+) -> bool:
+    """Returns True if a file of `size` bytes can be stored by appending to its previous version, i.e. it grew and
+    the previous version is still stored unmodified and large enough to be copied as a part of a multipart upload.
+
+    Args:
+        s3_client (BaseClient): a S3 client
+        bucket_name (str): the name of the upload bucket
+        previous (BucketItem): the object the previous version has been stored as, including its ETag
+        previous_size (int): the size of the previous version
+        size (Optional[int]): the current size of the file
+
+    Returns:
+        bool: True if only the bytes following `previous_size` need to be read
+    """
+    if not previous.etag or size is None or size <= previous_size or previous_size < MULTIPART_UPLOAD_MIN_PART_SIZE:
+        return False
+    try:
+        response = s3_client.head_object(Bucket=bucket_name, Key=previous.key, IfMatch=previous.etag)
+    except ClientError as e:
+        logger.info(
+            "Not appending to s3://%s/%s: %s"
+            % (bucket_name, previous.key, e.response.get("Error", {}).get("Message", "unavailable"))
+        )
+        return False
+    return response.get("ContentLength") == previous_size
+
+
+def _remaining_time_in_millis(context: Context) -> Optional[int]:
+    """Returns the time left before the Lambda times out or None if unknown, e.g. when invoked outside of Lambda."""
+    get_remaining_time_in_millis = getattr(context, "get_remaining_time_in_millis", None)
+    return get_remaining_time_in_millis() if get_remaining_time_in_millis else None
+
+
+def _continue_pull(
+    lambda_client: BaseClient,
+    s3_client: BaseClient,
+    context: Context,
+    event: SftpPullEvent,
+    pull_state_bucket: Optional[str],
+    remaining_items: List[SftpFileItem],
+) -> Dict[str, Any]:
+    """Invokes this Lambda asynchronously to pull the files that did not fit into the current invocation. With a pull
+    state bucket, the remaining files are stored as a continuation, sparing the next invocation the remote walk.
+
+    Args:
+        lambda_client (BaseClient): a Lambda client
+        s3_client (BaseClient): a S3 client
+        context (Context): contains AWS Lambda runtime information
+        event (SftpPullEvent): the event of the current invocation
+        pull_state_bucket (Optional[str]): the name of the pull state bucket, if any
+        remaining_items (List[SftpFileItem]): the files that have not been pulled due to the deadline
+
+    Returns:
+        Dict[str, Any]: summary of the continuation, its token is None if the pull has not been continued
+    """
+    summary: Dict[str, Any] = {"token": None, "remaining": len(remaining_items)}
+    function_name = getattr(context, "invoked_function_arn", None) or os.environ.get("AWS_LAMBDA_FUNCTION_NAME")
+    if event.continuations >= PULL_MAX_CONTINUATIONS or not function_name:
+        logger.error(
+            f"Not continuing pull of {event.id} after {event.continuations} continuation(s), "
+            f"{len(remaining_items)} file(s) remain for the next scheduled pull."
+        )
+        return summary
+
+    token = str(uuid.uuid4())
+    if pull_state_bucket:
+        save_pull_continuation(
+            client=s3_client,
+            bucket_name=pull_state_bucket,
+            peer_id=event.id,
+            token=token,
+            sftp_file_items=remaining_items,
+        )
+
+    continuation = SftpPullEvent(
+        id=event.id, continuation=token if pull_state_bucket else None, continuations=event.continuations + 1
+    )
+    try:
+        lambda_client.invoke(
+            FunctionName=function_name, InvocationType="Event", Payload=json.dumps(continuation.to_dict())
+        )
+    except ClientError as e:
+        logger.exception("Unable to continue pull: %s" % (e.response.get("Error", {}).get("Message")))
+        return summary
+
+    logger.info(f"Continuing pull of {event.id} with {len(remaining_items)} remaining file(s) ({token}).")
+    summary["token"] = token
+    return summary
+
+
+def _continue_batch(
+    lambda_client: BaseClient, context: Context, batch: SftpPullBatchEvent, deferred_ids: List[str]
+) -> Dict[str, Any]:
+    """Invokes this Lambda asynchronously to pull the peers of a batch that have not been started in time.
+
+    Args:
+        lambda_client (BaseClient): a Lambda client
+        context (Context): contains AWS Lambda runtime information
+        batch (SftpPullBatchEvent): the event of the current invocation
+        deferred_ids (List[str]): the peers that have not been pulled due to the deadline
+
+    Returns:
+        Dict[str, Any]: summary of the continuation, `continued` is False if the batch has not been continued
+    """
+    summary: Dict[str, Any] = {"continued": False, "remaining": len(deferred_ids)}
+    function_name = getattr(context, "invoked_function_arn", None) or os.environ.get("AWS_LAMBDA_FUNCTION_NAME")
+    if batch.continuations >= PULL_MAX_CONTINUATIONS or not function_name:
+        logger.error(
+            f"Not continuing batch after {batch.continuations} continuation(s), "
+            f"{len(deferred_ids)} peer(s) remain for the next scheduled pull: {deferred_ids}"
+        )
+        return summary
+
+    continuation = SftpPullBatchEvent(
+        ids=deferred_ids, concurrency=batch.concurrency, continuations=batch.continuations + 1
+    )
+    try:
+        lambda_client.invoke(
+            FunctionName=function_name, InvocationType="Event", Payload=json.dumps(continuation.to_dict())
+        )
+    except ClientError as e:
+        logger.exception("Unable to continue batch: %s" % (e.response.get("Error", {}).get("Message")))
+        return summary
+
+    logger.info(f"Continuing batch with {len(deferred_ids)} deferred peer(s): {deferred_ids}")
+    summary["continued"] = True
+    return summary
+
+
+def _configured_values(settings: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Returns the given peer settings without unset values. Terraform renders optional attributes that have not
+    been configured as null, in which case our defaults shall apply."""
+    return {key: value for key, value in (settings or {}).items() if value is not None}
+
+
+def _load_pull_manifest(s3_client: BaseClient, peer_id: str, bucket_name: str, upload_bucket_name: str) -> PullManifest:
+    """Returns the pull manifest of the specified peer. If the peer does not have a manifest yet, it will be
+    bootstrapped from the files found in the upload bucket.
+
+    Args:
+        s3_client (BaseClient): a S3 client
+        peer_id (str): the peer to load the manifest for
+        bucket_name (str): the name of the pull state bucket
+        upload_bucket_name (str): the name of the upload bucket
+
+    Returns:
+        PullManifest: the peer's manifest
+    """
+    manifest = load_pull_manifest(client=s3_client, bucket_name=bucket_name, peer_id=peer_id)
+    if manifest is None:
+        manifest = rebuild_pull_manifest(client=s3_client, upload_bucket_name=upload_bucket_name, peer_id=peer_id)
+    return manifest
+
+
+def _list_previously_downloaded_items(s3_client: BaseClient, peer_id: str, bucket_name: str) -> Iterator[BucketItem]:
+    """Yields the `BucketItem`s found in the specified S3 bucket for the specified peer, page by page.
 
     Args:
         s3_client (BaseClient): a S3 client
@@ -193,8 +773,6 @@ def _list_previously_downloaded_items(s3_client: BaseClient, peer_id: str, bucke
         bucket_name (str): the name of an existing S3 bucket
 
     Returns:
-        List[BucketItem]:
+        Iterator[BucketItem]:
     """
-    items = list_bucket(client=s3_client, bucket_name=bucket_name, prefix=peer_id)
-    logger.info(f"Found {len(items)} previously pulled file(s) in {bucket_name}.")
-    return items
+    return iter_bucket(client=s3_client, bucket_name=bucket_name, prefix=peer_id)
@@ -0,0 +1,14 @@
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from dataclasses_json import DataClassJsonMixin
+
+
+@dataclass
+class SftpPullBatchEvent(DataClassJsonMixin):
+    # peers to pull, all peers using the pull method if not set
+    ids: Optional[List[str]] = field(default=None)
+    # number of peers pulled concurrently, see PULL_BATCH_DEFAULT_CONCURRENCY
+    concurrency: Optional[int] = field(default=None)
+    # set when a batch that ran out of time continues itself, see `pull.app._continue_batch`
+    continuations: int = field(default=0)
@@ -1,4 +1,5 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from typing import Optional
 
 from dataclasses_json import DataClassJsonMixin
 
@@ -6,6 +7,9 @@ from dataclasses_json import DataClassJsonMixin
 @dataclass
 class SftpPullEvent(DataClassJsonMixin):
     id: str
+    # set when a pull that ran out of time continues itself, see `pull.app._continue_pull`
+    continuation: Optional[str] = field(default=None)
+    continuations: int = field(default=0)
 
     def pgp_private_key_secret_id(self: "SftpPullEvent") -> str:
         return f"/aws/reference/secretsmanager/lambda/on_upload/pgp/{self.id}"
@@ -1,6 +1,8 @@
 import logging
 import os
 import re
+import threading
+from contextlib import nullcontext
 from io import BytesIO
 from typing import Any, Dict, List, Optional
 
@@ -36,6 +38,7 @@ def attempt_categorisation_and_transformation(
     bucket: str,
     object_key: str,
     metric_client: Optional[MetricClient] = None,
+    transformation_slots: Optional[threading.Semaphore] = None,
 ) -> List[Dict[str, Any]]:
     """Given a bucket name and an object key, this function attempts to categorise the given file against
     pre-configured set of categories. It also applies any transformations specified in config for the matching
@@ -47,6 +50,8 @@ def attempt_categorisation_and_transformation(
         bucket (str): the name of an S3 bucket
         object_key (str): the key of a file object inside the bucket
         metric_client (Optional[MetricClient]): a client for shipping metrics (optional)
+        transformation_slots (Optional[threading.Semaphore]): limits the number of files held in memory while being
+            transformed by concurrent callers (optional)
 
     Returns:
         List[Dict[str, Any]]: a summary of how the file object was categorised and whether any transformations were
@@ -77,24 +82,25 @@ def attempt_categorisation_and_transformation(
                 if transformations := category.get("transformations", []):
                     logger.info(f"Applying {len(transformations)} transformation(s) to {file_name}.")
 
-                    # get the file contents
-                    file_contents = s3_client.get_object(Bucket=bucket, Key=object_key)
-                    file_contents = file_contents["Body"].read().decode("utf-8")
-
-                    # apply all transformations in the order they're specified in config
-                    transformed_file_contents = file_contents
-                    for file_transformer_cls_name in transformations:
-                        logger.info(f"Trying to apply transformation in: {file_transformer_cls_name}")
-                        transformer = FileTransformer.create_transformer(file_transformer_cls_name)
-                        transformed_file_contents = transformer.transform(csv_content=transformed_file_contents)
-
-                    # write the transformed file to the categorized bucket
-                    upload_file(
-                        client=s3_client,
-                        bucket_name=destination_bucket,
-                        key=destination_key,
-                        data=BytesIO(transformed_file_contents.encode("utf-8")),
-                    )
+                    with transformation_slots or nullcontext():
+                        # get the file contents
+                        file_contents = s3_client.get_object(Bucket=bucket, Key=object_key)
+                        file_contents = file_contents["Body"].read().decode("utf-8")
+
+                        # apply all transformations in the order they're specified in config
+                        transformed_file_contents = file_contents
+                        for file_transformer_cls_name in transformations:
+                            logger.info(f"Trying to apply transformation in: {file_transformer_cls_name}")
+                            transformer = FileTransformer.create_transformer(file_transformer_cls_name)
+                            transformed_file_contents = transformer.transform(csv_content=transformed_file_contents)
+
+                        # write the transformed file to the categorized bucket
+                        upload_file(
+                            client=s3_client,
+                            bucket_name=destination_bucket,
+                            key=destination_key,
+                            data=BytesIO(transformed_file_contents.encode("utf-8")),
+                        )
                     transformations_applied = transformations
 
                 else:
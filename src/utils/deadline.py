@@ -0,0 +1,92 @@
+import logging
+import os
+import threading
+import time
+from typing import Callable, Optional
+
+logger = logging.getLogger()
+logger.setLevel(os.environ.get("LOG_LEVEL", "INFO"))
+
+# time kept in reserve for finishing uploads, storing state and continuing the work elsewhere
+DEADLINE_DEFAULT_SAFETY_MARGIN_SECONDS = 30
+
+# throughput assumed until the first transfer completed, deliberately low so large files are not started blindly
+DEADLINE_DEFAULT_BYTES_PER_SECOND = 1024 * 1024
+
+
+class Deadline:
+    """Tracks the time budget of a Lambda invocation while transferring files and decides whether there is enough time
+    left to start another transfer. The duration of a transfer is estimated from the throughput observed so far,
+    shared by the transfers running concurrently, or from `default_bytes_per_second` before any transfer completed.
+    The first transfer is always allowed to start, so every invocation makes progress. Every transfer allowed to
+    start must end in either `record_transfer` or `record_incomplete`.
+
+    Args:
+        remaining_millis (Callable[[], Optional[int]]): returns the milliseconds left before the invocation times
+            out, e.g. `context.get_remaining_time_in_millis`. If it returns None, there is no deadline.
+        safety_margin_seconds (float, optional): time to keep in reserve. Defaults to
+            DEADLINE_DEFAULT_SAFETY_MARGIN_SECONDS.
+        monotonic (Callable[[], float], optional): clock used to measure throughput. Defaults to time.monotonic.
+        default_bytes_per_second (float, optional): throughput assumed until the first transfer completed. Defaults
+            to DEADLINE_DEFAULT_BYTES_PER_SECOND.
+    """
+
+    def __init__(
+        self: "Deadline",
+        remaining_millis: Callable[[], Optional[int]],
+        safety_margin_seconds: float = DEADLINE_DEFAULT_SAFETY_MARGIN_SECONDS,
+        monotonic: Callable[[], float] = time.monotonic,
+        default_bytes_per_second: float = DEADLINE_DEFAULT_BYTES_PER_SECOND,
+    ) -> None:
+        self.remaining_millis = remaining_millis
+        self.safety_margin_seconds = safety_margin_seconds
+        self.monotonic = monotonic
+        self.default_bytes_per_second = default_bytes_per_second
+        self.started_at = monotonic()
+        self.started = 0
+        self.active = 0
+        self.transferred_bytes = 0
+        self.deferred = 0
+        self.lock = threading.Lock()
+
+    def may_start(self: "Deadline", size: Optional[int]) -> bool:
+        """Returns True if a transfer of `size` bytes is expected to complete before the deadline."""
+        remaining_millis = self.remaining_millis()
+        with self.lock:
+            if remaining_millis is None or self.started == 0:
+                self.started += 1
+                self.active += 1
+                return True
+
+            remaining_seconds = remaining_millis / 1000 - self.safety_margin_seconds
+            elapsed = self.monotonic() - self.started_at
+            if self.transferred_bytes and elapsed > 0:
+                bytes_per_second = self.transferred_bytes / elapsed
+            else:
+                bytes_per_second = self.default_bytes_per_second
+            # the new transfer gets its share of the throughput of the transfers running concurrently
+            estimated_seconds = (size or 0) / (bytes_per_second / (self.active + 1))
+
+            if remaining_seconds > estimated_seconds:
+                self.started += 1
+                self.active += 1
+                return True
+
+            self.deferred += 1
+            return False
+
+    def has_time_left(self: "Deadline") -> bool:
+        """Returns True unless the time left before the deadline is within the safety margin."""
+        remaining_millis = self.remaining_millis()
+        return remaining_millis is None or remaining_millis / 1000 > self.safety_margin_seconds
+
+    def record_transfer(self: "Deadline", size: Optional[int]) -> None:
+        """Records a completed transfer of `size` bytes, improving the estimates of subsequent transfers."""
+        with self.lock:
+            self.transferred_bytes += size or 0
+            self.active = max(0, self.active - 1)
+
+    def record_incomplete(self: "Deadline") -> None:
+        """Records the end of a transfer which did not complete, e.g. because it failed."""
+        with self.lock:
+            self.active = max(0, self.active - 1)
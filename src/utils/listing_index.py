@@ -0,0 +1,165 @@
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Iterator, List, Optional
+
+import numpy as np
+
+from utils.s3 import BucketItem
+
+logger = logging.getLogger()
+logger.setLevel(os.environ.get("LOG_LEVEL", "INFO"))
+
+# items are converted into arrays in batches, so that only a batch of them is held as Python objects at a time
+LISTING_INDEX_BATCH_SIZE = 10000
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+NOT_A_TIME = np.iinfo(np.int64).min
+
+
+class ListingIndex:
+    """A compact, read-only index of the objects in a bucket listing. Keys are held UTF-8 encoded in one sorted byte
+    string array, which orders them the way S3 does, modification times in a `datetime64` array (NaT if unknown).
+    The array pads every key to the longest one, so each object takes up the length of the longest key plus eight
+    bytes, instead of one `BucketItem` with its Python objects. Keys of similar length, as found below a peer's prefix,
+    keep this compact.
+
+    Prefix and key range lookups are binary searches returning views, timestamp filters are vectorized. Iterating
+    the index creates `BucketItem`s one at a time:
+
+        index = ListingIndex.from_bucket_items(iter_bucket(client=s3_client, bucket_name=bucket, prefix="bank1/"))
+        for item in index.with_prefix("bank1/2024/").modified_between(start=start_timestamp, end=None):
+            ...
+    """
+
+    __slots__ = ("keys", "last_modified")
+
+    def __init__(self: "ListingIndex", keys: np.ndarray, last_modified: np.ndarray) -> None:
+        if len(keys) != len(last_modified):
+            raise ValueError("Keys and modification times of a listing index must be of the same length.")
+        self.keys = keys
+        self.last_modified = last_modified
+
+    @staticmethod
+    def from_bucket_items(items: Iterable[BucketItem]) -> "ListingIndex":
+        """Creates an index of the given items, which need not be sorted.
+
+        Args:
+            items (Iterable[BucketItem]): the items to index, consumed once
+
+        Returns:
+            ListingIndex: the index of the items
+        """
+        key_batches: List[np.ndarray] = [np.array([], dtype=np.bytes_)]
+        time_batches: List[np.ndarray] = [np.array([], dtype=np.int64)]
+        keys: List[bytes] = []
+        times: List[int] = []
+
+        def flush() -> None:
+            key_batches.append(np.array(keys, dtype=np.bytes_))
+            time_batches.append(np.array(times, dtype=np.int64))
+            keys.clear()
+            times.clear()
+
+        for item in items:
+            keys.append(item.key.encode("utf-8"))
+            times.append(NOT_A_TIME if item.last_modified is None else _microseconds(item.last_modified))
+            if len(keys) >= LISTING_INDEX_BATCH_SIZE:
+                flush()
+        flush()
+
+        all_keys = np.concatenate(key_batches)
+        all_times = np.concatenate(time_batches).view("datetime64[us]")
+        if len(all_keys) > 1 and not np.all(all_keys[:-1] <= all_keys[1:]):
+            order = np.argsort(all_keys, kind="stable")
+            all_keys, all_times = all_keys[order], all_times[order]
+        logger.info(f"Indexed {len(all_keys)} object(s) using {all_keys.nbytes + all_times.nbytes} bytes.")
+        return ListingIndex(keys=all_keys, last_modified=all_times)
+
+    def __len__(self: "ListingIndex") -> int:
+        return len(self.keys)
+
+    def __iter__(self: "ListingIndex") -> Iterator[BucketItem]:
+        for key, last_modified in zip(self.keys, self.last_modified.astype(np.int64)):
+            yield BucketItem(key=key.decode("utf-8"), last_modified=_datetime(microseconds=int(last_modified)))
+
+    def key_range(self: "ListingIndex", start: Optional[str] = None, end: Optional[str] = None) -> "ListingIndex":
+        """Returns the objects with keys from `start` (inclusive) up to `end` (exclusive), all if None.
+
+        Args:
+            start (Optional[str], optional): the first key to include. Defaults to None.
+            end (Optional[str], optional): the first key not to include anymore. Defaults to None.
+
+        Returns:
+            ListingIndex: a view of this index
+        """
+        lower = 0 if start is None else int(np.searchsorted(self.keys, start.encode("utf-8"), side="left"))
+        upper = len(self.keys) if end is None else int(np.searchsorted(self.keys, end.encode("utf-8"), side="left"))
+        upper = max(lower, upper)
+        return ListingIndex(keys=self.keys[lower:upper], last_modified=self.last_modified[lower:upper])
+
+    def with_prefix(self: "ListingIndex", prefix: str) -> "ListingIndex":
+        """Returns the objects with keys starting with the given prefix.
+
+        Args:
+            prefix (str): the prefix of the keys to include
+
+        Returns:
+            ListingIndex: a view of this index
+        """
+        lower = prefix.encode("utf-8")
+        lower_bound = int(np.searchsorted(self.keys, lower, side="left"))
+        upper = _prefix_successor(prefix=lower)
+        upper_bound = len(self.keys) if upper is None else int(np.searchsorted(self.keys, upper, side="left"))
+        return ListingIndex(
+            keys=self.keys[lower_bound:upper_bound], last_modified=self.last_modified[lower_bound:upper_bound]
+        )
+
+    def modified_between(
+        self: "ListingIndex", start: Optional[datetime], end: Optional[datetime], include_unknown: bool = True
+    ) -> "ListingIndex":
+        """Returns the objects last modified from `start` up to `end`, both inclusive and unbounded if None.
+
+        Args:
+            start (Optional[datetime]): the earliest modification time to include, naive times are taken as UTC
+            end (Optional[datetime]): the latest modification time to include, naive times are taken as UTC
+            include_unknown (bool, optional): whether to include objects without a modification time. Defaults to
+                True.
+
+        Returns:
+            ListingIndex: a new index
+        """
+        unknown = np.isnat(self.last_modified)
+        selected = ~unknown
+        if start is not None:
+            selected &= self.last_modified >= np.datetime64(_microseconds(start), "us")
+        if end is not None:
+            selected &= self.last_modified <= np.datetime64(_microseconds(end), "us")
+        if include_unknown:
+            selected |= unknown
+        return ListingIndex(keys=self.keys[selected], last_modified=self.last_modified[selected])
+
+    def without_last_modified(self: "ListingIndex") -> "ListingIndex":
+        """Returns the objects whose modification time is unknown."""
+        unknown = np.isnat(self.last_modified)
+        return ListingIndex(keys=self.keys[unknown], last_modified=self.last_modified[unknown])
+
+
+def _microseconds(value: datetime) -> int:
+    """Returns the microseconds since the epoch of the given time, taking naive times as UTC."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+
+def _datetime(microseconds: int) -> Optional[datetime]:
+    """Returns the UTC time the given microseconds since the epoch refer to, None if not a time."""
+    return None if microseconds == NOT_A_TIME else EPOCH + timedelta(microseconds=microseconds)
+
+
+def _prefix_successor(prefix: bytes) -> Optional[bytes]:
+    """Returns the smallest byte string greater than all strings starting with `prefix`, None if there is none."""
+    stripped = prefix.rstrip(b"\xff")
+    if not stripped:
+        return None
+    return stripped[:-1] + bytes([stripped[-1] + 1])
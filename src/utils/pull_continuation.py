@@ -0,0 +1,79 @@
+import gzip
+import json
+import logging
+import os
+from typing import List, Optional
+
+from botocore.client import BaseClient
+from botocore.exceptions import ClientError
+
+from utils.sftp import SftpFileItem
+
+logger = logging.getLogger()
+logger.setLevel(os.environ.get("LOG_LEVEL", "INFO"))
+
+# limits how often a pull may continue itself, protects against pulls that never make progress
+PULL_MAX_CONTINUATIONS = 50
+
+
+def pull_continuation_key(peer_id: str) -> str:
+    """Returns the object key of the specified peer's continuation in the pull state bucket."""
+    return f"{peer_id}/continuation.json.gz"
+
+
+def save_pull_continuation(
+    client: BaseClient, bucket_name: str, peer_id: str, token: str, sftp_file_items: List[SftpFileItem]
+) -> None:
+    """Stores the files a pull did not get to, so that the continuing pull does not need to walk the remote folder
+    again. Every peer has a single continuation, a newer one replaces older ones.
+
+    Args:
+        client (BaseClient): the boto3 client to use for accessing S3
+        bucket_name (str): the name of the pull state bucket
+        peer_id (str): the peer that has been pulled
+        token (str): identifies the continuation, passed on to the continuing pull
+        sftp_file_items (List[SftpFileItem]): the files remaining to be pulled
+
+    Raises:
+        ValueError: if the continuation cannot be stored
+    """
+    document = {"token": token, "peer_id": peer_id, "files": [item.to_dict() for item in sftp_file_items]}
+    try:
+        client.put_object(
+            Bucket=bucket_name,
+            Key=pull_continuation_key(peer_id=peer_id),
+            Body=gzip.compress(json.dumps(document, separators=(",", ":")).encode("utf-8")),
+        )
+        logger.info(f"Stored continuation {token} for {peer_id} with {len(sftp_file_items)} remaining file(s).")
+    except ClientError as e:
+        logger.exception("Unable to store pull continuation: %s" % (e.response.get("Error", {}).get("Message")))
+        raise ValueError(f"Unable to store pull continuation for {peer_id}.")
+
+
+def load_pull_continuation(
+    client: BaseClient, bucket_name: str, peer_id: str, token: str
+) -> Optional[List[SftpFileItem]]:
+    """Loads the files remaining from a previous pull.
+
+    Args:
+        client (BaseClient): the boto3 client to use for accessing S3
+        bucket_name (str): the name of the pull state bucket
+        peer_id (str): the peer being pulled
+        token (str): the continuation token the pull has been invoked with
+
+    Returns:
+        Optional[List[SftpFileItem]]: the remaining files or None if the continuation does not exist or has been
+            replaced by a newer one, in which case the remote folder needs to be walked again
+    """
+    try:
+        response = client.get_object(Bucket=bucket_name, Key=pull_continuation_key(peer_id=peer_id))
+        document = json.loads(gzip.decompress(response["Body"].read()).decode("utf-8"))
+    except ClientError as e:
+        logger.warning("Unable to load pull continuation %s: %s" % (token, e.response.get("Error", {}).get("Message")))
+        return None
+
+    if document.get("token") != token:
+        logger.warning(f"Pull continuation {token} for {peer_id} has been replaced.")
+        return None
+
+    return [SftpFileItem.from_dict(item) for item in document.get("files", [])]
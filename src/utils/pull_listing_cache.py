@@ -0,0 +1,131 @@
+import gzip
+import json
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from botocore.client import BaseClient
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger()
+logger.setLevel(os.environ.get("LOG_LEVEL", "INFO"))
+
+PULL_LISTING_CACHE_VERSION = 1
+# directories modified more recently are always listed, an entry might have been added within the same second after
+# the previous listing. Also covers moderate clock differences between the SFTP server and the Lambda.
+PULL_LISTING_CACHE_MIN_AGE_SECONDS = 300
+
+# name, permissions, size and modification time of a directory entry, as returned by lstat
+ListingEntry = Tuple[str, Optional[int], Optional[int], Optional[int]]
+# modification time of a directory along with its entries
+CachedListing = Tuple[int, List[ListingEntry]]
+
+
+@dataclass
+class PullListingCache:
+    """Remote directory listings of the previous pull of a peer, keyed by the resolved paths of the directories.
+    Creating, deleting or renaming an entry updates the modification time of a directory, so as long as it did not
+    change, the cached entries are still complete. Modifying a file in place does not update the directory though,
+    hence size and modification time of cached files may be outdated.
+
+    `directories` holds the listings of the previous pull, `visited` those seen during this pull, which replace the
+    previous ones when the cache is stored.
+    """
+
+    peer_id: str
+    directories: Dict[str, CachedListing] = field(default_factory=dict)
+    visited: Dict[str, CachedListing] = field(default_factory=dict)
+    hits: int = field(default=0)
+    misses: int = field(default=0)
+
+    def lookup(self: "PullListingCache", path: str, mtime: Optional[int]) -> Optional[List[ListingEntry]]:
+        """Returns the cached entries of the directory at `path` if its modification time is still `mtime`."""
+        cached = self.directories.get(path)
+        if mtime is None or cached is None or cached[0] != mtime:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.visited[path] = cached
+        return cached[1]
+
+    def store(
+        self: "PullListingCache", path: str, mtime: Optional[int], entries: List[ListingEntry], now: float
+    ) -> None:
+        """Records the entries of the directory at `path` just listed, unless it has been modified too recently."""
+        if mtime is None or mtime > now - PULL_LISTING_CACHE_MIN_AGE_SECONDS:
+            return
+        self.visited[path] = (mtime, entries)
+
+    def serialize(self: "PullListingCache") -> bytes:
+        document = {
+            "version": PULL_LISTING_CACHE_VERSION,
+            "peer_id": self.peer_id,
+            "directories": {
+                path: {"mtime": mtime, "entries": [list(entry) for entry in entries]}
+                for path, (mtime, entries) in sorted(self.visited.items())
+            },
+        }
+        return gzip.compress(json.dumps(document, separators=(",", ":")).encode("utf-8"))
+
+    @staticmethod
+    def deserialize(peer_id: str, data: bytes) -> "PullListingCache":
+        document = json.loads(gzip.decompress(data).decode("utf-8"))
+        version = document.get("version")
+        if version != PULL_LISTING_CACHE_VERSION:
+            raise ValueError(f"Unsupported pull listing cache version: {version}")
+        directories: Dict[str, CachedListing] = {
+            path: (listing["mtime"], [(name, mode, size, mtime) for name, mode, size, mtime in listing["entries"]])
+            for path, listing in document.get("directories", {}).items()
+        }
+        return PullListingCache(peer_id=peer_id, directories=directories)
+
+
+def pull_listing_cache_key(peer_id: str) -> str:
+    """Returns the object key of the specified peer's listing cache in the pull state bucket."""
+    return f"{peer_id}/listing-cache.json.gz"
+
+
+def load_pull_listing_cache(client: BaseClient, bucket_name: str, peer_id: str) -> PullListingCache:
+    """Loads the listing cache of the specified peer. As the cache only saves time, a cache which does not exist or
+    cannot be loaded results in an empty cache.
+
+    Args:
+        client (BaseClient): the boto3 client to use for accessing S3
+        bucket_name (str): the name of the pull state bucket
+        peer_id (str): the peer being pulled
+
+    Returns:
+        PullListingCache: the cached listings of the previous pull
+    """
+    try:
+        response = client.get_object(Bucket=bucket_name, Key=pull_listing_cache_key(peer_id=peer_id))
+        cache = PullListingCache.deserialize(peer_id=peer_id, data=response["Body"].read())
+        logger.info(f"Loaded listing cache for {peer_id} containing {len(cache.directories)} directories.")
+        return cache
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") not in ("NoSuchKey", "404"):
+            logger.warning("Unable to load listing cache: %s" % (e.response.get("Error", {}).get("Message")))
+    except (ValueError, OSError):
+        logger.warning(f"Ignoring unreadable listing cache of {peer_id}.")
+    return PullListingCache(peer_id=peer_id)
+
+
+def save_pull_listing_cache(client: BaseClient, bucket_name: str, cache: PullListingCache) -> None:
+    """Stores the listings seen during this pull, replacing those of the previous pull. Failures are logged only,
+    the next pull will list the remote directories again.
+
+    Args:
+        client (BaseClient): the boto3 client to use for accessing S3
+        bucket_name (str): the name of the pull state bucket
+        cache (PullListingCache): the cache to store
+    """
+    try:
+        client.put_object(Bucket=bucket_name, Key=pull_listing_cache_key(peer_id=cache.peer_id), Body=cache.serialize())
+        logger.info(
+            f"Stored listing cache for {cache.peer_id} containing {len(cache.visited)} directories "
+            f"({cache.hits} reused, {cache.misses} listed)."
+        )
+    except ClientError as e:
+        logger.warning("Unable to store listing cache: %s" % (e.response.get("Error", {}).get("Message")))
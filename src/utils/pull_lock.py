@@ -0,0 +1,221 @@
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional
+
+from botocore.client import BaseClient
+from botocore.exceptions import ClientError
+from dataclasses_json import DataClassJsonMixin, config
+
+logger = logging.getLogger()
+logger.setLevel(os.environ.get("LOG_LEVEL", "INFO"))
+
+PULL_LOCK_DEFAULT_TTL_SECONDS = 120
+# a lease is renewed three times per TTL, so a single failed renewal does not lose it
+PULL_LOCK_RENEWALS_PER_TTL = 3
+PULL_LOCK_ACQUIRE_ATTEMPTS = 3
+
+_CONDITION_FAILED = ("PreconditionFailed", "ConditionalRequestConflict")
+_NOT_FOUND = ("NoSuchKey", "404")
+
+
+@dataclass
+class PullLockSettings(DataClassJsonMixin):
+    """Controls the lock which prevents overlapping pulls of a peer. A lease not renewed within `ttl_seconds`, e.g.
+    because the pull holding it timed out, is taken over by the next pull.
+    """
+
+    enabled: bool = field(default=True)
+    ttl_seconds: int = field(default=PULL_LOCK_DEFAULT_TTL_SECONDS, metadata=config(field_name="ttl-seconds"))
+
+
+class PullLease:
+    """A lease on pulling a peer, stored as an object in the pull state bucket. All writes are conditional on the ETag
+    of the lease as written by its owner, so a lease taken over by another pull cannot be renewed or released.
+    `start_heartbeat` renews the lease in the background while the pull is running.
+    """
+
+    def __init__(
+        self: "PullLease",
+        client: BaseClient,
+        bucket_name: str,
+        peer_id: str,
+        owner: str,
+        etag: str,
+        ttl_seconds: int,
+        now: Callable[[], float] = time.time,
+    ) -> None:
+        self.client = client
+        self.bucket_name = bucket_name
+        self.peer_id = peer_id
+        self.owner = owner
+        self.etag = etag
+        self.ttl_seconds = ttl_seconds
+        self.now = now
+        self.lost = False
+        self.released = False
+        self.stopped = threading.Event()
+        self.heartbeat: Optional[threading.Thread] = None
+        self.lock = threading.Lock()
+
+    def renew(self: "PullLease") -> bool:
+        """Extends the lease by its TTL. Returns False once the lease has been lost to another pull."""
+        with self.lock:
+            if self.lost or self.released:
+                return False
+            try:
+                self.etag = _put_lease(
+                    client=self.client,
+                    bucket_name=self.bucket_name,
+                    peer_id=self.peer_id,
+                    owner=self.owner,
+                    expires=self.now() + self.ttl_seconds,
+                    condition={"IfMatch": self.etag},
+                )
+                logger.debug(f"Renewed pull lock of {self.peer_id}.")
+            except ClientError as e:
+                if _error_code(e) not in _CONDITION_FAILED + _NOT_FOUND:
+                    logger.warning("Unable to renew pull lock: %s" % (e.response.get("Error", {}).get("Message")))
+                    return True
+                logger.error(f"Lost pull lock of {self.peer_id} to another pull.")
+                self.lost = True
+            return not self.lost
+
+    def start_heartbeat(self: "PullLease") -> None:
+        """Renews the lease in a background thread until it is released or lost."""
+        interval = self.ttl_seconds / PULL_LOCK_RENEWALS_PER_TTL
+
+        def beat() -> None:
+            while not self.stopped.wait(interval) and self.renew():
+                pass
+
+        self.heartbeat = threading.Thread(target=beat, name=f"pull-lock-{self.peer_id}", daemon=True)
+        self.heartbeat.start()
+
+    def release(self: "PullLease") -> None:
+        """Stops the heartbeat and deletes the lease, unless it has been lost or released already. Failures are logged
+        only, the lease expires after its TTL anyway."""
+        self.stopped.set()
+        if self.heartbeat and self.heartbeat is not threading.current_thread():
+            self.heartbeat.join()
+        with self.lock:
+            if self.lost or self.released:
+                return
+            self.released = True
+            try:
+                self.client.delete_object(
+                    Bucket=self.bucket_name, Key=pull_lock_key(peer_id=self.peer_id), IfMatch=self.etag
+                )
+                logger.info(f"Released pull lock of {self.peer_id}.")
+            except ClientError as e:
+                logger.warning("Unable to release pull lock: %s" % (e.response.get("Error", {}).get("Message")))
+
+
+def pull_lock_key(peer_id: str) -> str:
+    """Returns the object key of the specified peer's lock in the pull state bucket."""
+    return f"{peer_id}/pull.lock"
+
+
+def acquire_pull_lock(
+    client: BaseClient,
+    bucket_name: str,
+    peer_id: str,
+    owner: str,
+    ttl_seconds: int = PULL_LOCK_DEFAULT_TTL_SECONDS,
+    now: Callable[[], float] = time.time,
+) -> Optional[PullLease]:
+    """Acquires the lock on pulling the specified peer. The lease is created only if it does not exist, an expired
+    lease is replaced only if it has not been changed since it was read, so of any number of concurrent pulls exactly
+    one acquires the lock.
+
+    Args:
+        client (BaseClient): the boto3 client to use for accessing S3
+        bucket_name (str): the name of the pull state bucket
+        peer_id (str): the peer to be pulled
+        owner (str): identifies the pull acquiring the lock, e.g. the Lambda request ID
+        ttl_seconds (int, optional): duration of the lease. Defaults to PULL_LOCK_DEFAULT_TTL_SECONDS.
+        now (Callable[[], float], optional): returns the current time in seconds since the epoch. Defaults to
+            time.time.
+
+    Raises:
+        ValueError: if the lock cannot be accessed
+
+    Returns:
+        Optional[PullLease]: the lease or None if another pull holds the lock
+    """
+    key = pull_lock_key(peer_id=peer_id)
+    condition: Dict[str, str] = {"IfNoneMatch": "*"}
+    for _ in range(PULL_LOCK_ACQUIRE_ATTEMPTS):
+        try:
+            etag = _put_lease(
+                client=client,
+                bucket_name=bucket_name,
+                peer_id=peer_id,
+                owner=owner,
+                expires=now() + ttl_seconds,
+                condition=condition,
+            )
+            logger.info(f"Acquired pull lock of {peer_id} for {ttl_seconds} seconds.")
+            return PullLease(
+                client=client,
+                bucket_name=bucket_name,
+                peer_id=peer_id,
+                owner=owner,
+                etag=etag,
+                ttl_seconds=ttl_seconds,
+                now=now,
+            )
+        except ClientError as e:
+            if _error_code(e) not in _CONDITION_FAILED:
+                logger.exception("Unable to acquire pull lock: %s" % (e.response.get("Error", {}).get("Message")))
+                raise ValueError(f"Unable to acquire pull lock for {peer_id}.")
+
+        try:
+            response = client.get_object(Bucket=bucket_name, Key=key)
+        except ClientError as e:
+            if _error_code(e) not in _NOT_FOUND:
+                logger.exception("Unable to read pull lock: %s" % (e.response.get("Error", {}).get("Message")))
+                raise ValueError(f"Unable to acquire pull lock for {peer_id}.")
+            # released meanwhile
+            condition = {"IfNoneMatch": "*"}
+            continue
+
+        holder = _read_lease(data=response["Body"].read())
+        expires = holder.get("expires")
+        if isinstance(expires, (int, float)) and expires > now():
+            logger.info(f"Not pulling {peer_id}, pull {holder.get('owner')} holds the lock until {expires}.")
+            return None
+        logger.warning(f"Taking over expired pull lock of {peer_id} from pull {holder.get('owner')}.")
+        condition = {"IfMatch": response["ETag"]}
+
+    logger.info(f"Not pulling {peer_id}, the lock is contended.")
+    return None
+
+
+def _put_lease(
+    client: BaseClient, bucket_name: str, peer_id: str, owner: str, expires: float, condition: Dict[str, str]
+) -> str:
+    document = {"peer_id": peer_id, "owner": owner, "expires": expires}
+    response = client.put_object(
+        Bucket=bucket_name,
+        Key=pull_lock_key(peer_id=peer_id),
+        Body=json.dumps(document).encode("utf-8"),
+        **condition,
+    )
+    return response["ETag"]
+
+
+def _read_lease(data: bytes) -> Dict[str, Any]:
+    """Returns the lease document, an unreadable lease is treated as expired."""
+    try:
+        document = json.loads(data.decode("utf-8"))
+        return document if isinstance(document, dict) else {}
+    except ValueError:
+        return {}
+
+
+def _error_code(e: ClientError) -> Optional[str]:
+    return e.response.get("Error", {}).get("Code")
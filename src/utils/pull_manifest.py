@@ -0,0 +1,255 @@
+import gzip
+import json
+import logging
+import os
+import posixpath
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Optional, Tuple
+
+from botocore.client import BaseClient
+from botocore.exceptions import ClientError
+
+from utils.s3 import BucketItem, iter_bucket
+from utils.sftp import SftpFileItem, remove_timestamp
+
+logger = logging.getLogger()
+logger.setLevel(os.environ.get("LOG_LEVEL", "INFO"))
+
+PULL_MANIFEST_VERSION = 4
+PULL_MANIFEST_SAVE_ATTEMPTS = 3
+
+# size and modification time of a remote file, either may be None if unknown (e.g. for bootstrapped entries)
+FileIdentity = Tuple[Optional[int], Optional[int]]
+# object key and ETag of the object a remote file has been stored as
+StoredObject = Tuple[str, Optional[str]]
+
+
+@dataclass
+class PullManifest:
+    """Index of all files that have been pulled for a peer so far. Files are identified by their remote path relative
+    to the SFTP home directory (see `SftpFileItem.convert_to_object_key`) together with their size and modification
+    time, independent of the object keys they have been stored under. `contents` indexes the SHA-256 of the pulled
+    files' contents, pointing to the remote path the content has been pulled from first. `objects` records the
+    objects that files pulled in append mode have been stored as, so the next pull can append to them. `etag` denotes
+    the stored version this manifest was loaded from.
+    """
+
+    peer_id: str
+    files: Dict[str, FileIdentity] = field(default_factory=dict)
+    etag: Optional[str] = field(default=None)
+    added: Dict[str, FileIdentity] = field(default_factory=dict)
+    contents: Dict[str, str] = field(default_factory=dict)
+    added_contents: Dict[str, str] = field(default_factory=dict)
+    objects: Dict[str, StoredObject] = field(default_factory=dict)
+    added_objects: Dict[str, StoredObject] = field(default_factory=dict)
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def contains(self: "PullManifest", sftp_file_item: SftpFileItem) -> bool:
+        """Returns True if the given file has been pulled before. A file at a known remote path whose size or
+        modification time changed since is considered a new file. Unknown identity attributes always match."""
+        identity = self.files.get(sftp_file_item.convert_to_object_key())
+        if identity is None:
+            return False
+        size, last_modified = identity
+        return (size is None or size == sftp_file_item.size) and (
+            last_modified is None or last_modified == sftp_file_item.last_modified
+        )
+
+    def contains_content(self: "PullManifest", sha256: Optional[str]) -> bool:
+        """Returns True if a file with the given content has been pulled before."""
+        return sha256 is not None and sha256 in self.contents
+
+    def stored_version(self: "PullManifest", sftp_file_item: SftpFileItem) -> Optional[Tuple[BucketItem, int]]:
+        """Returns the object the previous version of the given file has been stored as along with that version's
+        size, if recorded."""
+        remote_path = sftp_file_item.convert_to_object_key()
+        stored, identity = self.objects.get(remote_path), self.files.get(remote_path)
+        if stored is None or identity is None or identity[0] is None:
+            return None
+        key, etag = stored
+        return BucketItem(key=key, etag=etag), identity[0]
+
+    def add(self: "PullManifest", sftp_file_item: SftpFileItem, stored: Optional[BucketItem] = None) -> None:
+        """Records the given file as pulled, along with its content if known and the object it has been `stored` as
+        if given. Safe to be called from concurrent downloads."""
+        remote_path = sftp_file_item.convert_to_object_key()
+        identity = (sftp_file_item.size, sftp_file_item.last_modified)
+        with self.lock:
+            self.files[remote_path] = identity
+            self.added[remote_path] = identity
+            if stored is not None:
+                self.objects[remote_path] = (stored.key, stored.etag)
+                self.added_objects[remote_path] = (stored.key, stored.etag)
+            if sftp_file_item.sha256 and sftp_file_item.sha256 not in self.contents:
+                self.contents[sftp_file_item.sha256] = remote_path
+                self.added_contents[sftp_file_item.sha256] = remote_path
+
+    def serialize(self: "PullManifest") -> bytes:
+        document = {
+            "version": PULL_MANIFEST_VERSION,
+            "peer_id": self.peer_id,
+            "files": {remote_path: list(self.files[remote_path]) for remote_path in sorted(self.files)},
+            "contents": {sha256: self.contents[sha256] for sha256 in sorted(self.contents)},
+            "objects": {remote_path: list(self.objects[remote_path]) for remote_path in sorted(self.objects)},
+        }
+        return gzip.compress(json.dumps(document, separators=(",", ":")).encode("utf-8"))
+
+    @staticmethod
+    def deserialize(peer_id: str, data: bytes, etag: Optional[str] = None) -> "PullManifest":
+        document = json.loads(gzip.decompress(data).decode("utf-8"))
+        version = document.get("version")
+        if version == 1:
+            # version 1 manifests only stored remote paths
+            files: Dict[str, FileIdentity] = {remote_path: (None, None) for remote_path in document.get("files", [])}
+        elif version in (2, 3, PULL_MANIFEST_VERSION):
+            # version 2 manifests did not index contents, version 3 manifests did not record objects
+            files = {remote_path: (size, mtime) for remote_path, (size, mtime) in document.get("files", {}).items()}
+        else:
+            raise ValueError(f"Unsupported pull manifest version: {version}")
+        objects: Dict[str, StoredObject] = {
+            remote_path: (key, object_etag) for remote_path, (key, object_etag) in document.get("objects", {}).items()
+        }
+        return PullManifest(
+            peer_id=peer_id, files=files, etag=etag, contents=document.get("contents", {}), objects=objects
+        )
+
+
+def pull_manifest_key(peer_id: str) -> str:
+    """Returns the object key of the specified peer's manifest in the pull state bucket."""
+    return f"{peer_id}/manifest.json.gz"
+
+
+def load_pull_manifest(client: BaseClient, bucket_name: str, peer_id: str) -> Optional[PullManifest]:
+    """Loads the manifest of the specified peer from the pull state bucket.
+
+    Args:
+        client (BaseClient): the boto3 client to use for accessing S3
+        bucket_name (str): the name of the pull state bucket
+        peer_id (str): the peer to load the manifest for
+
+    Raises:
+        ValueError: if the manifest exists but cannot be loaded
+
+    Returns:
+        Optional[PullManifest]: the manifest or None if there is no manifest for the peer yet
+    """
+    key = pull_manifest_key(peer_id=peer_id)
+    try:
+        response = client.get_object(Bucket=bucket_name, Key=key)
+        manifest = PullManifest.deserialize(peer_id=peer_id, data=response["Body"].read(), etag=response["ETag"])
+        logger.info(f"Loaded pull manifest for {peer_id} containing {len(manifest.files)} file(s).")
+        return manifest
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+            logger.info(f"There is no pull manifest for {peer_id} yet.")
+            return None
+        logger.exception("Unable to load pull manifest: %s" % (e.response.get("Error", {}).get("Message")))
+        raise ValueError(f"Unable to load pull manifest for {peer_id}.")
+
+
+def save_pull_manifest(client: BaseClient, bucket_name: str, manifest: PullManifest) -> PullManifest:
+    """Atomically replaces the stored manifest of a peer. The write is conditional on the version that the manifest
+    was loaded from, so concurrent runs cannot silently drop each other's entries. On conflict, the latest stored
+    manifest is merged with the files added during this run and the write is retried.
+
+    Args:
+        client (BaseClient): the boto3 client to use for accessing S3
+        bucket_name (str): the name of the pull state bucket
+        manifest (PullManifest): the manifest to store
+
+    Raises:
+        ValueError: if the manifest cannot be stored
+
+    Returns:
+        PullManifest: the manifest as it has been stored
+    """
+    key = pull_manifest_key(peer_id=manifest.peer_id)
+    for _ in range(PULL_MANIFEST_SAVE_ATTEMPTS):
+        condition = {"IfMatch": manifest.etag} if manifest.etag else {"IfNoneMatch": "*"}
+        try:
+            response = client.put_object(Bucket=bucket_name, Key=key, Body=manifest.serialize(), **condition)
+            logger.info(f"Stored pull manifest for {manifest.peer_id} containing {len(manifest.files)} file(s).")
+            return PullManifest(
+                peer_id=manifest.peer_id,
+                files=manifest.files,
+                etag=response["ETag"],
+                contents=manifest.contents,
+                objects=manifest.objects,
+            )
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") not in ("PreconditionFailed", "ConditionalRequestConflict"):
+                logger.exception("Unable to store pull manifest: %s" % (e.response.get("Error", {}).get("Message")))
+                raise ValueError(f"Unable to store pull manifest for {manifest.peer_id}.")
+
+        logger.warning(f"Pull manifest for {manifest.peer_id} was modified concurrently, merging ...")
+        latest = load_pull_manifest(client=client, bucket_name=bucket_name, peer_id=manifest.peer_id)
+        if latest:
+            manifest = PullManifest(
+                peer_id=manifest.peer_id,
+                files={**latest.files, **manifest.added},
+                etag=latest.etag,
+                added=manifest.added,
+                contents={**manifest.added_contents, **latest.contents},
+                added_contents=manifest.added_contents,
+                objects={**latest.objects, **manifest.added_objects},
+                added_objects=manifest.added_objects,
+            )
+        else:
+            manifest = PullManifest(
+                peer_id=manifest.peer_id,
+                files=manifest.files,
+                added=manifest.added,
+                contents=manifest.contents,
+                added_contents=manifest.added_contents,
+                objects=manifest.objects,
+                added_objects=manifest.added_objects,
+            )
+
+    raise ValueError(f"Unable to store pull manifest for {manifest.peer_id}.")
+
+
+def rebuild_pull_manifest(client: BaseClient, upload_bucket_name: str, peer_id: str) -> PullManifest:
+    """Creates a manifest for the specified peer from the files previously pulled into the upload bucket. Used to
+    bootstrap the manifest for peers that have been pulled from before manifests existed.
+
+    Args:
+        client (BaseClient): the boto3 client to use for accessing S3
+        upload_bucket_name (str): the name of the upload bucket
+        peer_id (str): the peer to rebuild the manifest for
+
+    Returns:
+        PullManifest: a manifest which has not been stored yet
+    """
+    items = iter_bucket(client=client, bucket_name=upload_bucket_name, prefix=f"{peer_id}/")
+    manifest = pull_manifest_from_bucket_items(peer_id=peer_id, items=items)
+    logger.info(f"Rebuilt pull manifest for {peer_id} from {len(manifest.files)} object(s) in {upload_bucket_name}.")
+    return manifest
+
+
+def pull_manifest_from_bucket_items(peer_id: str, items: Iterable[BucketItem]) -> PullManifest:
+    """Creates a manifest for the specified peer from the objects its files have been stored as. Timestamps inserted
+    into object keys (see `add-timestamp-to-downloaded-files`) are removed to recover the remote paths. As object keys
+    do not reveal the size and modification time of the remote files, these remain unknown. Objects of other peers
+    are ignored.
+
+    Args:
+        peer_id (str): the peer the objects belong to
+        items (Iterable[BucketItem]): objects found in the upload bucket, consumed once
+
+    Returns:
+        PullManifest: a manifest which has not been stored yet
+    """
+    prefix = f"{peer_id}/"
+    files: Dict[str, FileIdentity] = {
+        remote_file_path(object_key=item.key[len(prefix) :]): (None, None)
+        for item in items
+        if item.key.startswith(prefix)
+    }
+    return PullManifest(peer_id=peer_id, files=files)
+
+
+def remote_file_path(object_key: str) -> str:
+    """Returns the remote path of the file stored under the given object key (without the peer's prefix)."""
+    directory, file_name = posixpath.split(object_key)
+    return posixpath.join(directory, remove_timestamp(file_name=file_name))
@@ -0,0 +1,193 @@
+import gzip
+import json
+import logging
+import os
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import List, Literal, Optional, Tuple
+
+from botocore.client import BaseClient
+from botocore.exceptions import ClientError
+from dataclasses_json import DataClassJsonMixin, config
+
+logger = logging.getLogger()
+logger.setLevel(os.environ.get("LOG_LEVEL", "INFO"))
+
+PULL_ARRIVALS_VERSION = 1
+# arrivals lose half their weight within this many days, so the histograms follow changing delivery times
+PULL_ARRIVALS_HALF_LIFE_DAYS = 28
+# deliveries are rarely on the minute, arrivals in the neighbouring hours count towards an hour's window
+PULL_ARRIVALS_WINDOW_HOURS = 1
+
+PULL_SCHEDULE_DEFAULT_MIN_HISTORY = 10
+PULL_SCHEDULE_DEFAULT_THRESHOLD = 0.5
+PULL_SCHEDULE_DEFAULT_BACKOFF_MINUTES = 5
+PULL_SCHEDULE_DEFAULT_MAX_INTERVAL_MINUTES = 60
+
+PollReason = Literal["learning", "expected", "backoff-elapsed", "not-expected"]
+
+
+@dataclass
+class AdaptiveScheduleSettings(DataClassJsonMixin):
+    """Controls the adaptive schedule of a pull peer. The peer's `schedule` sets the highest polling frequency. Once
+    `min_history` pulls found new files, polls outside the hours and weekdays that files usually arrive in are skipped,
+    backing off from `backoff_minutes` between polls to `max_interval_minutes`. An hour is expected if its
+    arrivals are at least `threshold` times what evenly spread arrivals would amount to.
+    """
+
+    enabled: bool = field(default=False)
+    min_history: int = field(default=PULL_SCHEDULE_DEFAULT_MIN_HISTORY, metadata=config(field_name="min-history"))
+    threshold: float = field(default=PULL_SCHEDULE_DEFAULT_THRESHOLD)
+    backoff_minutes: float = field(
+        default=PULL_SCHEDULE_DEFAULT_BACKOFF_MINUTES, metadata=config(field_name="backoff-minutes")
+    )
+    max_interval_minutes: float = field(
+        default=PULL_SCHEDULE_DEFAULT_MAX_INTERVAL_MINUTES, metadata=config(field_name="max-interval-minutes")
+    )
+
+
+@dataclass
+class PullArrivals:
+    """When new files of a peer appeared, as decaying histograms over the hours of the day and the days of the week
+    (UTC), along with the outcome of recent polls. Files are binned by their modification time, every pull finding new
+    files adds a weight of one, spread over its files.
+    """
+
+    peer_id: str
+    hours: List[float] = field(default_factory=lambda: [0.0] * 24)
+    weekdays: List[float] = field(default_factory=lambda: [0.0] * 7)
+    arrivals: int = field(default=0)
+    last_poll: Optional[float] = field(default=None)
+    last_arrival: Optional[float] = field(default=None)
+    empty_polls: int = field(default=0)
+
+    def record(self: "PullArrivals", polled_at: float, modified: List[Optional[int]]) -> None:
+        """Records a poll at `polled_at` which found new files last modified at `modified`, if any."""
+        self.last_poll = polled_at
+        if not modified:
+            self.empty_polls += 1
+            return
+
+        if self.last_arrival is not None:
+            decay = 0.5 ** (max(0.0, polled_at - self.last_arrival) / (PULL_ARRIVALS_HALF_LIFE_DAYS * 86400))
+            self.hours = [count * decay for count in self.hours]
+            self.weekdays = [count * decay for count in self.weekdays]
+        for mtime in modified:
+            at = datetime.fromtimestamp(mtime if mtime is not None else polled_at, timezone.utc)
+            self.hours[at.hour] += 1 / len(modified)
+            self.weekdays[at.weekday()] += 1 / len(modified)
+        self.arrivals += 1
+        self.last_arrival = polled_at
+        self.empty_polls = 0
+
+    def likelihood(self: "PullArrivals", at: float) -> float:
+        """Returns how likely new files appear around `at` relative to evenly spread arrivals, 1.0 if unknown."""
+        hours_total, weekdays_total = sum(self.hours), sum(self.weekdays)
+        if hours_total <= 0 or weekdays_total <= 0:
+            return 1.0
+        when = datetime.fromtimestamp(at, timezone.utc)
+        window = range(when.hour - PULL_ARRIVALS_WINDOW_HOURS, when.hour + PULL_ARRIVALS_WINDOW_HOURS + 1)
+        hour_share = sum(self.hours[hour % 24] for hour in window) / hours_total
+        weekday_share = self.weekdays[when.weekday()] / weekdays_total
+        return (hour_share * 24 / len(window)) * (weekday_share * 7)
+
+    def serialize(self: "PullArrivals") -> bytes:
+        document = {
+            "version": PULL_ARRIVALS_VERSION,
+            "peer_id": self.peer_id,
+            "hours": self.hours,
+            "weekdays": self.weekdays,
+            "arrivals": self.arrivals,
+            "last_poll": self.last_poll,
+            "last_arrival": self.last_arrival,
+            "empty_polls": self.empty_polls,
+        }
+        return gzip.compress(json.dumps(document, separators=(",", ":")).encode("utf-8"))
+
+    @staticmethod
+    def deserialize(peer_id: str, data: bytes) -> "PullArrivals":
+        document = json.loads(gzip.decompress(data).decode("utf-8"))
+        version = document.get("version")
+        if version != PULL_ARRIVALS_VERSION:
+            raise ValueError(f"Unsupported pull arrivals version: {version}")
+        hours, weekdays = document.get("hours", []), document.get("weekdays", [])
+        if len(hours) != 24 or len(weekdays) != 7:
+            raise ValueError("Malformed pull arrivals.")
+        return PullArrivals(
+            peer_id=peer_id,
+            hours=[float(count) for count in hours],
+            weekdays=[float(count) for count in weekdays],
+            arrivals=document.get("arrivals", 0),
+            last_poll=document.get("last_poll"),
+            last_arrival=document.get("last_arrival"),
+            empty_polls=document.get("empty_polls", 0),
+        )
+
+
+def poll_decision(arrivals: PullArrivals, settings: AdaptiveScheduleSettings, now: float) -> Tuple[bool, PollReason]:
+    """Decides whether a scheduled poll shall go ahead. Until enough arrivals have been seen, every poll does. Later,
+    polls in expected windows always go ahead, others only once the backoff since the previous poll passed. The
+    backoff doubles with every poll that found nothing, up to `max_interval_minutes`, so files arriving at unusual
+    times are still picked up.
+
+    Args:
+        arrivals (PullArrivals): the peer's arrival history
+        settings (AdaptiveScheduleSettings): the peer's adaptive schedule
+        now (float): the current time in seconds since the epoch
+
+    Returns:
+        Tuple[bool, PollReason]: True if the poll shall go ahead, along with the reason of the decision
+    """
+    if arrivals.arrivals < settings.min_history or arrivals.last_poll is None:
+        return True, "learning"
+    if arrivals.likelihood(at=now) >= settings.threshold:
+        return True, "expected"
+
+    backoff_minutes = min(settings.max_interval_minutes, settings.backoff_minutes * 2 ** min(arrivals.empty_polls, 16))
+    if now - arrivals.last_poll >= backoff_minutes * 60:
+        return True, "backoff-elapsed"
+    return False, "not-expected"
+
+
+def pull_arrivals_key(peer_id: str) -> str:
+    """Returns the object key of the specified peer's arrival history in the pull state bucket."""
+    return f"{peer_id}/arrivals.json.gz"
+
+
+def load_pull_arrivals(client: BaseClient, bucket_name: str, peer_id: str) -> PullArrivals:
+    """Loads the arrival history of the specified peer. A history which does not exist or cannot be loaded results in
+    an empty one, which lets every poll go ahead.
+
+    Args:
+        client (BaseClient): the boto3 client to use for accessing S3
+        bucket_name (str): the name of the pull state bucket
+        peer_id (str): the peer being pulled
+
+    Returns:
+        PullArrivals: the arrival history of the peer
+    """
+    try:
+        response = client.get_object(Bucket=bucket_name, Key=pull_arrivals_key(peer_id=peer_id))
+        return PullArrivals.deserialize(peer_id=peer_id, data=response["Body"].read())
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") not in ("NoSuchKey", "404"):
+            logger.warning("Unable to load pull arrivals: %s" % (e.response.get("Error", {}).get("Message")))
+    except (ValueError, OSError):
+        logger.warning(f"Ignoring unreadable pull arrivals of {peer_id}.")
+    return PullArrivals(peer_id=peer_id)
+
+
+def save_pull_arrivals(client: BaseClient, bucket_name: str, arrivals: PullArrivals) -> None:
+    """Stores the arrival history of a peer. Failures are logged only, at worst a few polls are skipped or not.
+
+    Args:
+        client (BaseClient): the boto3 client to use for accessing S3
+        bucket_name (str): the name of the pull state bucket
+        arrivals (PullArrivals): the history to store
+    """
+    try:
+        client.put_object(
+            Bucket=bucket_name, Key=pull_arrivals_key(peer_id=arrivals.peer_id), Body=arrivals.serialize()
+        )
+    except ClientError as e:
+        logger.warning("Unable to store pull arrivals: %s" % (e.response.get("Error", {}).get("Message")))
@@ -1,9 +1,14 @@
+import base64
+import io
 import logging
 import os
 import typing
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass, field
 from datetime import datetime
-from typing import List, Optional
+from stat import S_ISREG
+from typing import Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
 from botocore.client import BaseClient
 from botocore.exceptions import ClientError
@@ -13,25 +18,462 @@ logger = logging.getLogger()
 logger.setLevel(os.environ.get("LOG_LEVEL", "INFO"))
 
 PAGINATOR_DEFAULT_PAGE_SIZE = 1000
+SHARDED_LISTING_DEFAULT_CONCURRENCY = 8
+SHARDED_LISTING_DEFAULT_MAX_DEPTH = 2
 DELETE_OBJECTS_CHUNK_SIZE = 1000
 
+MULTIPART_UPLOAD_MIN_PART_SIZE = 5 * 1024 * 1024
+MULTIPART_UPLOAD_DEFAULT_PART_SIZE = 16 * 1024 * 1024
+MULTIPART_UPLOAD_DEFAULT_MAX_IN_FLIGHT_PARTS = 2
+MULTIPART_UPLOAD_DEFAULT_THRESHOLD = 64 * 1024 * 1024
+MULTIPART_UPLOAD_MAX_COPY_PART_SIZE = 5 * 1024 * 1024 * 1024
+MULTIPART_UPLOAD_MAX_PARTS = 10000
+
+# CopyObject copies objects of up to 5 GB, larger objects have to be copied in parts
+COPY_OBJECT_MAX_SIZE = 5 * 1024 * 1024 * 1024
+COPY_OBJECTS_DEFAULT_CONCURRENCY = 16
+MULTIPART_COPY_DEFAULT_PART_SIZE = 256 * 1024 * 1024
+MULTIPART_COPY_DEFAULT_MAX_IN_FLIGHT_PARTS = 8
+
+# part number, content and, if known, SHA-256 digest of a part of a multipart upload
+UploadPart = Tuple[int, bytes, Optional[bytes]]
+
 
 @dataclass
 class BucketItem(DataClassJsonMixin):
     key: str
     last_modified: Optional[datetime] = field(default=None)
+    etag: Optional[str] = field(default=None)
+
+
+@dataclass
+class ObjectCopy:
+    source_bucket_name: str
+    source_key: str
+    destination_bucket_name: str
+    destination_key: str
+    size: Optional[int] = field(default=None)
+
 
+@dataclass
+class CopyResult:
+    copy: ObjectCopy
+    item: Optional[BucketItem] = field(default=None)
+    error: Optional[str] = field(default=None)
+
+
+def upload_file(
+    client: BaseClient,
+    bucket_name: str,
+    key: str,
+    data: typing.IO[bytes],
+    metadata: Optional[Dict[str, str]] = None,
+    multipart_threshold: int = MULTIPART_UPLOAD_DEFAULT_THRESHOLD,
+    part_size: int = MULTIPART_UPLOAD_DEFAULT_PART_SIZE,
+    max_in_flight_parts: int = MULTIPART_UPLOAD_DEFAULT_MAX_IN_FLIGHT_PARTS,
+) -> BucketItem:
+    """Uploads the given data into S3. Data known to be smaller than `multipart_threshold` is uploaded using a plain
+    `PutObject`. Larger data and streams of unknown size, e.g. non-seekable streams, are handed to `upload_stream`,
+    which uploads parts concurrently and aborts the multipart upload if it fails. This also lifts the 5 GB limit of
+    `PutObject`.
 
-def upload_file(client: BaseClient, bucket_name: str, key: str, data: typing.IO[bytes]) -> BucketItem:
+    Args:
+        client (BaseClient): the boto3 client to use for accessing S3
+        bucket_name (str): the name of an existing S3 bucket
+        key (str): the desired object key in the bucket
+        data (IO[bytes]): a readable stream, which does not need to be seekable
+        metadata (Optional[Dict[str, str]], optional): user defined metadata of the object. Defaults to None.
+        multipart_threshold (int, optional): size in bytes from which on a multipart upload is used. Defaults to
+            MULTIPART_UPLOAD_DEFAULT_THRESHOLD.
+        part_size (int, optional): number of bytes per part. Defaults to MULTIPART_UPLOAD_DEFAULT_PART_SIZE.
+        max_in_flight_parts (int, optional): number of parts being uploaded concurrently. Defaults to
+            MULTIPART_UPLOAD_DEFAULT_MAX_IN_FLIGHT_PARTS.
+
+    Raises:
+        ValueError: if the upload failed
+
+    Returns:
+        BucketItem: the `BucketItem` wrapping the uploaded object
+    """
+    size = _remaining_size(data=data)
+    if size is not None and size < multipart_threshold:
+        return _put_object(client=client, bucket_name=bucket_name, key=key, data=data, metadata=metadata)
+
+    if isinstance(data, (str, bytes, bytearray)):
+        data = io.BytesIO(data.encode("utf-8") if isinstance(data, str) else data)
+    item = upload_stream(
+        client=client,
+        bucket_name=bucket_name,
+        key=key,
+        data=data,
+        part_size=part_size,
+        max_in_flight_parts=max_in_flight_parts,
+        metadata=(lambda: metadata) if metadata else None,
+    )
+    # without `should_store`, the object is always stored
+    return typing.cast(BucketItem, item)
+
+
+def _put_object(
+    client: BaseClient, bucket_name: str, key: str, data: typing.IO[bytes], metadata: Optional[Dict[str, str]] = None
+) -> BucketItem:
     logger.info(f"About to upload file into S3. Bucket: {bucket_name}, Key: {key}")
     try:
-        client.put_object(Bucket=bucket_name, Key=key, Body=data)
-        return BucketItem(key=key)
+        response = client.put_object(
+            Bucket=bucket_name, Key=key, Body=data, **({"Metadata": metadata} if metadata else {})
+        )
+        return BucketItem(key=key, etag=response.get("ETag"))
     except ClientError as e:
         logger.exception("Unable to upload file into S3: %s" % (e.response.get("Error", {}).get("Message")))
         raise ValueError("S3 file upload failed.")
 
 
+def _remaining_size(data: Union[typing.IO[bytes], str, bytes]) -> Optional[int]:
+    """Returns the number of bytes left to read from the given data if it can be told without reading it, e.g. for
+    in-memory buffers and regular files. Seeking is avoided, as some streams emulate it by reading."""
+    if isinstance(data, (str, bytes, bytearray)):
+        return len(data)
+    try:
+        if isinstance(data, io.BytesIO):
+            return data.getbuffer().nbytes - data.tell()
+        if isinstance(data, (io.BufferedReader, io.FileIO)):
+            stat = os.fstat(data.fileno())
+            return stat.st_size - data.tell() if S_ISREG(stat.st_mode) else None
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def upload_stream(
+    client: BaseClient,
+    bucket_name: str,
+    key: str,
+    data: typing.IO[bytes],
+    part_size: int = MULTIPART_UPLOAD_DEFAULT_PART_SIZE,
+    max_in_flight_parts: int = MULTIPART_UPLOAD_DEFAULT_MAX_IN_FLIGHT_PARTS,
+    metadata: Optional[Callable[[], Dict[str, str]]] = None,
+    should_store: Optional[Callable[[], bool]] = None,
+) -> Optional[BucketItem]:
+    """Uploads the content of the given stream into S3 without buffering it as a whole. The stream is consumed in
+    parts of `part_size` bytes and each part is sent as an S3 multipart `UploadPart` while the next part is being read.
+    Memory consumption is therefore bounded by `part_size` * (`max_in_flight_parts` + 1), regardless of the stream's
+    total size. Streams that fit into a single part are uploaded using a plain `PutObject`.
+
+    Args:
+        client (BaseClient): the boto3 client to use for accessing S3
+        bucket_name (str): the name of an existing S3 bucket
+        key (str): the desired object key in the bucket
+        data (IO[bytes]): a readable stream, which does not need to be seekable
+        part_size (int, optional): number of bytes per part. Defaults to MULTIPART_UPLOAD_DEFAULT_PART_SIZE.
+        max_in_flight_parts (int, optional): number of parts being uploaded concurrently while reading the next one.
+            Defaults to MULTIPART_UPLOAD_DEFAULT_MAX_IN_FLIGHT_PARTS.
+        metadata (Optional[Callable[[], Dict[str, str]]], optional): returns the user defined metadata of the object.
+            Called right before the object or multipart upload is created, i.e. after the stream has been consumed
+            completely for streams fitting into a single part. Defaults to None.
+        should_store (Optional[Callable[[], bool]], optional): called once the stream has been consumed completely,
+            right before the object becomes visible. If it returns False, the object is not stored. Defaults to None.
+
+    Raises:
+        ValueError: if `part_size` is smaller than what S3 allows or the upload failed
+
+    Returns:
+        Optional[BucketItem]: the `BucketItem` wrapping the uploaded object or None if it has not been stored
+    """
+    if part_size < MULTIPART_UPLOAD_MIN_PART_SIZE:
+        raise ValueError(f"Multipart uploads require a part size of at least {MULTIPART_UPLOAD_MIN_PART_SIZE} bytes.")
+
+    first_part = _read_part(data=data, part_size=part_size)
+    if len(first_part) < part_size:
+        if should_store and not should_store():
+            logger.info(f"Not storing s3://{bucket_name}/{key}.")
+            return None
+        return _put_object(
+            client=client,
+            bucket_name=bucket_name,
+            key=key,
+            data=io.BytesIO(first_part),
+            metadata=metadata() if metadata else None,
+        )
+
+    logger.info(f"About to upload file into S3 using multipart upload. Bucket: {bucket_name}, Key: {key}")
+    try:
+        object_metadata = metadata() if metadata else None
+        upload_id = client.create_multipart_upload(
+            Bucket=bucket_name, Key=key, **({"Metadata": object_metadata} if object_metadata else {})
+        )["UploadId"]
+    except ClientError as e:
+        logger.exception("Unable to start multipart upload: %s" % (e.response.get("Error", {}).get("Message")))
+        raise ValueError("S3 file upload failed.")
+
+    try:
+        completed_parts = _upload_parts(
+            client=client,
+            bucket_name=bucket_name,
+            key=key,
+            upload_id=upload_id,
+            parts=_stream_parts(first_part=first_part, data=data, part_size=part_size),
+            max_in_flight_parts=max_in_flight_parts,
+        )
+        if should_store and not should_store():
+            logger.info(f"Not storing s3://{bucket_name}/{key}, aborting multipart upload.")
+            _abort_multipart_upload(client=client, bucket_name=bucket_name, key=key, upload_id=upload_id)
+            return None
+        response = client.complete_multipart_upload(
+            Bucket=bucket_name, Key=key, UploadId=upload_id, MultipartUpload={"Parts": completed_parts}
+        )
+        logger.info(f"Completed multipart upload of {len(completed_parts)} part(s) into s3://{bucket_name}/{key}")
+        return BucketItem(key=key, etag=response.get("ETag"))
+    except (ClientError, OSError) as e:
+        message = e.response.get("Error", {}).get("Message") if isinstance(e, ClientError) else str(e)
+        logger.exception("Unable to upload file into S3 using multipart upload: %s" % message)
+        _abort_multipart_upload(client=client, bucket_name=bucket_name, key=key, upload_id=upload_id)
+        raise ValueError("S3 file upload failed.")
+    except BaseException:
+        # e.g. the source stream failing with an SSH error, the upload must not be left behind incomplete
+        logger.exception(f"Aborting multipart upload into s3://{bucket_name}/{key}.")
+        _abort_multipart_upload(client=client, bucket_name=bucket_name, key=key, upload_id=upload_id)
+        raise
+
+
+def upload_appended_stream(
+    client: BaseClient,
+    bucket_name: str,
+    key: str,
+    previous: BucketItem,
+    previous_size: int,
+    data: typing.IO[bytes],
+    part_size: int = MULTIPART_UPLOAD_DEFAULT_PART_SIZE,
+    max_in_flight_parts: int = MULTIPART_UPLOAD_DEFAULT_MAX_IN_FLIGHT_PARTS,
+) -> BucketItem:
+    """Stores a file which grew by appending to its previous version, already stored as `previous` in the same
+    bucket. The previous content is copied within S3 using `UploadPartCopy`, only the appended bytes are read from
+    `data` and uploaded as further parts, see `upload_stream`. The copy only succeeds if the previous object still
+    has the ETag it has been stored with.
+
+    Args:
+        client (BaseClient): the boto3 client to use for accessing S3
+        bucket_name (str): the name of an existing S3 bucket
+        key (str): the desired object key in the bucket, may be the key of `previous`
+        previous (BucketItem): the object holding the previous version, including its ETag
+        previous_size (int): the size of the previous version in bytes, at least MULTIPART_UPLOAD_MIN_PART_SIZE
+        data (IO[bytes]): a readable stream of the appended bytes only
+        part_size (int, optional): number of bytes per uploaded part. Defaults to MULTIPART_UPLOAD_DEFAULT_PART_SIZE.
+        max_in_flight_parts (int, optional): number of parts being uploaded concurrently while reading the next one.
+            Defaults to MULTIPART_UPLOAD_DEFAULT_MAX_IN_FLIGHT_PARTS.
+
+    Raises:
+        ValueError: if the previous version is too small to be copied as a part or the upload failed
+
+    Returns:
+        BucketItem: the `BucketItem` wrapping the uploaded object
+    """
+    if part_size < MULTIPART_UPLOAD_MIN_PART_SIZE:
+        raise ValueError(f"Multipart uploads require a part size of at least {MULTIPART_UPLOAD_MIN_PART_SIZE} bytes.")
+    if previous_size < MULTIPART_UPLOAD_MIN_PART_SIZE:
+        raise ValueError(f"Only objects of at least {MULTIPART_UPLOAD_MIN_PART_SIZE} bytes can be appended to.")
+
+    logger.info(f"About to append to s3://{bucket_name}/{previous.key}. Bucket: {bucket_name}, Key: {key}")
+    try:
+        upload_id = client.create_multipart_upload(Bucket=bucket_name, Key=key)["UploadId"]
+    except ClientError as e:
+        logger.exception("Unable to start multipart upload: %s" % (e.response.get("Error", {}).get("Message")))
+        raise ValueError("S3 file upload failed.")
+
+    try:
+        copied_parts = _copy_parts(
+            client=client,
+            bucket_name=bucket_name,
+            key=key,
+            upload_id=upload_id,
+            source=previous,
+            source_size=previous_size,
+        )
+        appended_parts = _upload_parts(
+            client=client,
+            bucket_name=bucket_name,
+            key=key,
+            upload_id=upload_id,
+            parts=_stream_parts(
+                first_part=_read_part(data=data, part_size=part_size),
+                data=data,
+                part_size=part_size,
+                first_part_number=len(copied_parts) + 1,
+            ),
+            max_in_flight_parts=max_in_flight_parts,
+        )
+        response = client.complete_multipart_upload(
+            Bucket=bucket_name,
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={"Parts": copied_parts + appended_parts},
+        )
+        logger.info(
+            f"Completed multipart upload of {len(copied_parts)} copied and {len(appended_parts)} uploaded part(s) "
+            f"into s3://{bucket_name}/{key}"
+        )
+        return BucketItem(key=key, etag=response.get("ETag"))
+    except (ClientError, OSError) as e:
+        message = e.response.get("Error", {}).get("Message") if isinstance(e, ClientError) else str(e)
+        logger.exception("Unable to append to file in S3 using multipart upload: %s" % message)
+        _abort_multipart_upload(client=client, bucket_name=bucket_name, key=key, upload_id=upload_id)
+        raise ValueError("S3 file upload failed.")
+    except BaseException:
+        # e.g. the source stream failing with an SSH error, the upload must not be left behind incomplete
+        logger.exception(f"Aborting multipart upload into s3://{bucket_name}/{key}.")
+        _abort_multipart_upload(client=client, bucket_name=bucket_name, key=key, upload_id=upload_id)
+        raise
+
+
+def _copy_parts(
+    client: BaseClient, bucket_name: str, key: str, upload_id: str, source: BucketItem, source_size: int
+) -> List[Dict[str, typing.Any]]:
+    """Copies the source object into the first parts of a multipart upload, in evenly sized parts of at most
+    MULTIPART_UPLOAD_MAX_COPY_PART_SIZE bytes."""
+    parts = -(-source_size // MULTIPART_UPLOAD_MAX_COPY_PART_SIZE)
+    copy_part_size = -(-source_size // parts)
+    condition = {"CopySourceIfMatch": source.etag} if source.etag else {}
+
+    completed_parts: List[Dict[str, typing.Any]] = []
+    for part_number, start in enumerate(range(0, source_size, copy_part_size), start=1):
+        end = min(start + copy_part_size, source_size) - 1
+        response = client.upload_part_copy(
+            Bucket=bucket_name,
+            Key=key,
+            UploadId=upload_id,
+            PartNumber=part_number,
+            CopySource={"Bucket": bucket_name, "Key": source.key},
+            CopySourceRange=f"bytes={start}-{end}",
+            **condition,
+        )
+        completed_parts.append({"ETag": response["CopyPartResult"]["ETag"], "PartNumber": part_number})
+    return completed_parts
+
+
+def upload_parts(
+    client: BaseClient,
+    bucket_name: str,
+    key: str,
+    parts: Iterable[UploadPart],
+    max_in_flight_parts: int = MULTIPART_UPLOAD_DEFAULT_MAX_IN_FLIGHT_PARTS,
+) -> BucketItem:
+    """Uploads an object whose parts are produced elsewhere, e.g. by parallel readers, using a multipart upload. Parts
+    may arrive in any order, each carries its part number and the SHA-256 of its content, which S3 verifies before
+    accepting the part. All parts but the last one need to be at least MULTIPART_UPLOAD_MIN_PART_SIZE bytes.
+
+    Args:
+        client (BaseClient): the boto3 client to use for accessing S3
+        bucket_name (str): the name of an existing S3 bucket
+        key (str): the desired object key in the bucket
+        parts (Iterable[UploadPart]): part number, content and SHA-256 digest of each part
+        max_in_flight_parts (int, optional): number of parts being uploaded concurrently while waiting for the next
+            one. Defaults to MULTIPART_UPLOAD_DEFAULT_MAX_IN_FLIGHT_PARTS.
+
+    Raises:
+        ValueError: if producing or uploading a part failed
+
+    Returns:
+        BucketItem: the `BucketItem` wrapping the uploaded object
+    """
+    logger.info(f"About to upload file into S3 using multipart upload. Bucket: {bucket_name}, Key: {key}")
+    try:
+        upload_id = client.create_multipart_upload(Bucket=bucket_name, Key=key, ChecksumAlgorithm="SHA256")["UploadId"]
+    except ClientError as e:
+        logger.exception("Unable to start multipart upload: %s" % (e.response.get("Error", {}).get("Message")))
+        raise ValueError("S3 file upload failed.")
+
+    try:
+        completed_parts = sorted(
+            _upload_parts(
+                client=client,
+                bucket_name=bucket_name,
+                key=key,
+                upload_id=upload_id,
+                parts=parts,
+                max_in_flight_parts=max_in_flight_parts,
+            ),
+            key=lambda part: part["PartNumber"],
+        )
+        response = client.complete_multipart_upload(
+            Bucket=bucket_name, Key=key, UploadId=upload_id, MultipartUpload={"Parts": completed_parts}
+        )
+        logger.info(f"Completed multipart upload of {len(completed_parts)} part(s) into s3://{bucket_name}/{key}")
+        return BucketItem(key=key, etag=response.get("ETag"))
+    except (ClientError, OSError, ValueError) as e:
+        message = e.response.get("Error", {}).get("Message") if isinstance(e, ClientError) else str(e)
+        logger.exception("Unable to upload file into S3 using multipart upload: %s" % message)
+        _abort_multipart_upload(client=client, bucket_name=bucket_name, key=key, upload_id=upload_id)
+        raise ValueError("S3 file upload failed.")
+    except BaseException:
+        # e.g. the source stream failing with an SSH error, the upload must not be left behind incomplete
+        logger.exception(f"Aborting multipart upload into s3://{bucket_name}/{key}.")
+        _abort_multipart_upload(client=client, bucket_name=bucket_name, key=key, upload_id=upload_id)
+        raise
+
+
+def _upload_parts(
+    client: BaseClient,
+    bucket_name: str,
+    key: str,
+    upload_id: str,
+    parts: Iterable[UploadPart],
+    max_in_flight_parts: int,
+) -> List[Dict[str, typing.Any]]:
+    def upload_part(part_number: int, body: bytes, sha256: Optional[bytes]) -> Dict[str, typing.Any]:
+        checksum = {"ChecksumSHA256": base64.b64encode(sha256).decode("ascii")} if sha256 else {}
+        response = client.upload_part(
+            Bucket=bucket_name, Key=key, UploadId=upload_id, PartNumber=part_number, Body=body, **checksum
+        )
+        return {"ETag": response["ETag"], "PartNumber": part_number, **checksum}
+
+    completed_parts: List[Dict[str, typing.Any]] = []
+    in_flight: List[Future] = []
+    with ThreadPoolExecutor(max_workers=max(1, max_in_flight_parts)) as executor:
+        # parts are produced lazily, waiting for the oldest part before taking the next one keeps memory bounded
+        for part_number, body, sha256 in parts:
+            if len(in_flight) >= max(1, max_in_flight_parts):
+                completed_parts.append(in_flight.pop(0).result())
+            in_flight.append(executor.submit(upload_part, part_number, body, sha256))
+
+        completed_parts.extend(future.result() for future in in_flight)
+
+    return completed_parts
+
+
+def _stream_parts(
+    first_part: bytes, data: typing.IO[bytes], part_size: int, first_part_number: int = 1
+) -> Iterator[UploadPart]:
+    """Yields the given first part followed by the remainder of the stream in parts of `part_size` bytes."""
+    part_number = first_part_number
+    part = first_part
+    while part:
+        yield part_number, part, None
+        part_number += 1
+        part = _read_part(data=data, part_size=part_size)
+
+
+def _read_part(data: typing.IO[bytes], part_size: int) -> bytes:
+    """Reads up to `part_size` bytes from the given stream, tolerating streams that return short reads."""
+    buffer = bytearray()
+    while len(buffer) < part_size:
+        chunk = data.read(part_size - len(buffer))
+        if not chunk:
+            break
+        buffer += chunk
+    return bytes(buffer)
+
+
+def _abort_multipart_upload(client: BaseClient, bucket_name: str, key: str, upload_id: str) -> None:
+    try:
+        client.abort_multipart_upload(Bucket=bucket_name, Key=key, UploadId=upload_id)
+    except ClientError as e:
+        logger.exception(
+            "Unable to abort multipart upload %s: %s" % (upload_id, e.response.get("Error", {}).get("Message"))
+        )
+    except Exception:
+        # aborting is best effort, the failure that led to it must not be masked
+        logger.exception(f"Unable to abort multipart upload {upload_id}.")
+
+
 def delete_objects(client: BaseClient, bucket_name: str, items: List[BucketItem]) -> None:
     """Deletes the given `items` from the S3 bucket having the specified `bucket_name`. Only a limited
     number items can be deleted at a time, see DELETE_OBJECTS_CHUNK_SIZE.
@@ -61,9 +503,17 @@ def delete_objects(client: BaseClient, bucket_name: str, items: List[BucketItem]
 
 
 def copy_object(
-    client: BaseClient, source_bucket_name: str, source_key: str, destination_bucket_name: str, destination_key: str
+    client: BaseClient,
+    source_bucket_name: str,
+    source_key: str,
+    destination_bucket_name: str,
+    destination_key: str,
+    size: Optional[int] = None,
+    multipart_threshold: int = COPY_OBJECT_MAX_SIZE,
 ) -> BucketItem:
-    """Returns a list of items that are contained in the S3 bucket having the specified bucket name.
+    """Copies an object within S3 without downloading it. Objects are copied using a plain `CopyObject`, which S3
+    only allows for objects of up to 5 GB. Objects known to be larger than `multipart_threshold`, or rejected by
+    `CopyObject` for their size, are copied in concurrent `UploadPartCopy` parts instead.
 
     Args:
         client (BaseClient): the boto3 client to use for accessing S3
@@ -71,6 +521,12 @@ def copy_object(
         source_key (str): the object key in the source bucket
         destination_bucket_name (str): the name of an existing S3 bucket to which to copy the file to
         destination_key (str): the desired object key in the destination bucket
+        size (Optional[int], optional): the size of the source object in bytes, if known. Defaults to None.
+        multipart_threshold (int, optional): size in bytes from which on objects of known size are copied in parts.
+            Defaults to COPY_OBJECT_MAX_SIZE.
+
+    Raises:
+        ValueError: if copying the object failed
 
     Returns:
         BucketItem: the `BucketItem` wrapping the destination item
@@ -78,15 +534,157 @@ def copy_object(
     logger.info(
         f"About to copy file from: s3://{source_bucket_name}/{source_key} to s3://{destination_bucket_name}/{destination_key}"
     )
+    if size is not None and size > multipart_threshold:
+        return _copy_object_in_parts(
+            client=client,
+            source_bucket_name=source_bucket_name,
+            source_key=source_key,
+            destination_bucket_name=destination_bucket_name,
+            destination_key=destination_key,
+        )
+
     try:
         copy_source = {"Bucket": source_bucket_name, "Key": source_key}
         client.copy_object(CopySource=copy_source, Bucket=destination_bucket_name, Key=destination_key)
         return BucketItem(key=destination_key)
     except ClientError as e:
+        # S3 rejects copying objects larger than 5 GB as an invalid request
+        if e.response.get("Error", {}).get("Code") == "InvalidRequest" and size is None:
+            logger.info("Copy rejected, copying in parts if too large: %s" % e.response.get("Error", {}).get("Message"))
+            return _copy_object_in_parts(
+                client=client,
+                source_bucket_name=source_bucket_name,
+                source_key=source_key,
+                destination_bucket_name=destination_bucket_name,
+                destination_key=destination_key,
+                min_size=COPY_OBJECT_MAX_SIZE + 1,
+            )
         logger.exception("Unable to copy file in S3: %s" % (e.response.get("Error", {}).get("Message")))
         raise ValueError("Copying S3 object failed.")
 
 
+def copy_objects(
+    client: BaseClient, copies: Iterable[ObjectCopy], concurrency: int = COPY_OBJECTS_DEFAULT_CONCURRENCY
+) -> List[CopyResult]:
+    """Copies objects within S3 using `copy_object` on up to `concurrency` threads. Copies are started as the given
+    iterable is consumed, at most `concurrency` of them ahead of the oldest one still running. A failing copy does not
+    stop the others.
+
+    Args:
+        client (BaseClient): the boto3 client to use for accessing S3
+        copies (Iterable[ObjectCopy]): the copies to make
+        concurrency (int, optional): number of copies made concurrently. Defaults to
+            COPY_OBJECTS_DEFAULT_CONCURRENCY.
+
+    Returns:
+        List[CopyResult]: the result of every copy, in the order of `copies`
+    """
+
+    def copy(object_copy: ObjectCopy) -> CopyResult:
+        try:
+            item = copy_object(
+                client=client,
+                source_bucket_name=object_copy.source_bucket_name,
+                source_key=object_copy.source_key,
+                destination_bucket_name=object_copy.destination_bucket_name,
+                destination_key=object_copy.destination_key,
+                size=object_copy.size,
+            )
+            return CopyResult(copy=object_copy, item=item)
+        except ValueError as e:
+            return CopyResult(copy=object_copy, error=str(e))
+
+    results: List[CopyResult] = []
+    in_flight: Deque[Future] = deque()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        for object_copy in copies:
+            if len(in_flight) >= max(1, concurrency):
+                results.append(in_flight.popleft().result())
+            in_flight.append(executor.submit(copy, object_copy))
+        results.extend(future.result() for future in in_flight)
+
+    failed = sum(1 for result in results if result.error)
+    logger.info(f"Copied {len(results) - failed} object(s), {failed} failed, using {concurrency} thread(s).")
+    return results
+
+
+def _copy_object_in_parts(
+    client: BaseClient,
+    source_bucket_name: str,
+    source_key: str,
+    destination_bucket_name: str,
+    destination_key: str,
+    min_size: int = 0,
+    part_size: int = MULTIPART_COPY_DEFAULT_PART_SIZE,
+    max_in_flight_parts: int = MULTIPART_COPY_DEFAULT_MAX_IN_FLIGHT_PARTS,
+) -> BucketItem:
+    """Copies an object using a multipart upload whose parts are copied from ranges of the source object. The parts
+    are pinned to the ETag of the source object, and metadata and content type are carried over like `CopyObject`
+    does. Objects smaller than `min_size` are not copied."""
+    try:
+        head = client.head_object(Bucket=source_bucket_name, Key=source_key)
+    except ClientError as e:
+        logger.exception("Unable to copy file in S3: %s" % (e.response.get("Error", {}).get("Message")))
+        raise ValueError("Copying S3 object failed.")
+
+    size = head["ContentLength"]
+    if size < min_size:
+        logger.error(f"Unable to copy s3://{source_bucket_name}/{source_key} of {size} bytes.")
+        raise ValueError("Copying S3 object failed.")
+
+    part_size = max(part_size, -(-size // MULTIPART_UPLOAD_MAX_PARTS))
+    logger.info(
+        f"Copying {size} bytes in parts of {part_size} bytes into s3://{destination_bucket_name}/{destination_key}"
+    )
+    try:
+        upload_id = client.create_multipart_upload(
+            Bucket=destination_bucket_name,
+            Key=destination_key,
+            **({"Metadata": head["Metadata"]} if head.get("Metadata") else {}),
+            **({"ContentType": head["ContentType"]} if head.get("ContentType") else {}),
+        )["UploadId"]
+    except ClientError as e:
+        logger.exception("Unable to start multipart upload: %s" % (e.response.get("Error", {}).get("Message")))
+        raise ValueError("Copying S3 object failed.")
+
+    def copy_part(part_number: int, start: int) -> Dict[str, typing.Any]:
+        response = client.upload_part_copy(
+            Bucket=destination_bucket_name,
+            Key=destination_key,
+            UploadId=upload_id,
+            PartNumber=part_number,
+            CopySource={"Bucket": source_bucket_name, "Key": source_key},
+            CopySourceRange=f"bytes={start}-{min(start + part_size, size) - 1}",
+            CopySourceIfMatch=head["ETag"],
+        )
+        return {"ETag": response["CopyPartResult"]["ETag"], "PartNumber": part_number}
+
+    try:
+        starts = range(0, size, part_size)
+        with ThreadPoolExecutor(max_workers=max(1, max_in_flight_parts)) as executor:
+            completed_parts = list(executor.map(copy_part, range(1, len(starts) + 1), starts))
+        response = client.complete_multipart_upload(
+            Bucket=destination_bucket_name,
+            Key=destination_key,
+            UploadId=upload_id,
+            MultipartUpload={"Parts": completed_parts},
+        )
+        return BucketItem(key=destination_key, etag=response.get("ETag"))
+    except ClientError as e:
+        logger.exception("Unable to copy file in S3 in parts: %s" % (e.response.get("Error", {}).get("Message")))
+        _abort_multipart_upload(
+            client=client, bucket_name=destination_bucket_name, key=destination_key, upload_id=upload_id
+        )
+        raise ValueError("Copying S3 object failed.")
+    except BaseException:
+        # e.g. a connection error while copying a part, the upload must not be left behind incomplete
+        logger.exception(f"Aborting multipart copy into s3://{destination_bucket_name}/{destination_key}.")
+        _abort_multipart_upload(
+            client=client, bucket_name=destination_bucket_name, key=destination_key, upload_id=upload_id
+        )
+        raise
+
+
 def get_object(client: BaseClient, bucket_name: str, object_key: str) -> typing.BinaryIO:
     """Fetches and returns an existing object from S3.
 
@@ -106,39 +704,229 @@ def get_object(client: BaseClient, bucket_name: str, object_key: str) -> typing.
         raise ValueError("Getting S3 object failed.")
 
 
-def list_bucket(
-    client: BaseClient, bucket_name: str, prefix: str = "", page_size: int = PAGINATOR_DEFAULT_PAGE_SIZE
-) -> List[BucketItem]:
-    """Returns a list of items that are contained in the S3 bucket having the specified bucket name.
+def iter_bucket(
+    client: BaseClient,
+    bucket_name: str,
+    prefix: str = "",
+    page_size: int = PAGINATOR_DEFAULT_PAGE_SIZE,
+    start_after: Optional[str] = None,
+    end_before: Optional[str] = None,
+    delimiter: Optional[str] = None,
+) -> Iterator[BucketItem]:
+    """Yields the items contained in the S3 bucket having the specified bucket name in lexicographical order of their
+    keys. Pages are fetched as the items are consumed, so callers can start working on the first page right away and
+    no further pages are fetched once they stop iterating.
 
     Args:
         client (BaseClient): the boto3 client to use for accessing S3
         bucket_name (str): the name of an existing S3 bucket
         prefix (str, optional): only objects under the specified path prefix will be listed
         page_size (int, optional): number of items to fetch per page. Defaults to PAGINATOR_DEFAULT_PAGE_SIZE.
+        start_after (Optional[str], optional): only objects with keys following this key will be listed. Defaults
+            to None.
+        end_before (Optional[str], optional): only objects with keys preceding this key will be listed, listing
+            stops at the first key reaching it. Defaults to None.
+        delimiter (Optional[str], optional): rolls up the keys containing the delimiter after the prefix into common
+            prefixes, which are yielded as items ending in the delimiter without a modification time. Defaults to
+            None.
 
-    Returns:
-        List[BucketItem]: complete list of items contained in the bucket
+    Raises:
+        ValueError: if the bucket cannot be listed
+
+    Yields:
+        Iterator[BucketItem]: the items contained in the bucket
     """
-    logger.info(f"About to list all objects in bucket {bucket_name}, fetching {page_size} item(s) per page.")
+    logger.info(f"About to list objects in bucket {bucket_name}, fetching {page_size} item(s) per page.")
+    listed = 0
+    parameters = {
+        "Bucket": bucket_name,
+        "Prefix": prefix,
+        **({"StartAfter": start_after} if start_after else {}),
+        **({"Delimiter": delimiter} if delimiter else {}),
+    }
     try:
         paginator = client.get_paginator("list_objects_v2")
-
-        results = []
-        pagination_config = {"PageSize": page_size}
-        for i, page in enumerate(
-            paginator.paginate(Bucket=bucket_name, Prefix=prefix, PaginationConfig=pagination_config)
-        ):
+        for i, page in enumerate(paginator.paginate(**parameters, PaginationConfig={"PageSize": page_size})):
             if page["KeyCount"] == 0:
-                logger.info(f"Pagination finished at page {i}. Found {len(results)} object(s).")
-                break
+                logger.info(f"Pagination finished at page {i}. Found {listed} object(s).")
+                return
 
-            pg_content = page["Contents"]
-            results = results + [BucketItem(key=item["Key"], last_modified=item["LastModified"]) for item in pg_content]
+            items = [
+                BucketItem(key=item["Key"], last_modified=item["LastModified"]) for item in page.get("Contents", [])
+            ]
+            if delimiter:
+                items += [BucketItem(key=common["Prefix"]) for common in page.get("CommonPrefixes", [])]
+                items.sort(key=lambda item: item.key)
 
-        return results
+            for item in items:
+                if end_before is not None and item.key >= end_before:
+                    logger.info(f"Listing reached {end_before} at page {i}. Found {listed} object(s).")
+                    return
+                listed += 1
+                yield item
     except ClientError as e:
         logger.exception(
             "Unable to list objects in bucket %s: %s" % (bucket_name, e.response.get("Error", {}).get("Message"))
         )
         raise ValueError("Unable to list existing items in AWS S3.")
+
+
+def list_bucket(
+    client: BaseClient, bucket_name: str, prefix: str = "", page_size: int = PAGINATOR_DEFAULT_PAGE_SIZE
+) -> List[BucketItem]:
+    """Returns a list of items that are contained in the S3 bucket having the specified bucket name. Prefer
+    `iter_bucket` unless all items are needed at once.
+
+    Args:
+        client (BaseClient): the boto3 client to use for accessing S3
+        bucket_name (str): the name of an existing S3 bucket
+        prefix (str, optional): only objects under the specified path prefix will be listed
+        page_size (int, optional): number of items to fetch per page. Defaults to PAGINATOR_DEFAULT_PAGE_SIZE.
+
+    Raises:
+        ValueError: if the bucket cannot be listed
+
+    Returns:
+        List[BucketItem]: complete list of items contained in the bucket
+    """
+    return list(iter_bucket(client=client, bucket_name=bucket_name, prefix=prefix, page_size=page_size))
+
+
+def iter_bucket_sharded(
+    client: BaseClient,
+    bucket_name: str,
+    prefix: str = "",
+    delimiter: str = "/",
+    max_depth: int = SHARDED_LISTING_DEFAULT_MAX_DEPTH,
+    concurrency: int = SHARDED_LISTING_DEFAULT_CONCURRENCY,
+    page_size: int = PAGINATOR_DEFAULT_PAGE_SIZE,
+) -> Iterator[BucketItem]:
+    """Yields the items contained in the S3 bucket having the specified bucket name in lexicographical order of their
+    keys, like `iter_bucket`, but lists sub-prefixes concurrently. Sub-prefixes are discovered by listing up to
+    `max_depth` levels below `prefix` using `delimiter`, e.g. the years in `<peer>/<year>/<file>`, until there are at
+    least `concurrency` of them. Every sub-prefix is then listed as a shard of its own. As shards cover disjoint
+    ranges of keys, yielding them in the order they were discovered keeps the items in key order. At most
+    `concurrency` shards are listed ahead of the consumer, each being held in memory until it has been consumed.
+
+    Args:
+        client (BaseClient): the boto3 client to use for accessing S3
+        bucket_name (str): the name of an existing S3 bucket
+        prefix (str, optional): only objects under the specified path prefix will be listed
+        delimiter (str, optional): separates the levels of object keys. Defaults to "/".
+        max_depth (int, optional): number of levels to look for sub-prefixes in. Defaults to
+            SHARDED_LISTING_DEFAULT_MAX_DEPTH.
+        concurrency (int, optional): number of shards listed concurrently. Defaults to
+            SHARDED_LISTING_DEFAULT_CONCURRENCY.
+        page_size (int, optional): number of items to fetch per page. Defaults to PAGINATOR_DEFAULT_PAGE_SIZE.
+
+    Raises:
+        ValueError: if the bucket cannot be listed
+
+    Yields:
+        Iterator[BucketItem]: the items contained in the bucket
+    """
+    concurrency = max(1, concurrency)
+
+    def list_shard(shard: str) -> List[BucketItem]:
+        return list(iter_bucket(client=client, bucket_name=bucket_name, prefix=shard, page_size=page_size))
+
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    try:
+        entries = _discover_shards(
+            client=client,
+            executor=executor,
+            bucket_name=bucket_name,
+            prefix=prefix,
+            delimiter=delimiter,
+            max_depth=max_depth,
+            concurrency=concurrency,
+            page_size=page_size,
+        )
+        shards = sum(1 for entry in entries if isinstance(entry, str))
+        logger.info(f"Listing {shards} shard(s) of {bucket_name} under '{prefix}' using {concurrency} thread(s).")
+
+        # shards are submitted in key order as the consumer catches up, which bounds the shards held in memory
+        pending: Deque[Union[BucketItem, Future]] = deque()
+        in_flight = 0
+        for entry in entries:
+            if isinstance(entry, str):
+                while in_flight >= concurrency:
+                    head = pending.popleft()
+                    if isinstance(head, Future):
+                        in_flight -= 1
+                        yield from head.result()
+                    else:
+                        yield head
+                pending.append(executor.submit(list_shard, entry))
+                in_flight += 1
+            else:
+                pending.append(entry)
+
+        for head in pending:
+            if isinstance(head, Future):
+                yield from head.result()
+            else:
+                yield head
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def list_bucket_sharded(
+    client: BaseClient,
+    bucket_name: str,
+    prefix: str = "",
+    delimiter: str = "/",
+    max_depth: int = SHARDED_LISTING_DEFAULT_MAX_DEPTH,
+    concurrency: int = SHARDED_LISTING_DEFAULT_CONCURRENCY,
+    page_size: int = PAGINATOR_DEFAULT_PAGE_SIZE,
+) -> List[BucketItem]:
+    """Returns the items contained in the S3 bucket having the specified bucket name sorted by their keys, listing
+    sub-prefixes concurrently. See `iter_bucket_sharded` for the arguments.
+
+    Raises:
+        ValueError: if the bucket cannot be listed
+
+    Returns:
+        List[BucketItem]: complete list of items contained in the bucket, sorted by key
+    """
+    return list(
+        iter_bucket_sharded(
+            client=client,
+            bucket_name=bucket_name,
+            prefix=prefix,
+            delimiter=delimiter,
+            max_depth=max_depth,
+            concurrency=concurrency,
+            page_size=page_size,
+        )
+    )
+
+
+def _discover_shards(
+    client: BaseClient,
+    executor: ThreadPoolExecutor,
+    bucket_name: str,
+    prefix: str,
+    delimiter: str,
+    max_depth: int,
+    concurrency: int,
+    page_size: int,
+) -> List[Union[BucketItem, str]]:
+    """Returns the objects and sub-prefixes (as strings) below `prefix` in key order, descending into sub-prefixes
+    level by level until there are enough of them to keep `concurrency` threads busy."""
+
+    def list_level(shard: str) -> List[Union[BucketItem, str]]:
+        items = iter_bucket(
+            client=client, bucket_name=bucket_name, prefix=shard, page_size=page_size, delimiter=delimiter
+        )
+        # common prefixes are the only items without a modification time
+        return [item.key if item.last_modified is None else item for item in items]
+
+    entries: List[Union[BucketItem, str]] = [prefix]
+    for _ in range(max_depth):
+        shards = [entry for entry in entries if isinstance(entry, str)]
+        if not shards or len(shards) >= concurrency:
+            break
+        levels = iter(executor.map(list_level, shards))
+        entries = [item for entry in entries for item in (next(levels) if isinstance(entry, str) else [entry])]
+    return entries
@@ -1,8 +1,10 @@
 import os
 import re
+import threading
+import time
 import uuid
 from datetime import datetime
-from typing import Any, Dict, List, Tuple, Optional
+from typing import Any, Dict, Iterator, List, Tuple, Optional
 
 import pytest
 from aws_lambda_typing import context as ctx
@@ -13,7 +15,8 @@ from admin_tasks.entities.admin_task import AdminTask
 from admin_tasks.entities.backfill_categories import BackfillCategories
 from test_utils.entities.aws_stubs import AwsStubs
 from test_utils.fixtures import Fixtures
-from utils.s3 import PAGINATOR_DEFAULT_PAGE_SIZE
+from utils.listing_index import ListingIndex
+from utils.s3 import PAGINATOR_DEFAULT_PAGE_SIZE, BucketItem
 
 peer = "bank1"
 
@@ -33,6 +36,11 @@ current_year = str(current_datetime.year)
 
 class Test_Admin_Tasks_Handler:
 
+    @pytest.fixture(autouse=True)
+    def sequential_copies(self, monkeypatch: pytest.MonkeyPatch):
+        # stubbed responses are consumed in order, which concurrent copies would not keep to
+        monkeypatch.setenv("COPY_CONCURRENCY", "1")
+
     @pytest.mark.unit
     def test_should_successfully_backfill_categories(self, aws_stubs: AwsStubs, monkeypatch: pytest.MonkeyPatch):
         monkeypatch.setenv("BUCKET_NAME_INCOMING", bucket_name_incoming)
@@ -323,6 +331,65 @@ class Test_Admin_Tasks_Handler:
         }
         aws_stubs.s3.assert_no_pending_responses()
 
+    @pytest.mark.unit
+    def test_should_limit_concurrent_categorizations_and_transformations(self, aws_stubs: AwsStubs, monkeypatch: pytest.MonkeyPatch, mocker):
+        monkeypatch.setenv("BUCKET_NAME_INCOMING", bucket_name_incoming)
+        monkeypatch.setenv("BUCKET_NAME_CATEGORIZED", bucket_name_categorized)
+        monkeypatch.setenv("BUCKET_NAME_BACKFILL_CATEGORIES_TEMP", bucket_name_backfill_categories_temp)
+        monkeypatch.setenv("PEERS_JSON_UNDER_TEST", Fixtures.peer_config(
+            peer=peer,
+            categories=[{"category_id": category1_id, "filename_patterns": ["Transaction_\\d.csv"],
+                         "transformations": ["SomeTransformer"]}]
+        ))
+        monkeypatch.setenv("COPY_CONCURRENCY", "4")
+        monkeypatch.setenv("TRANSFORM_CONCURRENCY", "1")
+
+        incoming_listing = [
+            {"Key": f"{peer}/2023/Transaction_{n}.csv", "LastModified": datetime.fromisoformat("2021-11-30T12:58:05+00:00")}
+            for n in range(8)
+        ]
+        self._set_stubs_happy_path(aws_stubs=aws_stubs, request_id="unused", categorize_listing=[],
+                                   incoming_listing=incoming_listing)
+
+        lock = threading.Lock()
+        transforming = {"now": 0, "max": 0}
+        items = {"taken": 0, "done": 0, "max_pending": 0}
+
+        def transform(object_key: str, transformation_slots: threading.Semaphore, **_: Any) -> List[Dict[str, Any]]:
+            with transformation_slots:
+                with lock:
+                    transforming["now"] += 1
+                    transforming["max"] = max(transforming["max"], transforming["now"])
+                time.sleep(0.01)
+                with lock:
+                    transforming["now"] -= 1
+                    items["done"] += 1
+            return [{"file_name": os.path.basename(object_key)}]
+
+        iterate_index = ListingIndex.__iter__
+
+        def take_items(index: ListingIndex) -> Iterator[BucketItem]:
+            for item in iterate_index(index):
+                with lock:
+                    items["taken"] += 1
+                    items["max_pending"] = max(items["max_pending"], items["taken"] - items["done"])
+                yield item
+
+        mocker.patch("admin_tasks.app.attempt_categorisation_and_transformation", side_effect=transform)
+        mocker.patch.object(ListingIndex, "__iter__", take_items)
+
+        response = handler(
+            event=AdminTask(name="backfill_categories", task=BackfillCategories(peer_id=peer)).to_dict(),
+            context=ctx.Context(),
+            test_context=aws_stubs.test_context(current_datetime=current_datetime)
+        )
+
+        assert response["body"]["categorized"] == [{"file_name": f"Transaction_{n}.csv"} for n in range(8)]
+        assert transforming["max"] == 1
+        # the index is consumed as categorizations complete, one item beyond those in flight
+        assert items["max_pending"] <= 4 + 1
+        aws_stubs.s3.assert_no_pending_responses()
+
     @pytest.mark.unit
     def test_should_handle_list_errors(self, aws_stubs: AwsStubs, monkeypatch: pytest.MonkeyPatch):
         monkeypatch.setenv("BUCKET_NAME_INCOMING", bucket_name_incoming)
@@ -554,7 +621,8 @@ class Test_Admin_Tasks_Handler:
                     'Bucket': bucket_name_categorized,
                     'Prefix': peer,
 
-                    "MaxKeys": PAGINATOR_DEFAULT_PAGE_SIZE
+                    "MaxKeys": PAGINATOR_DEFAULT_PAGE_SIZE,
+                    "Delimiter": "/"
                 },
                 service_response={
                     "KeyCount": len(list_objects_response),
@@ -604,7 +672,8 @@ class Test_Admin_Tasks_Handler:
                     'Bucket': bucket_name_categorized,
                     'Prefix': peer,
 
-                    "MaxKeys": PAGINATOR_DEFAULT_PAGE_SIZE
+                    "MaxKeys": PAGINATOR_DEFAULT_PAGE_SIZE,
+                    "Delimiter": "/"
                 },
                 service_response={
                     "KeyCount": 0
@@ -628,7 +697,8 @@ class Test_Admin_Tasks_Handler:
                 'Bucket': bucket_name_incoming,
                 'Prefix': peer,
 
-                "MaxKeys": PAGINATOR_DEFAULT_PAGE_SIZE
+                "MaxKeys": PAGINATOR_DEFAULT_PAGE_SIZE,
+                "Delimiter": "/"
             },
             service_response=list_incoming_response
         )
@@ -688,7 +758,8 @@ class Test_Admin_Tasks_Handler:
                 'Bucket': bucket_name_categorized,
                 'Prefix': peer,
 
-                "MaxKeys": PAGINATOR_DEFAULT_PAGE_SIZE
+                "MaxKeys": PAGINATOR_DEFAULT_PAGE_SIZE,
+                "Delimiter": "/"
             },
             service_response={
                 "KeyCount": len(categorize_listing),
@@ -729,7 +800,8 @@ class Test_Admin_Tasks_Handler:
                 'Bucket': bucket_name_categorized,
                 'Prefix': peer,
 
-                "MaxKeys": PAGINATOR_DEFAULT_PAGE_SIZE
+                "MaxKeys": PAGINATOR_DEFAULT_PAGE_SIZE,
+                "Delimiter": "/"
             },
             service_response={
                 "KeyCount": len(categorize_listing),
@@ -203,7 +203,8 @@ class Test_Admin_Tasks_Handler:
                 'Bucket': bucket_name_upload,
                 'Prefix': peer,
 
-                "MaxKeys": PAGINATOR_DEFAULT_PAGE_SIZE
+                "MaxKeys": PAGINATOR_DEFAULT_PAGE_SIZE,
+                "Delimiter": "/"
             },
             service_response={
                 "KeyCount": len(upload_listing),
@@ -0,0 +1,57 @@
+from datetime import datetime
+
+import pytest
+from aws_lambda_typing import context as ctx
+from botocore.stub import ANY
+
+from admin_tasks.app import handler
+from admin_tasks.entities.admin_task import AdminTask
+from admin_tasks.entities.rebuild_pull_manifest import RebuildPullManifest
+from test_utils.entities.aws_stubs import AwsStubs
+from utils.pull_manifest import pull_manifest_key
+from utils.s3 import PAGINATOR_DEFAULT_PAGE_SIZE
+
+peer = "bank1"
+
+bucket_name_upload = "upload_bucket_name"
+bucket_name_pull_state = "pull_state_bucket_name"
+
+
+class Test_Admin_Tasks_Rebuild_Pull_Manifest:
+
+    @pytest.mark.unit
+    def test_should_rebuild_pull_manifest_from_upload_bucket(self, aws_stubs: AwsStubs, monkeypatch: pytest.MonkeyPatch):
+        monkeypatch.setenv("BUCKET_NAME_UPLOAD", bucket_name_upload)
+        monkeypatch.setenv("BUCKET_NAME_PULL_STATE", bucket_name_pull_state)
+
+        aws_stubs.s3.add_response(
+            method="list_objects_v2",
+            expected_params={"Bucket": bucket_name_upload, "Prefix": f"{peer}/", "MaxKeys": PAGINATOR_DEFAULT_PAGE_SIZE},
+            service_response={
+                "KeyCount": 2,
+                "Contents": [
+                    {"Key": f"{peer}/a.csv", "LastModified": datetime.fromisoformat("2023-10-13T12:00:00+00:00")},
+                    {"Key": f"{peer}/folder/a.csv", "LastModified": datetime.fromisoformat("2023-10-13T12:00:00+00:00")},
+                ],
+            },
+        )
+        aws_stubs.s3.add_client_error(method="get_object", service_error_code="NoSuchKey", http_status_code=404)
+        aws_stubs.s3.add_response(
+            method="put_object",
+            expected_params={
+                "Bucket": bucket_name_pull_state, "Key": pull_manifest_key(peer_id=peer), "Body": ANY, "IfNoneMatch": "*"
+            },
+            service_response={"ETag": '"v1"'},
+        )
+
+        response = handler(
+            event=AdminTask(name="rebuild_pull_manifest", task=RebuildPullManifest(peer_id=peer)).to_dict(),
+            context=ctx.Context(),
+            test_context=aws_stubs.test_context(),
+        )
+        assert response == {
+            "statusCode": 200,
+            "headers": {},
+            "body": {"rebuilt": {"peer_id": peer, "files": 2}},
+        }
+        aws_stubs.s3.assert_no_pending_responses()
@@ -0,0 +1,169 @@
+import logging
+import os
+import resource
+import threading
+import time
+import typing
+from dataclasses import dataclass
+from typing import Callable, List
+
+import pytest
+
+from test_utils.fixtures import Fixtures
+from test_utils.local_s3 import LocalS3Client
+from test_utils.local_sftp_server import LocalSftpServer
+from utils.s3 import upload_stream
+from utils.sftp import SftpFileItem, download_new_files
+
+logger = logging.getLogger()
+
+# round trip time injected between client and server, e.g. BENCHMARK_RTT_MS=40 to resemble a distant peer
+ROUND_TRIP_TIME = float(os.environ.get("BENCHMARK_RTT_MS", "0")) / 1000
+DOWNLOAD_CONCURRENCY = int(os.environ.get("BENCHMARK_DOWNLOAD_CONCURRENCY", "4"))
+BUCKET_NAME = "upload"
+# random content does not compress, in case the transport profile enables compression
+BLOCK = os.urandom(1024 * 1024)
+
+
+def _write(path: str, size: int) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        for offset in range(0, size, len(BLOCK)):
+            f.write(BLOCK[:min(len(BLOCK), size - offset)])
+
+
+def _many_tiny_files(root: str) -> None:
+    for folder in range(20):
+        for n in range(100):
+            _write(os.path.join(root, f"folder-{folder}", f"{n}.csv"), 1024)
+
+
+def _few_huge_files(root: str) -> None:
+    for n in range(3):
+        _write(os.path.join(root, f"{n}.csv"), 32 * 1024 * 1024)
+
+
+def _deep_nesting(root: str, depth: int = 8) -> None:
+    _write(os.path.join(root, "leaf.csv"), 4096)
+    if depth > 0:
+        for branch in ("a", "b"):
+            _deep_nesting(os.path.join(root, branch), depth - 1)
+
+
+TREES = {
+    "many tiny files": _many_tiny_files,
+    "few huge files": _few_huge_files,
+    "deep nesting": _deep_nesting,
+}
+
+
+@dataclass
+class PullMeasurement:
+    files: int
+    size: int
+    elapsed: float
+    listing: float
+    peak_rss: int
+
+    def report(self, name: str) -> str:
+        return (
+            f"{name:>16}: {self.files:5d} files, {self.size / 1024 / 1024:7.1f} MB in {self.elapsed:6.2f}s "
+            f"(listing {self.listing:5.2f}s) = {self.files / self.elapsed:8.1f} files/s, "
+            f"{self.size / self.elapsed / 1024 / 1024:7.2f} MB/s, peak RSS {self.peak_rss / 1024 / 1024:6.1f} MB "
+            f"(RTT {ROUND_TRIP_TIME * 1000:.0f}ms)"
+        )
+
+
+class _PeakRss:
+    """Samples the resident set size of this process while running, as `ru_maxrss` only reports the peak of the whole
+    process lifetime. Without `/proc`, the lifetime peak is reported."""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.peak = 0
+        self.stopped = threading.Event()
+        self.page_size = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+    def _sample(self) -> int:
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * self.page_size
+        except OSError:
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def _run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            self.peak = max(self.peak, self._sample())
+
+    def measure(self, action: Callable[[], None]) -> int:
+        self.peak = self._sample()
+        sampler = threading.Thread(target=self._run, daemon=True)
+        sampler.start()
+        try:
+            action()
+        finally:
+            self.stopped.set()
+            sampler.join()
+        return max(self.peak, self._sample())
+
+
+def _pull(server: LocalSftpServer, private_key: str, s3: LocalS3Client) -> PullMeasurement:
+    downloaded: List[SftpFileItem] = []
+    started = time.perf_counter()
+    listed_at: List[float] = []
+
+    def may_start_download(sftp_file_item: SftpFileItem) -> bool:
+        # with "smallest-first", downloads start once the whole tree has been listed
+        if not listed_at:
+            listed_at.append(time.perf_counter())
+        return True
+
+    def store(sftp_file_item: SftpFileItem, file_content: typing.BinaryIO) -> None:
+        upload_stream(client=s3, bucket_name=BUCKET_NAME, key=sftp_file_item.convert_to_object_key(), data=file_content)  # type: ignore
+
+    def pull() -> None:
+        downloaded.extend(download_new_files(
+            sftp_user="benchmark",
+            sftp_host=server.host,
+            sftp_port=server.port,
+            ssh_private_key=private_key,
+            remote_folder="./tree",
+            download_eligable=lambda sftp_item: True,
+            download_handler=store,
+            concurrency=DOWNLOAD_CONCURRENCY,
+            download_order="smallest-first",
+            may_start_download=may_start_download,
+        ))
+
+    peak_rss = _PeakRss().measure(pull)
+    elapsed = time.perf_counter() - started
+    return PullMeasurement(
+        files=len(downloaded),
+        size=sum(item.size or 0 for item in downloaded),
+        elapsed=elapsed,
+        listing=(listed_at[0] if listed_at else time.perf_counter()) - started,
+        peak_rss=peak_rss,
+    )
+
+
+class Test_Pull_Benchmark:
+
+    @pytest.mark.benchmark
+    @pytest.mark.parametrize("tree", TREES.keys())
+    def test_pull_throughput(self, tmp_path, tree: str):
+        root = str(tmp_path / "tree")
+        TREES[tree](root)
+        expected = {
+            os.path.relpath(os.path.join(folder, name), root): os.path.getsize(os.path.join(folder, name))
+            for folder, _, names in os.walk(root) for name in names
+        }
+
+        _, private_key = Fixtures.generate_rsa_keys()
+        s3 = LocalS3Client()
+        with LocalSftpServer(root=tmp_path, latency=ROUND_TRIP_TIME) as server:
+            measurement = _pull(server=server, private_key=private_key.decode("utf-8"), s3=s3)
+
+        print(measurement.report(name=tree))
+
+        assert measurement.files == len(expected)
+        assert {key: size for (_, key), size in s3.objects.items()} == {f"tree/{path}": size for path, size in expected.items()}
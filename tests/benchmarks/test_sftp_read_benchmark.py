@@ -0,0 +1,64 @@
+import logging
+import os
+import time
+import typing
+
+import pytest
+
+from test_utils.fixtures import Fixtures
+from test_utils.local_sftp_server import LocalSftpServer
+from utils.sftp import SftpFileItem, SftpReadSettings, download_new_files
+
+logger = logging.getLogger()
+
+FILE_SIZE = 4 * 1024 * 1024
+ROUND_TRIP_TIME = 0.04
+
+
+def _download(server: LocalSftpServer, private_key: str, read_settings: SftpReadSettings) -> float:
+    def consume(sftp_file_item: SftpFileItem, file_content: typing.BinaryIO) -> None:
+        while file_content.read(1024 * 1024):
+            pass
+
+    start = time.perf_counter()
+    downloaded = download_new_files(
+        sftp_user="benchmark",
+        sftp_host=server.host,
+        sftp_port=server.port,
+        ssh_private_key=private_key,
+        remote_folder="./download",
+        download_eligable=lambda sftp_item: True,
+        download_handler=consume,
+        read_settings=read_settings,
+    )
+    elapsed = time.perf_counter() - start
+    assert len(downloaded) == 1
+    return elapsed
+
+
+class Test_Sftp_Read_Benchmark:
+
+    @pytest.mark.benchmark
+    def test_pipelined_reads_should_outperform_sequential_reads_on_high_latency_links(self, tmp_path):
+        os.makedirs(tmp_path / "download")
+        with open(tmp_path / "download" / "positions.csv", "wb") as f:
+            f.write(os.urandom(FILE_SIZE))
+
+        _, private_key = Fixtures.generate_rsa_keys()
+        profiles = {
+            "sequential": SftpReadSettings(prefetch=False),
+            "prefetch (default)": SftpReadSettings(),
+            "prefetch (128 x 64 KiB)": SftpReadSettings(max_concurrent_prefetch_requests=128, read_size=65536),
+        }
+
+        with LocalSftpServer(root=tmp_path, latency=ROUND_TRIP_TIME) as server:
+            timings = {
+                name: _download(server=server, private_key=private_key.decode("utf-8"), read_settings=settings)
+                for name, settings in profiles.items()
+            }
+
+        for name, elapsed in timings.items():
+            print(f"{name:>24}: {elapsed:6.2f}s, {FILE_SIZE / elapsed / 1024 / 1024:7.2f} MB/s "
+                  f"(RTT {ROUND_TRIP_TIME * 1000:.0f}ms)")
+
+        assert timings["prefetch (default)"] < timings["sequential"]
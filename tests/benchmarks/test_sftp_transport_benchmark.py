@@ -0,0 +1,62 @@
+import logging
+import os
+import time
+import typing
+
+import pytest
+
+from test_utils.fixtures import Fixtures
+from test_utils.local_sftp_server import LocalSftpServer
+from utils.sftp import SFTP_TRANSPORT_PROFILES, SftpFileItem, SftpReadSettings, download_new_files
+
+logger = logging.getLogger()
+
+FILE_SIZE = 16 * 1024 * 1024
+ROUND_TRIP_TIME = 0.04
+# keeps more data in flight than paramiko's default window allows, so the window becomes the limiting factor
+READ_SETTINGS = SftpReadSettings(max_concurrent_prefetch_requests=256)
+
+
+def _download(server: LocalSftpServer, private_key: str, profile: str) -> float:
+    def consume(sftp_file_item: SftpFileItem, file_content: typing.BinaryIO) -> None:
+        while file_content.read(1024 * 1024):
+            pass
+
+    start = time.perf_counter()
+    downloaded = download_new_files(
+        sftp_user="benchmark",
+        sftp_host=server.host,
+        sftp_port=server.port,
+        ssh_private_key=private_key,
+        remote_folder="./download",
+        download_eligable=lambda sftp_item: True,
+        download_handler=consume,
+        read_settings=READ_SETTINGS,
+        transport_settings=SFTP_TRANSPORT_PROFILES[profile],
+    )
+    elapsed = time.perf_counter() - start
+    assert len(downloaded) == 1
+    return elapsed
+
+
+class Test_Sftp_Transport_Benchmark:
+
+    @pytest.mark.benchmark
+    def test_bulk_profile_should_outperform_paramiko_defaults_on_high_latency_links(self, tmp_path):
+        os.makedirs(tmp_path / "download")
+        with open(tmp_path / "download" / "positions.csv", "wb") as f:
+            f.write(os.urandom(FILE_SIZE))
+
+        _, private_key = Fixtures.generate_rsa_keys()
+
+        with LocalSftpServer(root=tmp_path, latency=ROUND_TRIP_TIME) as server:
+            timings = {
+                profile: _download(server=server, private_key=private_key.decode("utf-8"), profile=profile)
+                for profile in SFTP_TRANSPORT_PROFILES
+            }
+
+        for profile, elapsed in timings.items():
+            print(f"{profile:>12}: {elapsed:6.2f}s, {FILE_SIZE / elapsed / 1024 / 1024:7.2f} MB/s "
+                  f"(RTT {ROUND_TRIP_TIME * 1000:.0f}ms)")
+
+        assert timings["bulk"] < timings["default"]
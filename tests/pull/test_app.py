@@ -1,27 +1,53 @@
-from datetime import datetime
+from datetime import datetime, timezone
+from io import BytesIO
+import base64
+import gzip
+import hashlib
+import json
 import os
 from typing import Any, Dict, List, Tuple
 
+import boto3
 import paramiko
 import pytest
 from aws_lambda_typing import context as ctx
+from botocore.response import StreamingBody
+from botocore.stub import ANY, Stubber
 from paramiko import AuthenticationException
 from pytest_mock import MockerFixture
 from pytest_mock.plugin import MockType
 from requests_mock import Mocker
 
+import pull.app
 from pull.app import PullTestContext, handler
 from pull.entities.sftp_pull_event import SftpPullEvent
 from test_utils.entities.aws_stubs import AwsStubs
 from test_utils.fixtures import Fixtures
 from utils.common import peer_secret_id
 from utils.metrics import LocalMetricClient, metric_lambda_pull
-from utils.s3 import PAGINATOR_DEFAULT_PAGE_SIZE
+from utils.pull_continuation import pull_continuation_key
+from utils.pull_listing_cache import PullListingCache, pull_listing_cache_key
+from utils.pull_lock import pull_lock_key
+from utils.pull_manifest import PullManifest, pull_manifest_key
+from utils.pull_schedule import PullArrivals, pull_arrivals_key
+from utils.s3 import MULTIPART_UPLOAD_MIN_PART_SIZE, PAGINATOR_DEFAULT_PAGE_SIZE
+from utils.sftp import SftpFileItem, SftpRetrySettings, SftpStripe, SftpStripeSettings, insert_timestamp
 
 peer_id = "bank1"
 first_csv_file = "file1.csv"
 second_csv_file = "file2.csv"
 bucket_name_upload = "tb-terrasam-dev"
+bucket_name_pull_state = "tb-terrasam-dev-pull-state"
+function_arn = "arn:aws:lambda:eu-west-1:123456789012:function:tb-terrasam-dev-pull"
+
+
+class ExpiringContext(ctx.Context):
+    def __init__(self, remaining_millis: int):
+        self.remaining_millis = remaining_millis
+        self.invoked_function_arn = function_arn
+
+    def get_remaining_time_in_millis(self) -> int:  # type: ignore
+        return self.remaining_millis
 
 
 class Test_Pull_Handler:
@@ -182,6 +208,652 @@ class Test_Pull_Handler:
         download_mock.assert_called_once()
 
 
+    @pytest.mark.unit
+    def test_should_only_download_files_missing_from_the_pull_manifest(self, aws_stubs: AwsStubs, monkeypatch, mocker: MockerFixture):
+        monkeypatch.setenv("BUCKET_NAME_UPLOAD", bucket_name_upload)
+        monkeypatch.setenv("BUCKET_NAME_PULL_STATE", bucket_name_pull_state)
+
+        pull_event = SftpPullEvent(id=peer_id)
+        peer_config_json = Fixtures.peer_config(peer=pull_event.id)
+        monkeypatch.setenv("PEERS_JSON_UNDER_TEST", peer_config_json)
+
+        self._setup_ssm_stub(aws_stubs=aws_stubs, event=pull_event)
+        self._setup_pull_lock_stub(aws_stubs=aws_stubs)
+        manifest = PullManifest(peer_id=peer_id, files={first_csv_file: (3, 1633872000)})
+        aws_stubs.s3.add_response(
+            method='get_object',
+            expected_params={'Bucket': bucket_name_pull_state, 'Key': pull_manifest_key(peer_id=peer_id)},
+            service_response={'Body': StreamingBody(BytesIO(manifest.serialize()), len(manifest.serialize())), 'ETag': '"v1"'}
+        )
+        aws_stubs.s3.add_response(
+            method='put_object',
+            expected_params={'Bucket': bucket_name_upload, 'Key': f"{peer_id}/folder/{first_csv_file}", 'Body': ANY},
+            service_response={}
+        )
+        aws_stubs.s3.add_response(
+            method='put_object',
+            expected_params={
+                'Bucket': bucket_name_pull_state, 'Key': pull_manifest_key(peer_id=peer_id), 'Body': ANY, 'IfMatch': '"v1"'
+            },
+            service_response={'ETag': '"v2"'}
+        )
+        self._setup_pull_lock_release_stub(aws_stubs=aws_stubs)
+
+        # same file name in another folder must not be mistaken for the file pulled before
+        remote_files = [
+            Fixtures.create_sftp_file_item(filename=first_csv_file, location=f"./{first_csv_file}", size=3, last_modified=1633872000),
+            Fixtures.create_sftp_file_item(filename=first_csv_file, location=f"./folder/{first_csv_file}", size=3, last_modified=1633872000),
+        ]
+
+        self._setup_sftp_download_mock(mocker=mocker, remote_files=remote_files)
+
+        pull_test_context = PullTestContext(context_under_test=aws_stubs.test_context())
+
+        response = handler(cloudwatch_event=pull_event.to_dict(), context=ctx.Context(), pull_test_context=pull_test_context)
+        assert response == {
+            "statusCode": 200,
+            "headers": {},
+            "body": {
+                'imported': [f"folder/{first_csv_file}"]
+            }
+        }
+
+        aws_stubs.ssm.assert_no_pending_responses()
+        aws_stubs.s3.assert_no_pending_responses()
+
+
+    @pytest.mark.unit
+    def test_should_record_pulled_files_before_archiving_remote_files(self, aws_stubs: AwsStubs, monkeypatch, mocker: MockerFixture):
+        monkeypatch.setenv("BUCKET_NAME_UPLOAD", bucket_name_upload)
+        monkeypatch.setenv("BUCKET_NAME_PULL_STATE", bucket_name_pull_state)
+
+        pull_event = SftpPullEvent(id=peer_id)
+        monkeypatch.setenv("PEERS_JSON_UNDER_TEST", Fixtures.peer_config(peer=pull_event.id))
+
+        self._setup_ssm_stub(aws_stubs=aws_stubs, event=pull_event)
+        self._setup_pull_lock_stub(aws_stubs=aws_stubs)
+        aws_stubs.s3.add_response(
+            method='get_object',
+            expected_params={'Bucket': bucket_name_pull_state, 'Key': pull_manifest_key(peer_id=peer_id)},
+            service_response={'Body': self._streaming_body(PullManifest(peer_id=peer_id).serialize()), 'ETag': '"v1"'}
+        )
+        aws_stubs.s3.add_response(
+            method='put_object',
+            expected_params={'Bucket': bucket_name_upload, 'Key': f"{peer_id}/{first_csv_file}", 'Body': ANY},
+            service_response={}
+        )
+        aws_stubs.s3.add_response(
+            method='put_object',
+            expected_params={
+                'Bucket': bucket_name_pull_state, 'Key': pull_manifest_key(peer_id=peer_id), 'Body': ANY, 'IfMatch': '"v1"'
+            },
+            service_response={'ETag': '"v2"'}
+        )
+        self._setup_pull_lock_release_stub(aws_stubs=aws_stubs)
+
+        remote_file = Fixtures.create_sftp_file_item(filename=first_csv_file, location=f"./{first_csv_file}", size=3, last_modified=1633872000)
+
+        def download_then_fail_archiving(download_eligable, download_handler, downloads_stored, **kwargs):
+            download_handler(remote_file, BytesIO(b"a;b"))
+            downloads_stored([remote_file])
+            raise ValueError("Something failed downloading new files in SFTP.")
+
+        mocker.patch('pull.app._download_new_sftp_files', side_effect=download_then_fail_archiving)
+        save_spy = mocker.spy(pull.app, "save_pull_manifest")
+
+        pull_test_context = PullTestContext(context_under_test=aws_stubs.test_context())
+
+        response = handler(cloudwatch_event=pull_event.to_dict(), context=ctx.Context(), pull_test_context=pull_test_context)
+
+        assert response["statusCode"] == 500
+        # the manifest has been stored once, before archiving
+        save_spy.assert_called_once()
+        aws_stubs.s3.assert_no_pending_responses()
+
+    @pytest.mark.unit
+    def test_should_skip_the_pull_while_another_pull_holds_the_lock(self, aws_stubs: AwsStubs, monkeypatch, mocker: MockerFixture):
+        monkeypatch.setenv("BUCKET_NAME_UPLOAD", bucket_name_upload)
+        monkeypatch.setenv("BUCKET_NAME_PULL_STATE", bucket_name_pull_state)
+
+        pull_event = SftpPullEvent(id=peer_id)
+        monkeypatch.setenv("PEERS_JSON_UNDER_TEST", Fixtures.peer_config(peer=pull_event.id))
+
+        lease = json.dumps({"peer_id": peer_id, "owner": "running-pull", "expires": datetime.now().timestamp() + 60}).encode("utf-8")
+        aws_stubs.s3.add_client_error(method='put_object', service_error_code='PreconditionFailed', http_status_code=412)
+        aws_stubs.s3.add_response(
+            method='get_object',
+            expected_params={'Bucket': bucket_name_pull_state, 'Key': pull_lock_key(peer_id=peer_id)},
+            service_response={'Body': self._streaming_body(lease), 'ETag': '"lease"'}
+        )
+        download_mock = self._setup_sftp_download_mock(mocker=mocker, remote_files=[])
+
+        pull_test_context = PullTestContext(context_under_test=aws_stubs.test_context())
+        response = handler(cloudwatch_event=pull_event.to_dict(), context=ctx.Context(), pull_test_context=pull_test_context)
+
+        assert response == {"statusCode": 200, "headers": {}, "body": {"skipped": "locked"}}
+        download_mock.assert_not_called()
+        aws_stubs.s3.assert_no_pending_responses()
+
+
+    @pytest.mark.unit
+    def test_should_skip_polls_outside_the_times_files_usually_arrive(self, aws_stubs: AwsStubs, monkeypatch, mocker: MockerFixture):
+        monkeypatch.setenv("BUCKET_NAME_UPLOAD", bucket_name_upload)
+        monkeypatch.setenv("BUCKET_NAME_PULL_STATE", bucket_name_pull_state)
+
+        pull_event = SftpPullEvent(id=peer_id)
+        peer_config = json.loads(Fixtures.peer_config(peer=pull_event.id))
+        peer_config[0]["adaptive-schedule"] = {"enabled": True, "max-interval-minutes": None}
+        monkeypatch.setenv("PEERS_JSON_UNDER_TEST", json.dumps(peer_config))
+
+        # files always arrived on Mondays at 06:00 UTC, the fixed time is a Friday afternoon
+        now = Fixtures.fixed_datetime()
+        arrivals = PullArrivals(peer_id=peer_id)
+        for week in range(1, 13):
+            monday = int(datetime(2023, 10, 9, 6, 0, tzinfo=timezone.utc).timestamp()) - week * 7 * 86400
+            arrivals.record(polled_at=monday, modified=[monday])
+        arrivals.record(polled_at=now.timestamp() - 60, modified=[])
+        aws_stubs.s3.add_response(
+            method='get_object',
+            expected_params={'Bucket': bucket_name_pull_state, 'Key': pull_arrivals_key(peer_id=peer_id)},
+            service_response={'Body': self._streaming_body(arrivals.serialize())}
+        )
+        download_mock = self._setup_sftp_download_mock(mocker=mocker, remote_files=[])
+
+        pull_test_context = PullTestContext(context_under_test=aws_stubs.test_context(current_datetime=now))
+        response = handler(cloudwatch_event=pull_event.to_dict(), context=ctx.Context(), pull_test_context=pull_test_context)
+
+        assert response == {"statusCode": 200, "headers": {}, "body": {"skipped": "off-schedule"}}
+        download_mock.assert_not_called()
+        aws_stubs.s3.assert_no_pending_responses()
+
+
+    @pytest.mark.unit
+    def test_should_record_the_arrival_of_new_files(self, aws_stubs: AwsStubs, monkeypatch, mocker: MockerFixture):
+        monkeypatch.setenv("BUCKET_NAME_UPLOAD", bucket_name_upload)
+        monkeypatch.setenv("BUCKET_NAME_PULL_STATE", bucket_name_pull_state)
+
+        pull_event = SftpPullEvent(id=peer_id)
+        peer_config = json.loads(Fixtures.peer_config(peer=pull_event.id))
+        peer_config[0]["adaptive-schedule"] = {"enabled": True}
+        monkeypatch.setenv("PEERS_JSON_UNDER_TEST", json.dumps(peer_config))
+
+        self._setup_ssm_stub(aws_stubs=aws_stubs, event=pull_event)
+        aws_stubs.s3.add_client_error(method='get_object', service_error_code='NoSuchKey', http_status_code=404)
+        self._setup_pull_lock_stub(aws_stubs=aws_stubs)
+        aws_stubs.s3.add_response(
+            method='get_object',
+            expected_params={'Bucket': bucket_name_pull_state, 'Key': pull_manifest_key(peer_id=peer_id)},
+            service_response={'Body': self._streaming_body(PullManifest(peer_id=peer_id).serialize()), 'ETag': '"v1"'}
+        )
+        aws_stubs.s3.add_response(method='put_object', service_response={})
+        aws_stubs.s3.add_response(method='put_object', service_response={'ETag': '"v2"'})
+        arrivals_stored: List[bytes] = []
+        aws_stubs.s3.add_response(
+            method='put_object',
+            expected_params={'Bucket': bucket_name_pull_state, 'Key': pull_arrivals_key(peer_id=peer_id), 'Body': ANY},
+            service_response={}
+        )
+        self._setup_pull_lock_release_stub(aws_stubs=aws_stubs)
+        aws_stubs.s3.client.meta.events.register(
+            'before-parameter-build.s3.PutObject',
+            lambda params, **kwargs: arrivals_stored.append(params['Body']) if params['Key'] == pull_arrivals_key(peer_id=peer_id) else None
+        )
+
+        self._setup_sftp_download_mock(mocker=mocker, remote_files=[
+            Fixtures.create_sftp_file_item(filename=first_csv_file, location=f"./{first_csv_file}", size=3, last_modified=1696831200),
+        ])
+
+        pull_test_context = PullTestContext(context_under_test=aws_stubs.test_context(current_datetime=Fixtures.fixed_datetime()))
+        response = handler(cloudwatch_event=pull_event.to_dict(), context=ctx.Context(), pull_test_context=pull_test_context)
+
+        assert response["body"] == {"imported": [first_csv_file]}
+        arrivals = PullArrivals.deserialize(peer_id=peer_id, data=arrivals_stored[0])
+        # 2023-10-09 06:00 UTC, a Monday
+        assert (arrivals.arrivals, arrivals.hours[6], arrivals.weekdays[0]) == (1, 1.0, 1.0)
+        assert arrivals.last_poll == Fixtures.fixed_datetime().timestamp()
+        aws_stubs.s3.assert_no_pending_responses()
+
+
+    @pytest.mark.unit
+    def test_should_load_and_store_the_listing_cache_if_enabled(self, aws_stubs: AwsStubs, monkeypatch, mocker: MockerFixture):
+        monkeypatch.setenv("BUCKET_NAME_UPLOAD", bucket_name_upload)
+        monkeypatch.setenv("BUCKET_NAME_PULL_STATE", bucket_name_pull_state)
+
+        pull_event = SftpPullEvent(id=peer_id)
+        peer_config = json.loads(Fixtures.peer_config(peer=pull_event.id))
+        peer_config[0]["listing-cache"] = True
+        monkeypatch.setenv("PEERS_JSON_UNDER_TEST", json.dumps(peer_config))
+
+        self._setup_ssm_stub(aws_stubs=aws_stubs, event=pull_event)
+        self._setup_pull_lock_stub(aws_stubs=aws_stubs)
+        manifest = PullManifest(peer_id=peer_id, files={first_csv_file: (3, 1633872000)})
+        aws_stubs.s3.add_response(
+            method='get_object',
+            expected_params={'Bucket': bucket_name_pull_state, 'Key': pull_manifest_key(peer_id=peer_id)},
+            service_response={'Body': self._streaming_body(manifest.serialize()), 'ETag': '"v1"'}
+        )
+        listing_cache = PullListingCache(peer_id=peer_id, visited={"/home/peer": (100, [])})
+        aws_stubs.s3.add_response(
+            method='get_object',
+            expected_params={'Bucket': bucket_name_pull_state, 'Key': pull_listing_cache_key(peer_id=peer_id)},
+            service_response={'Body': self._streaming_body(listing_cache.serialize())}
+        )
+        aws_stubs.s3.add_response(
+            method='put_object',
+            expected_params={'Bucket': bucket_name_pull_state, 'Key': pull_listing_cache_key(peer_id=peer_id), 'Body': ANY},
+            service_response={}
+        )
+        self._setup_pull_lock_release_stub(aws_stubs=aws_stubs)
+
+        download_mock = self._setup_sftp_download_mock(mocker=mocker, remote_files=[
+            Fixtures.create_sftp_file_item(filename=first_csv_file, location=f"./{first_csv_file}", size=3, last_modified=1633872000),
+        ])
+
+        pull_test_context = PullTestContext(context_under_test=aws_stubs.test_context())
+        response = handler(cloudwatch_event=pull_event.to_dict(), context=ctx.Context(), pull_test_context=pull_test_context)
+
+        assert response["statusCode"] == 200
+        assert download_mock.call_args.kwargs["listing_cache"].directories == listing_cache.visited
+        aws_stubs.s3.assert_no_pending_responses()
+
+
+    @pytest.mark.unit
+    def test_should_not_store_content_pulled_before_under_another_name(self, aws_stubs: AwsStubs, monkeypatch, mocker: MockerFixture):
+        monkeypatch.setenv("BUCKET_NAME_UPLOAD", bucket_name_upload)
+        monkeypatch.setenv("BUCKET_NAME_PULL_STATE", bucket_name_pull_state)
+
+        pull_event = SftpPullEvent(id=peer_id)
+        peer_config = json.loads(Fixtures.peer_config(peer=pull_event.id))
+        peer_config[0]["content-dedup"] = {"enabled": True}
+        monkeypatch.setenv("PEERS_JSON_UNDER_TEST", json.dumps(peer_config))
+
+        self._setup_ssm_stub(aws_stubs=aws_stubs, event=pull_event)
+        self._setup_pull_lock_stub(aws_stubs=aws_stubs)
+        manifest = PullManifest(peer_id=peer_id, files={first_csv_file: (3, 1633872000)}, contents={"aaa": first_csv_file})
+        aws_stubs.s3.add_response(
+            method='get_object',
+            expected_params={'Bucket': bucket_name_pull_state, 'Key': pull_manifest_key(peer_id=peer_id)},
+            service_response={'Body': self._streaming_body(manifest.serialize()), 'ETag': '"v1"'}
+        )
+        aws_stubs.s3.add_response(
+            method='put_object',
+            expected_params={
+                'Bucket': bucket_name_upload, 'Key': f"{peer_id}/{second_csv_file}", 'Body': ANY, 'Metadata': {'sha256': 'bbb'}
+            },
+            service_response={}
+        )
+        aws_stubs.s3.add_response(
+            method='put_object',
+            expected_params={
+                'Bucket': bucket_name_pull_state, 'Key': pull_manifest_key(peer_id=peer_id), 'Body': ANY, 'IfMatch': '"v1"'
+            },
+            service_response={'ETag': '"v2"'}
+        )
+        self._setup_pull_lock_release_stub(aws_stubs=aws_stubs)
+
+        self._setup_sftp_download_mock(mocker=mocker, remote_files=[
+            Fixtures.create_sftp_file_item(filename="renamed.csv", location="./renamed.csv", size=3, last_modified=1633872001, sha256="aaa"),
+            Fixtures.create_sftp_file_item(filename=second_csv_file, location=f"./{second_csv_file}", size=3, last_modified=1633872001, sha256="bbb"),
+        ])
+
+        pull_test_context = PullTestContext(context_under_test=aws_stubs.test_context())
+        response = handler(cloudwatch_event=pull_event.to_dict(), context=ctx.Context(), pull_test_context=pull_test_context)
+
+        assert response["body"] == {"imported": [second_csv_file], "duplicates": ["renamed.csv"]}
+        aws_stubs.s3.assert_no_pending_responses()
+
+
+    @pytest.mark.unit
+    def test_should_append_to_the_previous_version_of_growing_files(self, aws_stubs: AwsStubs, monkeypatch, mocker: MockerFixture):
+        monkeypatch.setenv("BUCKET_NAME_UPLOAD", bucket_name_upload)
+        monkeypatch.setenv("BUCKET_NAME_PULL_STATE", bucket_name_pull_state)
+
+        pull_event = SftpPullEvent(id=peer_id)
+        peer_config = json.loads(Fixtures.peer_config(peer=pull_event.id))
+        peer_config[0]["appending-files"] = ["rolling*.csv"]
+        monkeypatch.setenv("PEERS_JSON_UNDER_TEST", json.dumps(peer_config))
+
+        previous_size = MULTIPART_UPLOAD_MIN_PART_SIZE
+        object_key = f"{peer_id}/rolling.csv"
+        self._setup_ssm_stub(aws_stubs=aws_stubs, event=pull_event)
+        self._setup_pull_lock_stub(aws_stubs=aws_stubs)
+        manifest = PullManifest(
+            peer_id=peer_id, files={"rolling.csv": (previous_size, 1633872000)}, objects={"rolling.csv": (object_key, '"e1"')}
+        )
+        aws_stubs.s3.add_response(
+            method='get_object',
+            expected_params={'Bucket': bucket_name_pull_state, 'Key': pull_manifest_key(peer_id=peer_id)},
+            service_response={'Body': self._streaming_body(manifest.serialize()), 'ETag': '"v1"'}
+        )
+        aws_stubs.s3.add_response(
+            method='head_object',
+            expected_params={'Bucket': bucket_name_upload, 'Key': object_key, 'IfMatch': '"e1"'},
+            service_response={'ContentLength': previous_size}
+        )
+        aws_stubs.s3.add_response(
+            method='create_multipart_upload',
+            expected_params={'Bucket': bucket_name_upload, 'Key': object_key},
+            service_response={'UploadId': 'upload-id'}
+        )
+        aws_stubs.s3.add_response(
+            method='upload_part_copy',
+            expected_params={
+                'Bucket': bucket_name_upload, 'Key': object_key, 'UploadId': 'upload-id', 'PartNumber': 1,
+                'CopySource': {'Bucket': bucket_name_upload, 'Key': object_key},
+                'CopySourceRange': f"bytes=0-{previous_size - 1}", 'CopySourceIfMatch': '"e1"'
+            },
+            service_response={'CopyPartResult': {'ETag': '"p1"'}}
+        )
+        aws_stubs.s3.add_response(
+            method='upload_part',
+            expected_params={'Bucket': bucket_name_upload, 'Key': object_key, 'UploadId': 'upload-id', 'PartNumber': 2, 'Body': b"a;b"},
+            service_response={'ETag': '"p2"'}
+        )
+        aws_stubs.s3.add_response(method='complete_multipart_upload', service_response={'ETag': '"e2"'})
+        aws_stubs.s3.add_response(
+            method='put_object',
+            expected_params={
+                'Bucket': bucket_name_pull_state, 'Key': pull_manifest_key(peer_id=peer_id), 'Body': ANY, 'IfMatch': '"v1"'
+            },
+            service_response={'ETag': '"v2"'}
+        )
+        self._setup_pull_lock_release_stub(aws_stubs=aws_stubs)
+
+        rolling = Fixtures.create_sftp_file_item(filename="rolling.csv", location="./rolling.csv", size=previous_size + 3, last_modified=1633872001)
+        self._setup_sftp_download_mock(mocker=mocker, remote_files=[rolling])
+
+        pull_test_context = PullTestContext(context_under_test=aws_stubs.test_context())
+        response = handler(cloudwatch_event=pull_event.to_dict(), context=ctx.Context(), pull_test_context=pull_test_context)
+
+        assert response["body"] == {"imported": ["rolling.csv"]}
+        aws_stubs.s3.assert_no_pending_responses()
+
+
+    @pytest.mark.unit
+    def test_should_upload_the_stripes_of_large_files_as_parts(self, aws_stubs: AwsStubs, monkeypatch, mocker: MockerFixture):
+        monkeypatch.setenv("BUCKET_NAME_UPLOAD", bucket_name_upload)
+
+        pull_event = SftpPullEvent(id=peer_id)
+        peer_config = json.loads(Fixtures.peer_config(peer=pull_event.id))
+        # a single connection uploads one part at a time, in the order the stubbed responses are consumed
+        peer_config[0]["sftp-stripes"] = {"min-size": 1024, "connections": 1, "stripe-size": None}
+        monkeypatch.setenv("PEERS_JSON_UNDER_TEST", json.dumps(peer_config))
+
+        self._setup_stubs_no_existing_files(aws_stubs=aws_stubs, event=pull_event)
+        object_key = f"{peer_id}/{first_csv_file}"
+        checksums = {n: base64.b64encode(hashlib.sha256(f"stripe {n}".encode()).digest()).decode("ascii") for n in (1, 2)}
+        aws_stubs.s3.add_response(
+            method='create_multipart_upload',
+            expected_params={'Bucket': bucket_name_upload, 'Key': object_key, 'ChecksumAlgorithm': 'SHA256'},
+            service_response={'UploadId': 'upload-id'}
+        )
+        for part_number in (2, 1):
+            aws_stubs.s3.add_response(
+                method='upload_part',
+                expected_params={
+                    'Bucket': bucket_name_upload, 'Key': object_key, 'UploadId': 'upload-id', 'PartNumber': part_number,
+                    'Body': f"stripe {part_number}".encode(), 'ChecksumSHA256': checksums[part_number]
+                },
+                service_response={'ETag': f'"p{part_number}"'}
+            )
+        aws_stubs.s3.add_response(method='complete_multipart_upload', service_response={})
+
+        large = Fixtures.create_sftp_file_item(filename=first_csv_file, location=f"./{first_csv_file}", size=2048, last_modified=1633872000)
+
+        def download(download_eligable, stripe_settings, striped_download_handler, **kwargs):
+            assert stripe_settings == SftpStripeSettings(min_size=1024, connections=1)
+            stripes = [
+                SftpStripe(index=index, offset=index * 1024, data=f"stripe {index + 1}".encode(), sha256=hashlib.sha256(f"stripe {index + 1}".encode()).digest())
+                for index in (1, 0)
+            ]
+            striped_download_handler(large, iter(stripes))
+            return [large]
+
+        mocker.patch('pull.app._download_new_sftp_files', side_effect=download)
+
+        pull_test_context = PullTestContext(context_under_test=aws_stubs.test_context())
+        response = handler(cloudwatch_event=pull_event.to_dict(), context=ctx.Context(), pull_test_context=pull_test_context)
+
+        assert response["body"] == {"imported": [first_csv_file]}
+        aws_stubs.s3.assert_no_pending_responses()
+
+
+    @pytest.mark.unit
+    def test_should_report_retried_and_failed_downloads(self, aws_stubs: AwsStubs, monkeypatch, mocker: MockerFixture):
+        monkeypatch.setenv("BUCKET_NAME_UPLOAD", bucket_name_upload)
+
+        pull_event = SftpPullEvent(id=peer_id)
+        peer_config = json.loads(Fixtures.peer_config(peer=pull_event.id))
+        peer_config[0]["sftp-retry"] = {"attempts": 5, "backoff-seconds": None, "max-backoff-seconds": 10}
+        monkeypatch.setenv("PEERS_JSON_UNDER_TEST", json.dumps(peer_config))
+
+        self._setup_stubs_no_existing_files(aws_stubs=aws_stubs, event=pull_event)
+        aws_stubs.s3.add_response(
+            method='put_object',
+            expected_params={'Bucket': bucket_name_upload, 'Key': f"{peer_id}/{first_csv_file}", 'Body': ANY},
+            service_response={}
+        )
+
+        first = Fixtures.create_sftp_file_item(filename=first_csv_file, location=f"./{first_csv_file}", size=3, last_modified=1633872000)
+        second = Fixtures.create_sftp_file_item(filename=second_csv_file, location=f"./{second_csv_file}", size=3, last_modified=1633872000)
+
+        def download(download_handler, retry_settings, download_outcome, **kwargs):
+            assert retry_settings == SftpRetrySettings(attempts=5, max_backoff_seconds=10)
+            download_handler(first, BytesIO(b"a;b"))
+            download_outcome(first, "downloaded", 2)
+            download_outcome(second, "failed", 4)
+            return [first]
+
+        mocker.patch('pull.app._download_new_sftp_files', side_effect=download)
+
+        pull_test_context = PullTestContext(context_under_test=aws_stubs.test_context())
+        response = handler(cloudwatch_event=pull_event.to_dict(), context=ctx.Context(), pull_test_context=pull_test_context)
+
+        assert response["body"] == {
+            "imported": [first_csv_file],
+            "retried": {first_csv_file: 2, second_csv_file: 4},
+            "download-failed": [second_csv_file],
+        }
+        aws_stubs.s3.assert_no_pending_responses()
+
+
+    @pytest.mark.unit
+    def test_should_recognize_previously_downloaded_files_with_timestamps_in_their_keys(self, aws_stubs: AwsStubs, monkeypatch, mocker: MockerFixture):
+        monkeypatch.setenv("BUCKET_NAME_UPLOAD", bucket_name_upload)
+
+        pull_event = SftpPullEvent(id=peer_id)
+        peer_config_json = Fixtures.peer_config(peer=pull_event.id, timestamp_tagging=True)
+        monkeypatch.setenv("PEERS_JSON_UNDER_TEST", peer_config_json)
+
+        current_datetime = Fixtures.fixed_datetime()
+        self._setup_ssm_stub(aws_stubs=aws_stubs, event=pull_event)
+        self._setup_s3_stub(
+            aws_stubs=aws_stubs,
+            list_object_contents=[
+                {
+                    "Key": f"{peer_id}/{insert_timestamp(file_name=first_csv_file, current_datetime=lambda: current_datetime, use_sgt=True)}",
+                    "LastModified": datetime.fromisoformat("2021-11-30T12:58:14+00:00"),
+                },
+            ]
+        )
+        aws_stubs.s3.add_response(
+            method='put_object',
+            expected_params={
+                'Bucket': bucket_name_upload,
+                'Key': f"{peer_id}/{insert_timestamp(file_name=f'folder/{first_csv_file}', current_datetime=lambda: current_datetime, use_sgt=True)}",
+                'Body': ANY
+            },
+            service_response={}
+        )
+
+        self._setup_sftp_download_mock(mocker=mocker, remote_files=[
+            Fixtures.create_sftp_file_item(filename=first_csv_file, location=f"./{first_csv_file}", size=3, last_modified=1633872000),
+            Fixtures.create_sftp_file_item(filename=first_csv_file, location=f"./folder/{first_csv_file}", size=3, last_modified=1633872000),
+        ])
+
+        pull_test_context = PullTestContext(context_under_test=aws_stubs.test_context(current_datetime=current_datetime))
+
+        response = handler(cloudwatch_event=pull_event.to_dict(), context=ctx.Context(), pull_test_context=pull_test_context)
+        assert response == {
+            "statusCode": 200,
+            "headers": {},
+            "body": {
+                'imported': [f"folder/{first_csv_file}"]
+            }
+        }
+
+        aws_stubs.s3.assert_no_pending_responses()
+
+    @pytest.mark.unit
+    def test_should_continue_in_a_new_invocation_before_running_out_of_time(self, aws_stubs: AwsStubs, monkeypatch, mocker: MockerFixture):
+        monkeypatch.setenv("BUCKET_NAME_UPLOAD", bucket_name_upload)
+        monkeypatch.setenv("BUCKET_NAME_PULL_STATE", bucket_name_pull_state)
+
+        pull_event = SftpPullEvent(id=peer_id)
+        monkeypatch.setenv("PEERS_JSON_UNDER_TEST", Fixtures.peer_config(peer=pull_event.id))
+
+        self._setup_ssm_stub(aws_stubs=aws_stubs, event=pull_event)
+        self._setup_pull_lock_stub(aws_stubs=aws_stubs)
+        aws_stubs.s3.add_response(
+            method='get_object',
+            expected_params={'Bucket': bucket_name_pull_state, 'Key': pull_manifest_key(peer_id=peer_id)},
+            service_response={'Body': self._streaming_body(PullManifest(peer_id=peer_id).serialize()), 'ETag': '"v1"'}
+        )
+        aws_stubs.s3.add_response(
+            method='put_object',
+            expected_params={'Bucket': bucket_name_upload, 'Key': f"{peer_id}/{first_csv_file}", 'Body': ANY},
+            service_response={}
+        )
+        aws_stubs.s3.add_response(
+            method='put_object',
+            expected_params={
+                'Bucket': bucket_name_pull_state, 'Key': pull_manifest_key(peer_id=peer_id), 'Body': ANY, 'IfMatch': '"v1"'
+            },
+            service_response={'ETag': '"v2"'}
+        )
+        self._setup_pull_lock_release_stub(aws_stubs=aws_stubs)
+        aws_stubs.s3.add_response(
+            method='put_object',
+            expected_params={'Bucket': bucket_name_pull_state, 'Key': pull_continuation_key(peer_id=peer_id), 'Body': ANY},
+            service_response={}
+        )
+
+        lambda_client = boto3.client("lambda", region_name="eu-west-1")
+        lambda_stub = Stubber(lambda_client)
+        lambda_stub.add_response(
+            method='invoke',
+            expected_params={'FunctionName': function_arn, 'InvocationType': 'Event', 'Payload': ANY},
+            service_response={'StatusCode': 202}
+        )
+        lambda_stub.activate()
+
+        download_mock = self._setup_sftp_download_mock(mocker=mocker, remote_files=[
+            Fixtures.create_sftp_file_item(filename=first_csv_file, location=f"./{first_csv_file}", size=3, last_modified=1633872000),
+            Fixtures.create_sftp_file_item(filename=second_csv_file, location=f"./{second_csv_file}", size=3, last_modified=1633872000),
+        ])
+
+        pull_test_context = PullTestContext(context_under_test=aws_stubs.test_context(), lambda_client=lambda_client)
+
+        # less time left than the safety margin, only the first download may start
+        response = handler(cloudwatch_event=pull_event.to_dict(), context=ExpiringContext(remaining_millis=1000), pull_test_context=pull_test_context)
+        assert response["statusCode"] == 200
+        assert response["body"]["imported"] == [first_csv_file]
+        assert response["body"]["continuation"]["remaining"] == 1
+        assert response["body"]["continuation"]["token"] is not None
+
+        assert download_mock.call_args.kwargs["download_order"] == "listing"
+        aws_stubs.s3.assert_no_pending_responses()
+        lambda_stub.assert_no_pending_responses()
+
+    @pytest.mark.unit
+    def test_should_pull_remaining_files_when_continuing(self, aws_stubs: AwsStubs, monkeypatch, mocker: MockerFixture):
+        monkeypatch.setenv("BUCKET_NAME_UPLOAD", bucket_name_upload)
+        monkeypatch.setenv("BUCKET_NAME_PULL_STATE", bucket_name_pull_state)
+
+        pull_event = SftpPullEvent(id=peer_id, continuation="token-1", continuations=1)
+        monkeypatch.setenv("PEERS_JSON_UNDER_TEST", Fixtures.peer_config(peer=pull_event.id))
+
+        remaining_file = Fixtures.create_sftp_file_item(filename=second_csv_file, location=f"./{second_csv_file}", size=3, last_modified=1633872000)
+        continuation = {"token": "token-1", "peer_id": peer_id, "files": [remaining_file.to_dict()]}
+
+        self._setup_ssm_stub(aws_stubs=aws_stubs, event=pull_event)
+        self._setup_pull_lock_stub(aws_stubs=aws_stubs)
+        aws_stubs.s3.add_response(
+            method='get_object',
+            expected_params={'Bucket': bucket_name_pull_state, 'Key': pull_manifest_key(peer_id=peer_id)},
+            service_response={'Body': self._streaming_body(PullManifest(peer_id=peer_id).serialize()), 'ETag': '"v2"'}
+        )
+        aws_stubs.s3.add_response(
+            method='get_object',
+            expected_params={'Bucket': bucket_name_pull_state, 'Key': pull_continuation_key(peer_id=peer_id)},
+            service_response={'Body': self._streaming_body(gzip.compress(json.dumps(continuation).encode("utf-8")))}
+        )
+        aws_stubs.s3.add_response(
+            method='put_object',
+            expected_params={'Bucket': bucket_name_upload, 'Key': f"{peer_id}/{second_csv_file}", 'Body': ANY},
+            service_response={}
+        )
+        aws_stubs.s3.add_response(
+            method='put_object',
+            expected_params={
+                'Bucket': bucket_name_pull_state, 'Key': pull_manifest_key(peer_id=peer_id), 'Body': ANY, 'IfMatch': '"v2"'
+            },
+            service_response={'ETag': '"v3"'}
+        )
+        self._setup_pull_lock_release_stub(aws_stubs=aws_stubs)
+
+        download_mock = self._setup_sftp_download_mock(mocker=mocker, remote_files=[])
+
+        pull_test_context = PullTestContext(context_under_test=aws_stubs.test_context())
+
+        response = handler(cloudwatch_event=pull_event.to_dict(), context=ExpiringContext(remaining_millis=200_000), pull_test_context=pull_test_context)
+        assert response == {
+            "statusCode": 200,
+            "headers": {},
+            "body": {
+                'imported': [second_csv_file]
+            }
+        }
+
+        assert download_mock.call_args.kwargs["sftp_file_items"] == [remaining_file]
+        aws_stubs.s3.assert_no_pending_responses()
+
+    @staticmethod
+    def _streaming_body(data: bytes) -> StreamingBody:
+        return StreamingBody(BytesIO(data), len(data))
+
+    @staticmethod
+    def _setup_pull_lock_stub(aws_stubs: AwsStubs) -> None:
+        aws_stubs.s3.add_response(
+            method='put_object',
+            expected_params={'Bucket': bucket_name_pull_state, 'Key': pull_lock_key(peer_id=peer_id), 'Body': ANY, 'IfNoneMatch': '*'},
+            service_response={'ETag': '"lease"'}
+        )
+
+    @staticmethod
+    def _setup_pull_lock_release_stub(aws_stubs: AwsStubs) -> None:
+        aws_stubs.s3.add_response(
+            method='delete_object',
+            expected_params={'Bucket': bucket_name_pull_state, 'Key': pull_lock_key(peer_id=peer_id), 'IfMatch': '"lease"'},
+            service_response={}
+        )
+
+    @staticmethod
+    def _setup_sftp_download_mock(mocker: MockerFixture, remote_files: List[SftpFileItem]) -> MockType:
+        def download(download_eligable, download_handler, may_start_download=None, sftp_file_items=None, resume_offset=None, downloads_stored=None, **kwargs):
+            downloaded = []
+            for f in remote_files if sftp_file_items is None else sftp_file_items:
+                if download_eligable(f) and (may_start_download is None or may_start_download(f)):
+                    if resume_offset:
+                        resume_offset(f)
+                    download_handler(f, BytesIO(b"a;b"))
+                    downloaded.append(f)
+            if downloads_stored:
+                downloads_stored(downloaded)
+            return downloaded
+        return mocker.patch('pull.app._download_new_sftp_files', side_effect=download)
+
+
     @staticmethod
     def _setup_mocks_sftp_connect_failure(mocker: MockerFixture) -> MockType:
         def unauthenticated(*args, **kwargs):
@@ -0,0 +1,150 @@
+import json
+from typing import Any, Dict, List
+
+import boto3
+import pytest
+from aws_lambda_typing import context as ctx
+from botocore.stub import Stubber
+from pytest_mock import MockerFixture
+
+from pull.app import PullTestContext, handler
+from pull.entities.sftp_pull_batch_event import SftpPullBatchEvent
+from test_utils.entities.aws_stubs import AwsStubs
+from test_utils.fixtures import Fixtures
+from utils.common import peer_secret_id
+from utils.metrics import LocalMetricClient, metric_lambda_pull
+from utils.s3 import PAGINATOR_DEFAULT_PAGE_SIZE
+
+bucket_name_upload = "tb-terrasam-dev"
+function_arn = "arn:aws:lambda:eu-west-1:123456789012:function:tb-terrasam-dev-pull"
+
+
+class ExpiringContext(ctx.Context):
+    def __init__(self, remaining_millis: int):
+        self.remaining_millis = remaining_millis
+        self.invoked_function_arn = function_arn
+
+    def get_remaining_time_in_millis(self) -> int:  # type: ignore
+        return self.remaining_millis
+
+
+class Test_Pull_Batch_Handler:
+
+    @pytest.mark.unit
+    def test_should_pull_all_pull_peers_and_isolate_failures(self, aws_stubs: AwsStubs, monkeypatch, mocker: MockerFixture):
+        monkeypatch.setenv("BUCKET_NAME_UPLOAD", bucket_name_upload)
+        monkeypatch.setenv("PEERS_JSON_UNDER_TEST", self._peers_config(pull_peers=["bank1", "bank2"], push_peers=["bank3"]))
+
+        self._setup_stubs_for_peer(aws_stubs=aws_stubs, peer_id="bank1", secret_available=True)
+        self._setup_stubs_for_peer(aws_stubs=aws_stubs, peer_id="bank2", secret_available=False)
+        download_mock = mocker.patch('pull.app._download_new_sftp_files', return_value=[])
+
+        metric_client = LocalMetricClient()
+        pull_test_context = PullTestContext(context_under_test=aws_stubs.test_context(metric_client=metric_client))
+
+        # a single worker keeps the order of stubbed responses deterministic
+        batch_event = SftpPullBatchEvent(ids=None, concurrency=1)
+        response = handler(cloudwatch_event=batch_event.to_dict(), context=ctx.Context(), pull_test_context=pull_test_context)
+
+        assert response["statusCode"] == 500
+        assert response["body"]["failed"] == ["bank2"]
+        assert response["body"]["peers"]["bank1"] == {"statusCode": 200, "imported": []}
+        assert response["body"]["peers"]["bank2"]["statusCode"] == 500
+        assert metric_client.rate_metrics[metric_lambda_pull] == [(1, {"peer": "bank1"}), (1, {"peer": "bank2"})]
+
+        download_mock.assert_called_once()
+        aws_stubs.ssm.assert_no_pending_responses()
+        aws_stubs.s3.assert_no_pending_responses()
+
+    @pytest.mark.unit
+    def test_should_only_pull_the_requested_peers(self, aws_stubs: AwsStubs, monkeypatch, mocker: MockerFixture):
+        monkeypatch.setenv("BUCKET_NAME_UPLOAD", bucket_name_upload)
+        monkeypatch.setenv("PEERS_JSON_UNDER_TEST", self._peers_config(pull_peers=["bank1", "bank2"], push_peers=[]))
+
+        self._setup_stubs_for_peer(aws_stubs=aws_stubs, peer_id="bank2", secret_available=True)
+        mocker.patch('pull.app._download_new_sftp_files', return_value=[])
+
+        pull_test_context = PullTestContext(context_under_test=aws_stubs.test_context())
+
+        response = handler(cloudwatch_event=SftpPullBatchEvent(ids=["bank2"]).to_dict(), context=ctx.Context(), pull_test_context=pull_test_context)
+
+        assert response == {
+            "statusCode": 200,
+            "headers": {},
+            "body": {
+                "peers": {"bank2": {"statusCode": 200, "imported": []}},
+                "failed": [],
+            }
+        }
+        aws_stubs.s3.assert_no_pending_responses()
+
+    @pytest.mark.unit
+    def test_should_defer_peers_to_a_new_invocation_before_running_out_of_time(self, aws_stubs: AwsStubs, monkeypatch, mocker: MockerFixture):
+        monkeypatch.setenv("BUCKET_NAME_UPLOAD", bucket_name_upload)
+        monkeypatch.setenv("PEERS_JSON_UNDER_TEST", self._peers_config(pull_peers=["bank1", "bank2", "bank3"], push_peers=[]))
+
+        self._setup_stubs_for_peer(aws_stubs=aws_stubs, peer_id="bank1", secret_available=True)
+        context = ExpiringContext(remaining_millis=200_000)
+
+        def run_out_of_time(**_: Any) -> List[Any]:
+            context.remaining_millis = 1000
+            return []
+
+        mocker.patch('pull.app._download_new_sftp_files', side_effect=run_out_of_time)
+
+        lambda_client = boto3.client("lambda", region_name="eu-west-1")
+        lambda_stub = Stubber(lambda_client)
+        lambda_stub.add_response(
+            method='invoke',
+            expected_params={
+                'FunctionName': function_arn,
+                'InvocationType': 'Event',
+                'Payload': json.dumps(SftpPullBatchEvent(ids=["bank2", "bank3"], concurrency=1, continuations=1).to_dict()),
+            },
+            service_response={'StatusCode': 202}
+        )
+        lambda_stub.activate()
+
+        pull_test_context = PullTestContext(context_under_test=aws_stubs.test_context(), lambda_client=lambda_client)
+
+        batch_event = SftpPullBatchEvent(ids=None, concurrency=1)
+        response = handler(cloudwatch_event=batch_event.to_dict(), context=context, pull_test_context=pull_test_context)
+
+        assert response == {
+            "statusCode": 200,
+            "headers": {},
+            "body": {
+                "peers": {"bank1": {"statusCode": 200, "imported": []}},
+                "failed": [],
+                "deferred": ["bank2", "bank3"],
+                "continuation": {"continued": True, "remaining": 2},
+            }
+        }
+        aws_stubs.s3.assert_no_pending_responses()
+        lambda_stub.assert_no_pending_responses()
+
+    @staticmethod
+    def _peers_config(pull_peers: List[str], push_peers: List[str]) -> str:
+        config: List[Dict[str, Any]] = []
+        for peer_id in pull_peers:
+            config += json.loads(Fixtures.peer_config(peer=peer_id, method="pull"))
+        for peer_id in push_peers:
+            config += json.loads(Fixtures.peer_config(peer=peer_id))
+        return json.dumps(config)
+
+    @staticmethod
+    def _setup_stubs_for_peer(aws_stubs: AwsStubs, peer_id: str, secret_available: bool) -> None:
+        aws_stubs.s3.add_response(
+            method='list_objects_v2',
+            expected_params={'Bucket': bucket_name_upload, 'Prefix': peer_id, "MaxKeys": PAGINATOR_DEFAULT_PAGE_SIZE},
+            service_response={"KeyCount": 0}
+        )
+        if secret_available:
+            _, private_key = Fixtures.generate_rsa_keys()
+            aws_stubs.ssm.add_response(
+                method='get_parameter',
+                expected_params={'Name': peer_secret_id(peer_id=peer_id), 'WithDecryption': True},
+                service_response={'Parameter': {'Value': private_key.decode("UTF-8")}}
+            )
+        else:
+            aws_stubs.ssm.add_client_error(method='get_parameter', service_error_code='ParameterNotFound', http_status_code=404)
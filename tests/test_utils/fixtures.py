@@ -21,8 +21,8 @@ class Fixtures:
         return datetime.fromtimestamp(1697203293, timezone.utc)
     
     @staticmethod
-    def create_sftp_file_item(filename: str, location: str, size: Optional[int] = None, last_modified: Optional[int] = None) -> SftpFileItem:
-        return SftpFileItem(filename=filename, location=location, size=size, last_modified=last_modified)
+    def create_sftp_file_item(filename: str, location: str, size: Optional[int] = None, last_modified: Optional[int] = None, sha256: Optional[str] = None) -> SftpFileItem:
+        return SftpFileItem(filename=filename, location=location, size=size, last_modified=last_modified, sha256=sha256)
     
     @staticmethod
     def create_s3_event(bucket_name: str, object_key: str, event_time: Optional[str] = None) -> S3Event:
@@ -0,0 +1,100 @@
+import threading
+import uuid
+from typing import Any, Dict, Tuple
+
+from botocore.exceptions import ClientError
+
+# CopyObject rejects larger sources
+COPY_OBJECT_MAX_SIZE = 5 * 1024 * 1024 * 1024
+
+
+class LocalS3Client:
+    """An in-memory stand-in for the S3 client calls `utils.s3` makes to store and copy objects. Bodies are consumed
+    but only their sizes are kept, so that benchmarks of large pulls measure the pull rather than the stand-in:
+
+        s3 = LocalS3Client()
+        upload_stream(client=s3, bucket_name="upload", key="bank1/large.csv", data=stream)
+        assert s3.objects[("upload", "bank1/large.csv")] == expected_size
+    """
+
+    def __init__(self):
+        self.objects: Dict[Tuple[str, str], int] = {}
+        self.uploads: Dict[str, Dict[int, int]] = {}
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def put_object(self, Bucket: str, Key: str, Body: Any, **kwargs) -> Dict[str, Any]:
+        size = self._consume(Body)
+        with self.lock:
+            self.requests += 1
+            self.objects[(Bucket, Key)] = size
+        return {"ETag": f'"{uuid.uuid4().hex}"'}
+
+    def create_multipart_upload(self, Bucket: str, Key: str, **kwargs) -> Dict[str, Any]:
+        upload_id = uuid.uuid4().hex
+        with self.lock:
+            self.requests += 1
+            self.uploads[upload_id] = {}
+        return {"UploadId": upload_id}
+
+    def upload_part(self, Bucket: str, Key: str, UploadId: str, PartNumber: int, Body: Any, **kwargs) -> Dict[str, Any]:
+        size = self._consume(Body)
+        with self.lock:
+            self.requests += 1
+            self.uploads[UploadId][PartNumber] = size
+        return {"ETag": f'"{UploadId}-{PartNumber}"'}
+
+    def complete_multipart_upload(self, Bucket: str, Key: str, UploadId: str, MultipartUpload: Dict[str, Any], **kwargs) -> Dict[str, Any]:
+        with self.lock:
+            self.requests += 1
+            parts = self.uploads.pop(UploadId)
+            self.objects[(Bucket, Key)] = sum(parts[part["PartNumber"]] for part in MultipartUpload["Parts"])
+        return {"ETag": f'"{UploadId}-{len(parts)}"'}
+
+    def abort_multipart_upload(self, Bucket: str, Key: str, UploadId: str, **kwargs) -> Dict[str, Any]:
+        with self.lock:
+            self.requests += 1
+            self.uploads.pop(UploadId, None)
+        return {}
+
+    def head_object(self, Bucket: str, Key: str, **kwargs) -> Dict[str, Any]:
+        with self.lock:
+            self.requests += 1
+            size = self._size(Bucket, Key, operation_name="HeadObject")
+        return {"ContentLength": size, "ETag": f'"{Bucket}/{Key}"', "Metadata": {}}
+
+    def copy_object(self, CopySource: Dict[str, str], Bucket: str, Key: str, **kwargs) -> Dict[str, Any]:
+        with self.lock:
+            self.requests += 1
+            size = self._size(CopySource["Bucket"], CopySource["Key"], operation_name="CopyObject")
+            if size > COPY_OBJECT_MAX_SIZE:
+                raise ClientError(
+                    {"Error": {"Code": "InvalidRequest", "Message": "The specified copy source is too large."}},
+                    "CopyObject",
+                )
+            self.objects[(Bucket, Key)] = size
+        return {"CopyObjectResult": {"ETag": f'"{uuid.uuid4().hex}"'}}
+
+    def upload_part_copy(
+        self, Bucket: str, Key: str, UploadId: str, PartNumber: int, CopySource: Dict[str, str], CopySourceRange: str, **kwargs
+    ) -> Dict[str, Any]:
+        start, end = (int(offset) for offset in CopySourceRange.removeprefix("bytes=").split("-"))
+        with self.lock:
+            self.requests += 1
+            size = self._size(CopySource["Bucket"], CopySource["Key"], operation_name="UploadPartCopy")
+            self.uploads[UploadId][PartNumber] = min(end + 1, size) - start
+        return {"CopyPartResult": {"ETag": f'"{UploadId}-{PartNumber}"'}}
+
+    def _size(self, bucket: str, key: str, operation_name: str) -> int:
+        if (bucket, key) not in self.objects:
+            raise ClientError({"Error": {"Code": "NoSuchKey", "Message": "The specified key does not exist."}}, operation_name)
+        return self.objects[(bucket, key)]
+
+    @staticmethod
+    def _consume(body: Any) -> int:
+        if isinstance(body, (bytes, bytearray)):
+            return len(body)
+        size = 0
+        while chunk := body.read(1024 * 1024):
+            size += len(chunk)
+        return size
@@ -0,0 +1,255 @@
+import logging
+import os
+import queue
+import socket
+import threading
+import time
+from typing import List, Optional
+
+import paramiko
+from paramiko import SFTPAttributes, SFTPHandle, SFTPServer, SFTPServerInterface, ServerInterface
+
+logger = logging.getLogger()
+
+
+class _AcceptingServerInterface(ServerInterface):
+    """Accepts any public key, the server only ever listens on localhost during tests and benchmarks."""
+
+    def get_allowed_auths(self, username: str) -> str:
+        return "publickey"
+
+    def check_auth_publickey(self, username: str, key: paramiko.PKey) -> int:
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_channel_request(self, kind: str, chanid: int) -> int:
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+
+class _LocalSftpHandle(SFTPHandle):
+    def stat(self):
+        try:
+            return SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+
+
+class _LocalSftpServerInterface(SFTPServerInterface):
+    """Serves the files below `root` as if it was the home directory of the connected user."""
+
+    def __init__(self, server: ServerInterface, root: str, *args, **kwargs):
+        super().__init__(server, *args, **kwargs)
+        self.root = os.path.realpath(root)
+
+    def _local_path(self, path: str) -> str:
+        return os.path.join(self.root, os.path.normpath("/" + path).lstrip("/"))
+
+    def canonicalize(self, path: str) -> str:
+        # resolves symlinks like OpenSSH's realpath does
+        relative = os.path.relpath(os.path.realpath(self._local_path(path)), self.root)
+        if relative.startswith(".."):
+            return os.path.normpath("/" + path)
+        return "/" if relative == "." else "/" + relative
+
+    def list_folder(self, path: str):
+        local_path = self._local_path(path)
+        try:
+            attributes = []
+            for file_name in os.listdir(local_path):
+                attr = SFTPAttributes.from_stat(os.lstat(os.path.join(local_path, file_name)))
+                attr.filename = file_name
+                attributes.append(attr)
+            return attributes
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+
+    def stat(self, path: str):
+        try:
+            return SFTPAttributes.from_stat(os.stat(self._local_path(path)))
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+
+    def lstat(self, path: str):
+        try:
+            return SFTPAttributes.from_stat(os.lstat(self._local_path(path)))
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+
+    def open(self, path: str, flags: int, attr: SFTPAttributes):
+        local_path = self._local_path(path)
+        try:
+            fd = os.open(local_path, flags, 0o644)
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+
+        if flags & os.O_WRONLY:
+            mode = "ab" if flags & os.O_APPEND else "wb"
+        elif flags & os.O_RDWR:
+            mode = "a+b" if flags & os.O_APPEND else "r+b"
+        else:
+            mode = "rb"
+
+        handle = _LocalSftpHandle(flags)
+        f = os.fdopen(fd, mode)
+        handle.filename = local_path
+        handle.readfile = f
+        handle.writefile = f
+        return handle
+
+    def remove(self, path: str):
+        try:
+            os.remove(self._local_path(path))
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def rename(self, oldpath: str, newpath: str):
+        try:
+            os.rename(self._local_path(oldpath), self._local_path(newpath))
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def posix_rename(self, oldpath: str, newpath: str):
+        return self.rename(oldpath, newpath)
+
+    def mkdir(self, path: str, attr: SFTPAttributes):
+        try:
+            os.mkdir(self._local_path(path))
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def rmdir(self, path: str):
+        try:
+            os.rmdir(self._local_path(path))
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def chattr(self, path: str, attr: SFTPAttributes):
+        return paramiko.SFTP_OK
+
+
+class _LatencyProxy:
+    """Forwards TCP connections to `target_port` and delays every chunk of data by `one_way_delay` seconds in each
+    direction. Unlike a sleep inside the server, the delay does not limit how many requests can be in flight, so
+    pipelined clients benefit exactly like they would on a long distance link."""
+
+    def __init__(self, target_port: int, one_way_delay: float):
+        self.target_port = target_port
+        self.one_way_delay = one_way_delay
+        self.listener = socket.create_server(("127.0.0.1", 0))
+        self.port = self.listener.getsockname()[1]
+        self.sockets: List[socket.socket] = []
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self) -> None:
+        while True:
+            try:
+                client, _ = self.listener.accept()
+            except OSError:
+                return
+            upstream = socket.create_connection(("127.0.0.1", self.target_port))
+            self.sockets += [client, upstream]
+            self._pump(source=client, destination=upstream)
+            self._pump(source=upstream, destination=client)
+
+    def _pump(self, source: socket.socket, destination: socket.socket) -> None:
+        in_transit: queue.SimpleQueue = queue.SimpleQueue()
+
+        def receive() -> None:
+            while True:
+                try:
+                    data = source.recv(65536)
+                except OSError:
+                    data = b""
+                in_transit.put((time.monotonic() + self.one_way_delay, data))
+                if not data:
+                    return
+
+        def deliver() -> None:
+            while True:
+                deliver_at, data = in_transit.get()
+                delay = deliver_at - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                try:
+                    if not data:
+                        destination.shutdown(socket.SHUT_WR)
+                        return
+                    destination.sendall(data)
+                except OSError:
+                    return
+
+        threading.Thread(target=receive, daemon=True).start()
+        threading.Thread(target=deliver, daemon=True).start()
+
+    def close(self) -> None:
+        self.listener.close()
+        for s in self.sockets:
+            s.close()
+
+
+class LocalSftpServer:
+    """An in-process SFTP server backed by paramiko, serving the directory `root`. Use it as a context manager:
+
+        with LocalSftpServer(root=tmp_path, latency=0.05) as server:
+            download_new_files(sftp_host=server.host, sftp_port=server.port, ...)
+
+    Args:
+        root (str): local directory acting as the home directory of every user
+        latency (float, optional): round trip time in seconds injected between client and server. Defaults to 0.
+    """
+
+    host = "127.0.0.1"
+
+    def __init__(self, root: str, latency: float = 0.0):
+        self.root = str(root)
+        self.latency = latency
+        self.host_key = paramiko.RSAKey.generate(bits=2048)
+        self.transports: List[paramiko.Transport] = []
+        self.listener: Optional[socket.socket] = None
+        self.proxy: Optional[_LatencyProxy] = None
+
+    @property
+    def port(self) -> int:
+        if self.proxy:
+            return self.proxy.port
+        assert self.listener
+        return self.listener.getsockname()[1]
+
+    def __enter__(self) -> "LocalSftpServer":
+        self.listener = socket.create_server((self.host, 0))
+        threading.Thread(target=self._accept, daemon=True).start()
+        if self.latency > 0:
+            self.proxy = _LatencyProxy(target_port=self.listener.getsockname()[1], one_way_delay=self.latency / 2)
+        return self
+
+    def __exit__(self, *args) -> None:
+        if self.proxy:
+            self.proxy.close()
+        if self.listener:
+            self.listener.close()
+        for transport in self.transports:
+            transport.close()
+
+    def _accept(self) -> None:
+        assert self.listener
+        while True:
+            try:
+                connection, _ = self.listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(connection,), daemon=True).start()
+
+    def _serve(self, connection: socket.socket) -> None:
+        transport = paramiko.Transport(connection)
+        transport.add_server_key(self.host_key)
+        transport.set_subsystem_handler("sftp", SFTPServer, _LocalSftpServerInterface, self.root)
+        self.transports.append(transport)
+        try:
+            transport.start_server(server=_AcceptingServerInterface())
+        except (paramiko.SSHException, EOFError):
+            logger.exception("Local SFTP server failed to negotiate a session.")
@@ -0,0 +1,82 @@
+import pytest
+
+from utils.deadline import Deadline
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class Test_Deadline:
+
+    @pytest.mark.unit
+    def test_should_always_start_without_deadline(self):
+        deadline = Deadline(remaining_millis=lambda: None)
+
+        assert all(deadline.may_start(size=10**12) for _ in range(3))
+
+    @pytest.mark.unit
+    def test_should_always_start_the_first_transfer(self):
+        deadline = Deadline(remaining_millis=lambda: 1000, safety_margin_seconds=30)
+
+        assert deadline.may_start(size=10**9)
+        assert not deadline.may_start(size=0)
+        assert deadline.deferred == 1
+
+    @pytest.mark.unit
+    def test_should_estimate_transfer_durations_from_observed_throughput(self):
+        clock = FakeClock()
+        remaining = {"millis": 100_000}
+        deadline = Deadline(remaining_millis=lambda: remaining["millis"], safety_margin_seconds=30, monotonic=clock)
+
+        assert deadline.may_start(size=1000)
+        clock.now = 10.0
+        deadline.record_transfer(size=1000)  # 100 bytes per second
+
+        # 70 seconds left after the safety margin
+        assert deadline.may_start(size=6900)
+        assert not deadline.may_start(size=7100)
+
+        remaining["millis"] = 29_000
+        assert not deadline.may_start(size=0)
+
+    @pytest.mark.unit
+    def test_should_have_time_left_until_the_safety_margin(self):
+        remaining = {"millis": 31_000}
+        deadline = Deadline(remaining_millis=lambda: remaining["millis"], safety_margin_seconds=30)
+
+        assert deadline.has_time_left()
+        remaining["millis"] = 30_000
+        assert not deadline.has_time_left()
+        assert Deadline(remaining_millis=lambda: None).has_time_left()
+
+    @pytest.mark.unit
+    def test_should_share_the_observed_throughput_between_concurrent_transfers(self):
+        clock = FakeClock()
+        deadline = Deadline(remaining_millis=lambda: 100_000, safety_margin_seconds=30, monotonic=clock)
+
+        assert deadline.may_start(size=1000)
+        clock.now = 10.0
+        deadline.record_transfer(size=1000)  # 100 bytes per second over all channels
+
+        # 70 seconds left after the safety margin, a second concurrent transfer only gets half of the throughput
+        assert deadline.may_start(size=10)
+        assert deadline.may_start(size=3400)
+        assert not deadline.may_start(size=2400)
+
+        # once a concurrent transfer ended, the others get a larger share
+        deadline.record_incomplete()
+        assert deadline.may_start(size=3400)
+
+    @pytest.mark.unit
+    def test_should_assume_a_conservative_throughput_until_a_transfer_completed(self):
+        deadline = Deadline(remaining_millis=lambda: 100_000, safety_margin_seconds=30, default_bytes_per_second=1000)
+
+        assert deadline.may_start(size=10**12)
+        # the first transfer is still running, the second would get 500 bytes per second for 70 seconds
+        assert deadline.may_start(size=34_000)
+        assert not deadline.may_start(size=24_000)
@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from utils.listing_index import ListingIndex
+from utils.s3 import BucketItem
+
+january = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def items(*keys_and_days):
+    return [
+        BucketItem(key=key, last_modified=None if day is None else january + timedelta(days=day))
+        for key, day in keys_and_days
+    ]
+
+
+class Test_Listing_Index:
+
+    @pytest.mark.unit
+    def test_should_restore_the_indexed_items_in_key_order(self):
+        listing = items(("bank1/b.csv", 2), ("bank1/a.csv", None), ("bank1/ü.csv", 1), ("bank1/z.csv", 3))
+
+        index = ListingIndex.from_bucket_items(iter(listing))
+
+        assert len(index) == 4
+        assert list(index) == sorted(listing, key=lambda item: item.key.encode("utf-8"))
+
+    @pytest.mark.unit
+    def test_should_look_up_prefixes_and_key_ranges(self):
+        index = ListingIndex.from_bucket_items(
+            items(("bank1/2023/a.csv", 0), ("bank1/2024/a.csv", 0), ("bank1/2024/b.csv", 0), ("bank10/a.csv", 0))
+        )
+
+        assert [item.key for item in index.with_prefix("bank1/2024/")] == ["bank1/2024/a.csv", "bank1/2024/b.csv"]
+        assert [item.key for item in index.with_prefix("bank1")] == [item.key for item in index]
+        assert len(index.with_prefix("bank2")) == 0
+        assert [item.key for item in index.key_range(start="bank1/2024/b.csv", end="bank10/")] == ["bank1/2024/b.csv"]
+        assert len(index.key_range(start="bank2", end="bank1")) == 0
+
+    @pytest.mark.unit
+    def test_should_filter_by_modification_time(self):
+        index = ListingIndex.from_bucket_items(
+            items(("bank1/a.csv", 1), ("bank1/b.csv", 2), ("bank1/c.csv", None), ("bank1/d.csv", 3))
+        )
+        start, end = january + timedelta(days=2), january + timedelta(days=3)
+
+        assert [item.key for item in index.modified_between(start=start, end=end)] == [
+            "bank1/b.csv",
+            "bank1/c.csv",
+            "bank1/d.csv",
+        ]
+        assert [item.key for item in index.modified_between(start=None, end=start, include_unknown=False)] == [
+            "bank1/a.csv",
+            "bank1/b.csv",
+        ]
+        assert [item.key for item in index.modified_between(start=start.replace(tzinfo=None), end=None)] == [
+            "bank1/b.csv",
+            "bank1/c.csv",
+            "bank1/d.csv",
+        ]
+        assert [item.key for item in index.without_last_modified()] == ["bank1/c.csv"]
+
+    @pytest.mark.unit
+    def test_should_index_more_items_than_fit_into_a_batch(self, mocker):
+        mocker.patch("utils.listing_index.LISTING_INDEX_BATCH_SIZE", 3)
+        listing = items(*((f"bank1/{n:02d}.csv", n) for n in reversed(range(10))))
+
+        index = ListingIndex.from_bucket_items(listing)
+
+        assert list(index) == list(reversed(listing))
+
+    @pytest.mark.unit
+    def test_should_index_empty_listings(self):
+        index = ListingIndex.from_bucket_items([])
+
+        assert len(index) == 0
+        assert len(index.with_prefix("bank1/").modified_between(start=january, end=None)) == 0
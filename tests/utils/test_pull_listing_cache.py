@@ -0,0 +1,77 @@
+import gzip
+from io import BytesIO
+
+import pytest
+from botocore.response import StreamingBody
+
+from test_utils.entities.aws_stubs import AwsStubs
+from utils.pull_listing_cache import (
+    PULL_LISTING_CACHE_MIN_AGE_SECONDS,
+    PullListingCache,
+    load_pull_listing_cache,
+    pull_listing_cache_key,
+    save_pull_listing_cache,
+)
+
+peer_id = "bank1"
+bucket_name_pull_state = "pull_state_bucket_name"
+now = 1_700_000_000.0
+entries = [("a.csv", 0o100644, 1, 1_600_000_000), ("sub", 0o40755, 4096, 1_600_000_000)]
+
+
+class Test_Pull_Listing_Cache:
+
+    @pytest.mark.unit
+    def test_should_reuse_listings_of_unchanged_directories_only(self):
+        cache = PullListingCache(peer_id=peer_id, directories={"/home/a": (100, entries), "/home/b": (100, entries)})
+
+        assert cache.lookup(path="/home/a", mtime=100) == entries
+        assert cache.lookup(path="/home/b", mtime=101) is None
+        assert cache.lookup(path="/home/c", mtime=100) is None
+        assert cache.lookup(path="/home/a", mtime=None) is None
+        assert (cache.hits, cache.misses) == (1, 3)
+        assert list(cache.visited) == ["/home/a"]
+
+    @pytest.mark.unit
+    def test_should_not_store_recently_modified_directories(self):
+        cache = PullListingCache(peer_id=peer_id)
+
+        cache.store(path="/home/old", mtime=int(now) - PULL_LISTING_CACHE_MIN_AGE_SECONDS - 1, entries=entries, now=now)
+        cache.store(path="/home/recent", mtime=int(now) - 1, entries=entries, now=now)
+        cache.store(path="/home/unknown", mtime=None, entries=entries, now=now)
+
+        assert list(cache.visited) == ["/home/old"]
+
+    @pytest.mark.unit
+    def test_should_only_keep_visited_directories_when_serializing(self):
+        cache = PullListingCache(peer_id=peer_id, directories={"/home/gone": (100, entries)})
+        cache.store(path="/home/new", mtime=100, entries=entries, now=now)
+
+        restored = PullListingCache.deserialize(peer_id=peer_id, data=cache.serialize())
+
+        assert restored.directories == {"/home/new": (100, entries)}
+
+    @pytest.mark.unit
+    def test_should_start_with_an_empty_cache_if_none_or_an_unreadable_one_is_stored(self, aws_stubs: AwsStubs):
+        aws_stubs.s3.add_client_error(
+            method="get_object",
+            service_error_code="NoSuchKey",
+            http_status_code=404,
+            expected_params={"Bucket": bucket_name_pull_state, "Key": pull_listing_cache_key(peer_id=peer_id)},
+        )
+        data = gzip.compress(b'{"version": 99}')
+        aws_stubs.s3.add_response(
+            method="get_object", service_response={"Body": StreamingBody(BytesIO(data), len(data))}
+        )
+
+        for _ in range(2):
+            cache = load_pull_listing_cache(client=aws_stubs.s3.client, bucket_name=bucket_name_pull_state, peer_id=peer_id)
+            assert cache.directories == {}
+
+    @pytest.mark.unit
+    def test_should_not_fail_if_the_cache_cannot_be_stored(self, aws_stubs: AwsStubs):
+        aws_stubs.s3.add_client_error(method="put_object", service_error_code="AccessDenied", http_status_code=403)
+
+        save_pull_listing_cache(
+            client=aws_stubs.s3.client, bucket_name=bucket_name_pull_state, cache=PullListingCache(peer_id=peer_id)
+        )
@@ -0,0 +1,135 @@
+import json
+from io import BytesIO
+
+import pytest
+from botocore.response import StreamingBody
+from botocore.stub import ANY
+
+from test_utils.entities.aws_stubs import AwsStubs
+from utils.pull_lock import acquire_pull_lock, pull_lock_key
+
+peer_id = "bank1"
+bucket_name_pull_state = "pull_state_bucket_name"
+now = 1_700_000_000.0
+lock_key = pull_lock_key(peer_id=peer_id)
+
+
+def lease_body(owner: str, expires: float) -> StreamingBody:
+    data = json.dumps({"peer_id": peer_id, "owner": owner, "expires": expires}).encode("utf-8")
+    return StreamingBody(BytesIO(data), len(data))
+
+
+class Test_Pull_Lock:
+
+    @pytest.mark.unit
+    def test_should_acquire_and_release_a_free_lock(self, aws_stubs: AwsStubs):
+        aws_stubs.s3.add_response(
+            method="put_object",
+            expected_params={"Bucket": bucket_name_pull_state, "Key": lock_key, "Body": ANY, "IfNoneMatch": "*"},
+            service_response={"ETag": '"lease"'},
+        )
+        aws_stubs.s3.add_response(
+            method="delete_object",
+            expected_params={"Bucket": bucket_name_pull_state, "Key": lock_key, "IfMatch": '"lease"'},
+            service_response={},
+        )
+
+        lease = acquire_pull_lock(
+            client=aws_stubs.s3.client, bucket_name=bucket_name_pull_state, peer_id=peer_id, owner="me", now=lambda: now
+        )
+        assert lease is not None
+        lease.release()
+        lease.release()
+
+        aws_stubs.s3.assert_no_pending_responses()
+
+    @pytest.mark.unit
+    def test_should_not_acquire_a_lock_held_by_another_pull(self, aws_stubs: AwsStubs):
+        aws_stubs.s3.add_client_error(method="put_object", service_error_code="PreconditionFailed", http_status_code=412)
+        aws_stubs.s3.add_response(
+            method="get_object",
+            expected_params={"Bucket": bucket_name_pull_state, "Key": lock_key},
+            service_response={"Body": lease_body(owner="other", expires=now + 1), "ETag": '"other"'},
+        )
+
+        lease = acquire_pull_lock(
+            client=aws_stubs.s3.client, bucket_name=bucket_name_pull_state, peer_id=peer_id, owner="me", now=lambda: now
+        )
+
+        assert lease is None
+        aws_stubs.s3.assert_no_pending_responses()
+
+    @pytest.mark.unit
+    def test_should_take_over_an_expired_lock_unless_another_pull_did_so_first(self, aws_stubs: AwsStubs):
+        aws_stubs.s3.add_client_error(method="put_object", service_error_code="PreconditionFailed", http_status_code=412)
+        aws_stubs.s3.add_response(
+            method="get_object",
+            service_response={"Body": lease_body(owner="crashed", expires=now - 1), "ETag": '"crashed"'},
+        )
+        aws_stubs.s3.add_client_error(
+            method="put_object",
+            service_error_code="PreconditionFailed",
+            http_status_code=412,
+            expected_params={"Bucket": bucket_name_pull_state, "Key": lock_key, "Body": ANY, "IfMatch": '"crashed"'},
+        )
+        aws_stubs.s3.add_response(
+            method="get_object",
+            service_response={"Body": lease_body(owner="faster", expires=now + 120), "ETag": '"faster"'},
+        )
+
+        assert acquire_pull_lock(
+            client=aws_stubs.s3.client, bucket_name=bucket_name_pull_state, peer_id=peer_id, owner="me", now=lambda: now
+        ) is None
+
+        aws_stubs.s3.add_client_error(method="put_object", service_error_code="PreconditionFailed", http_status_code=412)
+        aws_stubs.s3.add_response(
+            method="get_object",
+            service_response={"Body": lease_body(owner="crashed", expires=now - 1), "ETag": '"crashed"'},
+        )
+        aws_stubs.s3.add_response(
+            method="put_object",
+            expected_params={"Bucket": bucket_name_pull_state, "Key": lock_key, "Body": ANY, "IfMatch": '"crashed"'},
+            service_response={"ETag": '"mine"'},
+        )
+
+        lease = acquire_pull_lock(
+            client=aws_stubs.s3.client, bucket_name=bucket_name_pull_state, peer_id=peer_id, owner="me", now=lambda: now
+        )
+
+        assert lease is not None and lease.etag == '"mine"'
+        aws_stubs.s3.assert_no_pending_responses()
+
+    @pytest.mark.unit
+    def test_should_renew_the_lease_until_it_is_lost(self, aws_stubs: AwsStubs):
+        aws_stubs.s3.add_response(method="put_object", service_response={"ETag": '"lease"'})
+        aws_stubs.s3.add_response(
+            method="put_object",
+            expected_params={"Bucket": bucket_name_pull_state, "Key": lock_key, "Body": ANY, "IfMatch": '"lease"'},
+            service_response={"ETag": '"renewed"'},
+        )
+        aws_stubs.s3.add_client_error(
+            method="put_object",
+            service_error_code="PreconditionFailed",
+            http_status_code=412,
+            expected_params={"Bucket": bucket_name_pull_state, "Key": lock_key, "Body": ANY, "IfMatch": '"renewed"'},
+        )
+
+        lease = acquire_pull_lock(
+            client=aws_stubs.s3.client, bucket_name=bucket_name_pull_state, peer_id=peer_id, owner="me", now=lambda: now
+        )
+        assert lease is not None
+
+        assert lease.renew()
+        assert not lease.renew()
+        assert lease.lost
+
+        # a lost lease belongs to another pull, it must not be deleted
+        lease.release()
+        aws_stubs.s3.assert_no_pending_responses()
+
+    @pytest.mark.unit
+    def test_should_fail_if_the_lock_cannot_be_accessed(self, aws_stubs: AwsStubs):
+        aws_stubs.s3.add_client_error(method="put_object", service_error_code="AccessDenied", http_status_code=403)
+
+        with pytest.raises(ValueError, match="Unable to acquire pull lock for bank1."):
+            acquire_pull_lock(client=aws_stubs.s3.client, bucket_name=bucket_name_pull_state, peer_id=peer_id, owner="me")
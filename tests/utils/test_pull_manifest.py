@@ -0,0 +1,187 @@
+import gzip
+import json
+from datetime import datetime
+from io import BytesIO
+
+import pytest
+from botocore.response import StreamingBody
+from botocore.stub import ANY
+
+from test_utils.entities.aws_stubs import AwsStubs
+from test_utils.fixtures import Fixtures
+from utils.pull_manifest import (
+    PullManifest, load_pull_manifest, pull_manifest_from_bucket_items, pull_manifest_key, rebuild_pull_manifest,
+    save_pull_manifest
+)
+from utils.s3 import PAGINATOR_DEFAULT_PAGE_SIZE, BucketItem
+
+peer_id = "bank1"
+bucket_name_pull_state = "pull_state_bucket_name"
+bucket_name_upload = "upload_bucket_name"
+
+
+def _manifest_body(files) -> StreamingBody:
+    data = gzip.compress(json.dumps({"version": 1, "peer_id": peer_id, "files": files}).encode("utf-8"))
+    return StreamingBody(BytesIO(data), len(data))
+
+
+class Test_Pull_Manifest:
+
+    @pytest.mark.unit
+    def test_should_identify_files_by_remote_path_size_and_modification_time(self):
+        manifest = PullManifest(peer_id=peer_id)
+        manifest.add(Fixtures.create_sftp_file_item(filename="a.csv", location="./download/a.csv", size=10, last_modified=100))
+
+        assert manifest.contains(Fixtures.create_sftp_file_item(filename="a.csv", location="./download/a.csv", size=10, last_modified=100))
+        assert not manifest.contains(Fixtures.create_sftp_file_item(filename="a.csv", location="./other/a.csv", size=10, last_modified=100))
+        assert not manifest.contains(Fixtures.create_sftp_file_item(filename="a.csv", location="./download/a.csv", size=11, last_modified=100))
+        assert not manifest.contains(Fixtures.create_sftp_file_item(filename="a.csv", location="./download/a.csv", size=10, last_modified=101))
+        assert manifest.added == {"download/a.csv": (10, 100)}
+
+    @pytest.mark.unit
+    def test_should_match_any_file_at_a_remote_path_of_unknown_identity(self):
+        manifest = PullManifest(peer_id=peer_id, files={"download/a.csv": (None, None)})
+
+        assert manifest.contains(Fixtures.create_sftp_file_item(filename="a.csv", location="./download/a.csv", size=10, last_modified=100))
+
+    @pytest.mark.unit
+    def test_should_return_none_if_there_is_no_manifest(self, aws_stubs: AwsStubs):
+        aws_stubs.s3.add_client_error(method="get_object", service_error_code="NoSuchKey", http_status_code=404)
+
+        assert load_pull_manifest(client=aws_stubs.s3.client, bucket_name=bucket_name_pull_state, peer_id=peer_id) is None
+
+    @pytest.mark.unit
+    def test_should_read_version_1_manifests_and_roundtrip(self, aws_stubs: AwsStubs):
+        aws_stubs.s3.add_response(
+            method="get_object",
+            expected_params={"Bucket": bucket_name_pull_state, "Key": pull_manifest_key(peer_id=peer_id)},
+            service_response={"Body": _manifest_body(["download/a.csv"]), "ETag": '"v1"'},
+        )
+
+        manifest = load_pull_manifest(client=aws_stubs.s3.client, bucket_name=bucket_name_pull_state, peer_id=peer_id)
+
+        assert manifest is not None
+        assert manifest.files == {"download/a.csv": (None, None)}
+        assert manifest.etag == '"v1"'
+
+        manifest.add(Fixtures.create_sftp_file_item(filename="b.csv", location="./b.csv", size=10, last_modified=100))
+        assert PullManifest.deserialize(peer_id=peer_id, data=manifest.serialize()).files == manifest.files
+
+    @pytest.mark.unit
+    def test_should_create_new_manifests_only_if_none_exists(self, aws_stubs: AwsStubs):
+        aws_stubs.s3.add_response(
+            method="put_object",
+            expected_params={
+                "Bucket": bucket_name_pull_state, "Key": pull_manifest_key(peer_id=peer_id), "Body": ANY, "IfNoneMatch": "*"
+            },
+            service_response={"ETag": '"v1"'},
+        )
+
+        stored = save_pull_manifest(
+            client=aws_stubs.s3.client, bucket_name=bucket_name_pull_state,
+            manifest=PullManifest(peer_id=peer_id, files={"a.csv": (3, 100)})
+        )
+
+        assert stored.etag == '"v1"'
+        aws_stubs.s3.assert_no_pending_responses()
+
+    @pytest.mark.unit
+    def test_should_merge_concurrent_modifications(self, aws_stubs: AwsStubs):
+        key = pull_manifest_key(peer_id=peer_id)
+        aws_stubs.s3.add_client_error(
+            method="put_object", service_error_code="PreconditionFailed", http_status_code=412,
+            expected_params={"Bucket": bucket_name_pull_state, "Key": key, "Body": ANY, "IfMatch": '"v1"'},
+        )
+        aws_stubs.s3.add_response(
+            method="get_object",
+            expected_params={"Bucket": bucket_name_pull_state, "Key": key},
+            service_response={"Body": _manifest_body(["old.csv", "concurrent.csv"]), "ETag": '"v2"'},
+        )
+        aws_stubs.s3.add_response(
+            method="put_object",
+            expected_params={"Bucket": bucket_name_pull_state, "Key": key, "Body": ANY, "IfMatch": '"v2"'},
+            service_response={"ETag": '"v3"'},
+        )
+
+        manifest = PullManifest(peer_id=peer_id, files={"old.csv": (None, None)}, etag='"v1"')
+        manifest.add(Fixtures.create_sftp_file_item(filename="new.csv", location="./new.csv", size=3, last_modified=100))
+        stored = save_pull_manifest(client=aws_stubs.s3.client, bucket_name=bucket_name_pull_state, manifest=manifest)
+
+        assert stored.files == {"old.csv": (None, None), "concurrent.csv": (None, None), "new.csv": (3, 100)}
+        assert stored.etag == '"v3"'
+        aws_stubs.s3.assert_no_pending_responses()
+
+    @pytest.mark.unit
+    def test_should_index_the_contents_of_pulled_files(self):
+        manifest = PullManifest(peer_id=peer_id)
+        manifest.add(Fixtures.create_sftp_file_item(filename="a.csv", location="./a.csv", size=3, last_modified=100, sha256="aaa"))
+        manifest.add(Fixtures.create_sftp_file_item(filename="b.csv", location="./b.csv", size=3, last_modified=100, sha256="aaa"))
+        manifest.add(Fixtures.create_sftp_file_item(filename="c.csv", location="./c.csv", size=3, last_modified=100))
+
+        restored = PullManifest.deserialize(peer_id=peer_id, data=manifest.serialize())
+
+        assert restored.contents == {"aaa": "a.csv"}
+        assert restored.contains_content("aaa")
+        assert not restored.contains_content("bbb")
+        assert not restored.contains_content(None)
+
+    @pytest.mark.unit
+    def test_should_merge_contents_of_concurrent_modifications(self, aws_stubs: AwsStubs):
+        key = pull_manifest_key(peer_id=peer_id)
+        concurrent = PullManifest(peer_id=peer_id, files={"b.csv": (3, 100)}, contents={"bbb": "b.csv"})
+        aws_stubs.s3.add_client_error(method="put_object", service_error_code="PreconditionFailed", http_status_code=412)
+        aws_stubs.s3.add_response(
+            method="get_object",
+            expected_params={"Bucket": bucket_name_pull_state, "Key": key},
+            service_response={"Body": StreamingBody(BytesIO(concurrent.serialize()), len(concurrent.serialize())), "ETag": '"v2"'},
+        )
+        aws_stubs.s3.add_response(method="put_object", service_response={"ETag": '"v3"'})
+
+        manifest = PullManifest(peer_id=peer_id, etag='"v1"')
+        manifest.add(Fixtures.create_sftp_file_item(filename="a.csv", location="./a.csv", size=3, last_modified=100, sha256="aaa"))
+        stored = save_pull_manifest(client=aws_stubs.s3.client, bucket_name=bucket_name_pull_state, manifest=manifest)
+
+        assert stored.contents == {"aaa": "a.csv", "bbb": "b.csv"}
+        aws_stubs.s3.assert_no_pending_responses()
+
+    @pytest.mark.unit
+    def test_should_record_the_objects_of_files_pulled_in_append_mode(self):
+        manifest = PullManifest(peer_id=peer_id)
+        rolling = Fixtures.create_sftp_file_item(filename="rolling.csv", location="./rolling.csv", size=3, last_modified=100)
+        other = Fixtures.create_sftp_file_item(filename="other.csv", location="./other.csv", size=3, last_modified=100)
+        manifest.add(rolling, stored=BucketItem(key=f"{peer_id}/rolling.csv", etag='"e1"'))
+        manifest.add(other)
+
+        restored = PullManifest.deserialize(peer_id=peer_id, data=manifest.serialize())
+
+        assert restored.stored_version(rolling) == (BucketItem(key=f"{peer_id}/rolling.csv", etag='"e1"'), 3)
+        assert restored.stored_version(other) is None
+
+
+    @pytest.mark.unit
+    def test_should_rebuild_manifests_from_the_upload_bucket(self, aws_stubs: AwsStubs):
+        aws_stubs.s3.add_response(
+            method="list_objects_v2",
+            expected_params={"Bucket": bucket_name_upload, "Prefix": f"{peer_id}/", "MaxKeys": PAGINATOR_DEFAULT_PAGE_SIZE},
+            service_response={
+                "KeyCount": 3,
+                "Contents": [
+                    {"Key": f"{peer_id}/download/a.csv", "LastModified": datetime.fromisoformat("2023-10-13T12:00:00+00:00")},
+                    {"Key": f"{peer_id}/b_(2023-10-13_21-21-33_SGT).csv", "LastModified": datetime.fromisoformat("2023-10-13T12:00:00+00:00")},
+                    {"Key": f"{peer_id}/nested/c.tar_(2023-10-13_21-21-33_SGT).gz", "LastModified": datetime.fromisoformat("2023-10-13T12:00:00+00:00")},
+                ],
+            },
+        )
+
+        manifest = rebuild_pull_manifest(client=aws_stubs.s3.client, upload_bucket_name=bucket_name_upload, peer_id=peer_id)
+
+        assert manifest.files == {"download/a.csv": (None, None), "b.csv": (None, None), "nested/c.tar.gz": (None, None)}
+        assert manifest.etag is None
+
+    @pytest.mark.unit
+    def test_should_ignore_objects_of_other_peers(self):
+        manifest = pull_manifest_from_bucket_items(
+            peer_id=peer_id, items=[BucketItem(key=f"{peer_id}/a.csv"), BucketItem(key=f"{peer_id}0/b.csv")]
+        )
+
+        assert manifest.files == {"a.csv": (None, None)}
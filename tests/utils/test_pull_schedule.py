@@ -0,0 +1,107 @@
+from datetime import datetime, timedelta, timezone
+from io import BytesIO
+
+import pytest
+from botocore.response import StreamingBody
+
+from test_utils.entities.aws_stubs import AwsStubs
+from utils.pull_schedule import (
+    AdaptiveScheduleSettings,
+    PullArrivals,
+    load_pull_arrivals,
+    poll_decision,
+    pull_arrivals_key,
+)
+
+peer_id = "bank1"
+bucket_name_pull_state = "pull_state_bucket_name"
+# a Monday, 06:00 UTC
+delivery = datetime(2024, 1, 1, 6, 0, tzinfo=timezone.utc)
+settings = AdaptiveScheduleSettings(enabled=True, min_history=5, backoff_minutes=5, max_interval_minutes=60)
+
+
+def weekly_deliveries(weeks: int) -> PullArrivals:
+    arrivals = PullArrivals(peer_id=peer_id)
+    for week in range(weeks):
+        at = delivery + timedelta(weeks=week)
+        arrivals.record(polled_at=at.timestamp() + 300, modified=[int(at.timestamp())])
+    return arrivals
+
+
+class Test_Pull_Schedule:
+
+    @pytest.mark.unit
+    def test_should_poll_until_enough_arrivals_have_been_seen(self):
+        arrivals = weekly_deliveries(weeks=4)
+
+        assert poll_decision(arrivals=arrivals, settings=settings, now=(delivery + timedelta(days=31)).timestamp()) == (True, "learning")
+
+    @pytest.mark.unit
+    def test_should_poll_around_expected_arrivals(self):
+        arrivals = weekly_deliveries(weeks=6)
+        next_delivery = delivery + timedelta(weeks=6)
+
+        for offset in (timedelta(hours=-1), timedelta(0), timedelta(minutes=90)):
+            now = (next_delivery + offset).timestamp()
+            assert poll_decision(arrivals=arrivals, settings=settings, now=now) == (True, "expected")
+
+    @pytest.mark.unit
+    def test_should_back_off_outside_expected_windows(self):
+        arrivals = weekly_deliveries(weeks=6)
+        # Tuesday noon, nothing has ever arrived on a Tuesday
+        now = (delivery + timedelta(weeks=5, days=1, hours=6)).timestamp()
+        arrivals.last_poll = now - 4 * 60
+
+        assert poll_decision(arrivals=arrivals, settings=settings, now=now) == (False, "not-expected")
+        assert poll_decision(arrivals=arrivals, settings=settings, now=now + 60) == (True, "backoff-elapsed")
+
+        for _ in range(3):
+            arrivals.record(polled_at=now, modified=[])
+        assert poll_decision(arrivals=arrivals, settings=settings, now=now + 39 * 60) == (False, "not-expected")
+        assert poll_decision(arrivals=arrivals, settings=settings, now=now + 40 * 60) == (True, "backoff-elapsed")
+
+        for _ in range(5000):
+            arrivals.record(polled_at=now, modified=[])
+        assert poll_decision(arrivals=arrivals, settings=settings, now=now + 60 * 60) == (True, "backoff-elapsed")
+
+    @pytest.mark.unit
+    def test_should_poll_at_full_cadence_without_a_pattern(self):
+        arrivals = PullArrivals(peer_id=peer_id)
+        for hour in range(24 * 7):
+            at = delivery + timedelta(hours=hour)
+            arrivals.record(polled_at=at.timestamp(), modified=[int(at.timestamp())])
+
+        assert poll_decision(arrivals=arrivals, settings=settings, now=(delivery + timedelta(days=3, hours=5)).timestamp()) == (True, "expected")
+
+    @pytest.mark.unit
+    def test_should_spread_the_weight_of_a_pull_over_its_files(self):
+        arrivals = PullArrivals(peer_id=peer_id)
+        arrivals.record(
+            polled_at=delivery.timestamp(),
+            modified=[int(delivery.timestamp()), int((delivery + timedelta(hours=2)).timestamp()), None],
+        )
+
+        assert sum(arrivals.hours) == pytest.approx(1.0)
+        assert arrivals.hours[6] == pytest.approx(2 / 3)
+        assert arrivals.hours[8] == pytest.approx(1 / 3)
+        assert arrivals.weekdays[0] == pytest.approx(1.0)
+
+    @pytest.mark.unit
+    def test_should_restore_serialized_arrivals(self, aws_stubs: AwsStubs):
+        arrivals = weekly_deliveries(weeks=2)
+        data = arrivals.serialize()
+        aws_stubs.s3.add_response(
+            method="get_object",
+            expected_params={"Bucket": bucket_name_pull_state, "Key": pull_arrivals_key(peer_id=peer_id)},
+            service_response={"Body": StreamingBody(BytesIO(data), len(data))},
+        )
+
+        assert load_pull_arrivals(client=aws_stubs.s3.client, bucket_name=bucket_name_pull_state, peer_id=peer_id) == arrivals
+
+    @pytest.mark.unit
+    def test_should_start_without_history_if_none_is_stored(self, aws_stubs: AwsStubs):
+        aws_stubs.s3.add_client_error(method="get_object", service_error_code="NoSuchKey", http_status_code=404)
+
+        arrivals = load_pull_arrivals(client=aws_stubs.s3.client, bucket_name=bucket_name_pull_state, peer_id=peer_id)
+
+        assert arrivals == PullArrivals(peer_id=peer_id)
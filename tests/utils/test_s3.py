@@ -0,0 +1,681 @@
+import base64
+import hashlib
+import threading
+import time
+from datetime import datetime, timezone
+from io import BytesIO
+
+import pytest
+from botocore.exceptions import EndpointConnectionError
+from botocore.stub import ANY
+from paramiko import SSHException
+
+from test_utils.entities.aws_stubs import AwsStubs
+from test_utils.local_s3 import LocalS3Client
+from utils.s3 import (
+    MULTIPART_COPY_DEFAULT_PART_SIZE,
+    MULTIPART_UPLOAD_MIN_PART_SIZE,
+    BucketItem,
+    ObjectCopy,
+    copy_object,
+    copy_objects,
+    iter_bucket,
+    iter_bucket_sharded,
+    list_bucket,
+    list_bucket_sharded,
+    upload_file,
+    upload_appended_stream,
+    upload_parts,
+    upload_stream,
+)
+
+bucket_name = "upload_bucket_name"
+object_key = "bank1/large.csv"
+upload_id = "upload-id"
+modified = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def listing_page(keys, common_prefixes=(), next_token=None):
+    page = {
+        "KeyCount": len(keys) + len(common_prefixes),
+        "Contents": [{"Key": key, "LastModified": modified} for key in keys],
+        "IsTruncated": next_token is not None,
+    }
+    if common_prefixes:
+        page["CommonPrefixes"] = [{"Prefix": prefix} for prefix in common_prefixes]
+    if next_token:
+        page["NextContinuationToken"] = next_token
+    return page
+
+
+class NonSeekableStream:
+    """Wraps bytes in a stream that returns short reads and cannot seek, like a socket or a remote file handle."""
+
+    def __init__(self, content: bytes, max_read: int):
+        self.buffer = BytesIO(content)
+        self.max_read = max_read
+
+    def read(self, size: int = -1) -> bytes:
+        return self.buffer.read(min(size, self.max_read) if size >= 0 else self.max_read)
+
+
+class ListingClient:
+    """Lists a fixed set of keys in single pages, recording how many listings run at the same time."""
+
+    def __init__(self, keys, latency=0.01):
+        self.keys = sorted(keys)
+        self.latency = latency
+        self.running = 0
+        self.max_running = 0
+        self.listings = []
+        self.lock = threading.Lock()
+
+    def get_paginator(self, operation_name):
+        return self
+
+    def paginate(self, Bucket, Prefix, PaginationConfig, Delimiter=None, StartAfter=None):
+        with self.lock:
+            self.running += 1
+            self.listings.append((Prefix, Delimiter))
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(self.latency)
+        contents, common_prefixes = [], []
+        for key in self.keys:
+            if not key.startswith(Prefix):
+                continue
+            rest = key[len(Prefix):]
+            if Delimiter and Delimiter in rest:
+                common_prefix = Prefix + rest[: rest.index(Delimiter) + 1]
+                if common_prefix not in common_prefixes:
+                    common_prefixes.append(common_prefix)
+            else:
+                contents.append(key)
+        with self.lock:
+            self.running -= 1
+        yield listing_page(keys=contents, common_prefixes=common_prefixes)
+
+
+class Test_S3_Module:
+
+    @pytest.mark.unit
+    def test_should_upload_small_streams_using_a_single_put(self, aws_stubs: AwsStubs):
+        aws_stubs.s3.add_response(
+            method="put_object",
+            expected_params={"Bucket": bucket_name, "Key": object_key, "Body": ANY},
+            service_response={},
+        )
+
+        item = upload_stream(client=aws_stubs.s3.client, bucket_name=bucket_name, key=object_key, data=BytesIO(b"a;b"))
+
+        assert item.key == object_key
+        aws_stubs.s3.assert_no_pending_responses()
+
+    @pytest.mark.unit
+    def test_should_stream_large_files_in_parts(self, aws_stubs: AwsStubs):
+        part_size = MULTIPART_UPLOAD_MIN_PART_SIZE
+        content = b"x" * (2 * part_size + 10)
+
+        aws_stubs.s3.add_response(
+            method="create_multipart_upload",
+            expected_params={"Bucket": bucket_name, "Key": object_key},
+            service_response={"UploadId": upload_id},
+        )
+        for part_number in range(1, 4):
+            aws_stubs.s3.add_response(
+                method="upload_part",
+                expected_params={
+                    "Bucket": bucket_name, "Key": object_key, "UploadId": upload_id,
+                    "PartNumber": part_number, "Body": ANY
+                },
+                service_response={"ETag": f'"etag-{part_number}"'},
+            )
+        aws_stubs.s3.add_response(
+            method="complete_multipart_upload",
+            expected_params={
+                "Bucket": bucket_name, "Key": object_key, "UploadId": upload_id,
+                "MultipartUpload": {"Parts": [{"ETag": f'"etag-{n}"', "PartNumber": n} for n in range(1, 4)]}
+            },
+            service_response={},
+        )
+
+        item = upload_stream(
+            client=aws_stubs.s3.client, bucket_name=bucket_name, key=object_key,
+            data=NonSeekableStream(content=content, max_read=1024 * 1024), part_size=part_size, max_in_flight_parts=1
+        )
+
+        assert item.key == object_key
+        aws_stubs.s3.assert_no_pending_responses()
+
+    @pytest.mark.unit
+    def test_should_abort_the_multipart_upload_if_a_part_fails(self, aws_stubs: AwsStubs):
+        part_size = MULTIPART_UPLOAD_MIN_PART_SIZE
+
+        aws_stubs.s3.add_response(
+            method="create_multipart_upload",
+            expected_params={"Bucket": bucket_name, "Key": object_key},
+            service_response={"UploadId": upload_id},
+        )
+        aws_stubs.s3.add_client_error(method="upload_part", service_error_code="InternalError", http_status_code=500)
+        aws_stubs.s3.add_response(
+            method="abort_multipart_upload",
+            expected_params={"Bucket": bucket_name, "Key": object_key, "UploadId": upload_id},
+            service_response={},
+        )
+
+        with pytest.raises(ValueError, match="S3 file upload failed."):
+            upload_stream(
+                client=aws_stubs.s3.client, bucket_name=bucket_name, key=object_key,
+                data=BytesIO(b"x" * (part_size + 1)), part_size=part_size, max_in_flight_parts=1
+            )
+
+        aws_stubs.s3.assert_no_pending_responses()
+
+    @pytest.mark.unit
+    def test_should_abort_the_multipart_upload_if_the_source_fails(self, aws_stubs: AwsStubs):
+        part_size = MULTIPART_UPLOAD_MIN_PART_SIZE
+
+        class DroppingStream(NonSeekableStream):
+            def read(self, size: int = -1) -> bytes:
+                if self.buffer.tell() >= part_size:
+                    raise SSHException("Connection dropped")
+                return super().read(size)
+
+        aws_stubs.s3.add_response(method="create_multipart_upload", service_response={"UploadId": upload_id})
+        aws_stubs.s3.add_response(method="upload_part", service_response={"ETag": '"etag-1"'})
+        aws_stubs.s3.add_response(
+            method="abort_multipart_upload",
+            expected_params={"Bucket": bucket_name, "Key": object_key, "UploadId": upload_id},
+            service_response={},
+        )
+
+        with pytest.raises(SSHException, match="Connection dropped"):
+            upload_stream(
+                client=aws_stubs.s3.client, bucket_name=bucket_name, key=object_key,
+                data=DroppingStream(content=b"x" * (2 * part_size), max_read=part_size), part_size=part_size,
+                max_in_flight_parts=1
+            )
+
+        aws_stubs.s3.assert_no_pending_responses()
+
+    @pytest.mark.unit
+    def test_should_reject_part_sizes_below_the_s3_minimum(self, aws_stubs: AwsStubs):
+        with pytest.raises(ValueError):
+            upload_stream(
+                client=aws_stubs.s3.client, bucket_name=bucket_name, key=object_key, data=BytesIO(b"x"), part_size=1024
+            )
+
+    @pytest.mark.unit
+    def test_should_attach_metadata_known_once_small_streams_have_been_read(self, aws_stubs: AwsStubs):
+        data = BytesIO(b"a;b")
+        aws_stubs.s3.add_response(
+            method="put_object",
+            expected_params={"Bucket": bucket_name, "Key": object_key, "Body": ANY, "Metadata": {"read": "3"}},
+            service_response={},
+        )
+
+        upload_stream(
+            client=aws_stubs.s3.client, bucket_name=bucket_name, key=object_key, data=data,
+            metadata=lambda: {"read": str(data.tell())}
+        )
+
+        aws_stubs.s3.assert_no_pending_responses()
+
+    @pytest.mark.unit
+    def test_should_not_store_small_streams_rejected_after_reading(self, aws_stubs: AwsStubs):
+        item = upload_stream(
+            client=aws_stubs.s3.client, bucket_name=bucket_name, key=object_key, data=BytesIO(b"a;b"),
+            should_store=lambda: False
+        )
+
+        assert item is None
+        aws_stubs.s3.assert_no_pending_responses()
+
+    @pytest.mark.unit
+    def test_should_abort_multipart_uploads_rejected_after_reading(self, aws_stubs: AwsStubs):
+        part_size = MULTIPART_UPLOAD_MIN_PART_SIZE
+        data = BytesIO(b"x" * (part_size + 1))
+
+        aws_stubs.s3.add_response(
+            method="create_multipart_upload",
+            expected_params={"Bucket": bucket_name, "Key": object_key},
+            service_response={"UploadId": upload_id},
+        )
+        for part_number in range(1, 3):
+            aws_stubs.s3.add_response(method="upload_part", service_response={"ETag": f'"etag-{part_number}"'})
+        aws_stubs.s3.add_response(
+            method="abort_multipart_upload",
+            expected_params={"Bucket": bucket_name, "Key": object_key, "UploadId": upload_id},
+            service_response={},
+        )
+
+        item = upload_stream(
+            client=aws_stubs.s3.client, bucket_name=bucket_name, key=object_key, data=data, part_size=part_size,
+            max_in_flight_parts=1, should_store=lambda: data.tell() < part_size + 1
+        )
+
+        assert item is None
+        aws_stubs.s3.assert_no_pending_responses()
+
+    @pytest.mark.unit
+    def test_should_copy_the_previous_version_and_upload_only_the_appended_bytes(self, aws_stubs: AwsStubs):
+        previous_size = MULTIPART_UPLOAD_MIN_PART_SIZE
+        previous = BucketItem(key=object_key, etag='"previous"')
+
+        aws_stubs.s3.add_response(
+            method="create_multipart_upload",
+            expected_params={"Bucket": bucket_name, "Key": object_key},
+            service_response={"UploadId": upload_id},
+        )
+        aws_stubs.s3.add_response(
+            method="upload_part_copy",
+            expected_params={
+                "Bucket": bucket_name, "Key": object_key, "UploadId": upload_id, "PartNumber": 1,
+                "CopySource": {"Bucket": bucket_name, "Key": object_key},
+                "CopySourceRange": f"bytes=0-{previous_size - 1}", "CopySourceIfMatch": '"previous"'
+            },
+            service_response={"CopyPartResult": {"ETag": '"etag-1"'}},
+        )
+        aws_stubs.s3.add_response(
+            method="upload_part",
+            expected_params={
+                "Bucket": bucket_name, "Key": object_key, "UploadId": upload_id, "PartNumber": 2, "Body": b"c;d"
+            },
+            service_response={"ETag": '"etag-2"'},
+        )
+        aws_stubs.s3.add_response(
+            method="complete_multipart_upload",
+            expected_params={
+                "Bucket": bucket_name, "Key": object_key, "UploadId": upload_id,
+                "MultipartUpload": {"Parts": [{"ETag": '"etag-1"', "PartNumber": 1}, {"ETag": '"etag-2"', "PartNumber": 2}]}
+            },
+            service_response={"ETag": '"appended"'},
+        )
+
+        item = upload_appended_stream(
+            client=aws_stubs.s3.client, bucket_name=bucket_name, key=object_key, previous=previous,
+            previous_size=previous_size, data=BytesIO(b"c;d")
+        )
+
+        assert item == BucketItem(key=object_key, etag='"appended"')
+        aws_stubs.s3.assert_no_pending_responses()
+
+    @pytest.mark.unit
+    def test_should_abort_appending_if_the_previous_version_changed(self, aws_stubs: AwsStubs):
+        aws_stubs.s3.add_response(
+            method="create_multipart_upload",
+            expected_params={"Bucket": bucket_name, "Key": object_key},
+            service_response={"UploadId": upload_id},
+        )
+        aws_stubs.s3.add_client_error(method="upload_part_copy", service_error_code="PreconditionFailed", http_status_code=412)
+        aws_stubs.s3.add_response(
+            method="abort_multipart_upload",
+            expected_params={"Bucket": bucket_name, "Key": object_key, "UploadId": upload_id},
+            service_response={},
+        )
+
+        with pytest.raises(ValueError, match="S3 file upload failed."):
+            upload_appended_stream(
+                client=aws_stubs.s3.client, bucket_name=bucket_name, key=object_key,
+                previous=BucketItem(key=object_key, etag='"previous"'), previous_size=MULTIPART_UPLOAD_MIN_PART_SIZE,
+                data=BytesIO(b"c;d")
+            )
+
+        aws_stubs.s3.assert_no_pending_responses()
+
+    @pytest.mark.unit
+    def test_should_reject_appending_to_objects_smaller_than_a_part(self, aws_stubs: AwsStubs):
+        with pytest.raises(ValueError):
+            upload_appended_stream(
+                client=aws_stubs.s3.client, bucket_name=bucket_name, key=object_key,
+                previous=BucketItem(key=object_key, etag='"previous"'), previous_size=1024, data=BytesIO(b"c;d")
+            )
+
+    @pytest.mark.unit
+    def test_should_upload_parts_arriving_in_any_order_along_with_their_checksums(self, aws_stubs: AwsStubs):
+        parts = [(2, b"second", hashlib.sha256(b"second").digest()), (1, b"first", hashlib.sha256(b"first").digest())]
+        checksums = {n: base64.b64encode(digest).decode("ascii") for n, _, digest in parts}
+
+        aws_stubs.s3.add_response(
+            method="create_multipart_upload",
+            expected_params={"Bucket": bucket_name, "Key": object_key, "ChecksumAlgorithm": "SHA256"},
+            service_response={"UploadId": upload_id},
+        )
+        for part_number, body, _ in parts:
+            aws_stubs.s3.add_response(
+                method="upload_part",
+                expected_params={
+                    "Bucket": bucket_name, "Key": object_key, "UploadId": upload_id, "PartNumber": part_number,
+                    "Body": body, "ChecksumSHA256": checksums[part_number]
+                },
+                service_response={"ETag": f'"etag-{part_number}"'},
+            )
+        aws_stubs.s3.add_response(
+            method="complete_multipart_upload",
+            expected_params={
+                "Bucket": bucket_name, "Key": object_key, "UploadId": upload_id,
+                "MultipartUpload": {"Parts": [
+                    {"ETag": f'"etag-{n}"', "PartNumber": n, "ChecksumSHA256": checksums[n]} for n in (1, 2)
+                ]}
+            },
+            service_response={"ETag": '"complete"'},
+        )
+
+        item = upload_parts(client=aws_stubs.s3.client, bucket_name=bucket_name, key=object_key, parts=iter(parts), max_in_flight_parts=1)
+
+        assert item == BucketItem(key=object_key, etag='"complete"')
+        aws_stubs.s3.assert_no_pending_responses()
+
+    @pytest.mark.unit
+    def test_should_abort_uploading_parts_if_producing_a_part_fails(self, aws_stubs: AwsStubs):
+        def parts():
+            yield 1, b"first", hashlib.sha256(b"first").digest()
+            raise ValueError("changed while being read")
+
+        aws_stubs.s3.add_response(method="create_multipart_upload", service_response={"UploadId": upload_id})
+        aws_stubs.s3.add_response(method="upload_part", service_response={"ETag": '"etag-1"'})
+        aws_stubs.s3.add_response(
+            method="abort_multipart_upload",
+            expected_params={"Bucket": bucket_name, "Key": object_key, "UploadId": upload_id},
+            service_response={},
+        )
+
+        with pytest.raises(ValueError, match="S3 file upload failed."):
+            upload_parts(client=aws_stubs.s3.client, bucket_name=bucket_name, key=object_key, parts=parts(), max_in_flight_parts=1)
+
+        aws_stubs.s3.assert_no_pending_responses()
+
+    @pytest.mark.unit
+    def test_should_list_buckets_page_by_page(self, aws_stubs: AwsStubs):
+        aws_stubs.s3.add_response(
+            method="list_objects_v2",
+            expected_params={"Bucket": bucket_name, "Prefix": "bank1", "MaxKeys": 2},
+            service_response=listing_page(keys=["bank1/a.csv", "bank1/b.csv"], next_token="page-2"),
+        )
+        aws_stubs.s3.add_response(
+            method="list_objects_v2",
+            expected_params={"Bucket": bucket_name, "Prefix": "bank1", "MaxKeys": 2, "ContinuationToken": "page-2"},
+            service_response=listing_page(keys=["bank1/c.csv"]),
+        )
+
+        items = list_bucket(client=aws_stubs.s3.client, bucket_name=bucket_name, prefix="bank1", page_size=2)
+
+        assert items == [BucketItem(key=f"bank1/{name}.csv", last_modified=modified) for name in "abc"]
+        aws_stubs.s3.assert_no_pending_responses()
+
+    @pytest.mark.unit
+    def test_should_not_fetch_further_pages_once_iteration_stops(self, aws_stubs: AwsStubs):
+        aws_stubs.s3.add_response(
+            method="list_objects_v2",
+            service_response=listing_page(keys=["bank1/a.csv", "bank1/b.csv"], next_token="page-2"),
+        )
+
+        items = iter_bucket(client=aws_stubs.s3.client, bucket_name=bucket_name, prefix="bank1", page_size=2)
+
+        assert next(items).key == "bank1/a.csv"
+        items.close()
+        aws_stubs.s3.assert_no_pending_responses()
+
+    @pytest.mark.unit
+    def test_should_list_a_key_range(self, aws_stubs: AwsStubs):
+        aws_stubs.s3.add_response(
+            method="list_objects_v2",
+            expected_params={"Bucket": bucket_name, "Prefix": "bank1/", "MaxKeys": 2, "StartAfter": "bank1/a.csv"},
+            service_response=listing_page(keys=["bank1/b.csv", "bank1/c.csv"], next_token="page-2"),
+        )
+        aws_stubs.s3.add_response(
+            method="list_objects_v2",
+            service_response=listing_page(keys=["bank1/d.csv", "bank1/e.csv"], next_token="page-3"),
+        )
+
+        items = iter_bucket(
+            client=aws_stubs.s3.client,
+            bucket_name=bucket_name,
+            prefix="bank1/",
+            page_size=2,
+            start_after="bank1/a.csv",
+            end_before="bank1/e.csv",
+        )
+
+        assert [item.key for item in items] == ["bank1/b.csv", "bank1/c.csv", "bank1/d.csv"]
+        aws_stubs.s3.assert_no_pending_responses()
+
+    @pytest.mark.unit
+    def test_should_roll_up_keys_into_common_prefixes_in_key_order(self, aws_stubs: AwsStubs):
+        aws_stubs.s3.add_response(
+            method="list_objects_v2",
+            expected_params={"Bucket": bucket_name, "Prefix": "bank1/", "MaxKeys": 1000, "Delimiter": "/"},
+            service_response=listing_page(keys=["bank1/a.csv", "bank1/z.csv"], common_prefixes=["bank1/2024/"]),
+        )
+
+        items = list(iter_bucket(client=aws_stubs.s3.client, bucket_name=bucket_name, prefix="bank1/", delimiter="/"))
+
+        assert items == [
+            BucketItem(key="bank1/2024/"),
+            BucketItem(key="bank1/a.csv", last_modified=modified),
+            BucketItem(key="bank1/z.csv", last_modified=modified),
+        ]
+        aws_stubs.s3.assert_no_pending_responses()
+
+    @pytest.mark.unit
+    def test_should_fail_if_the_bucket_cannot_be_listed(self, aws_stubs: AwsStubs):
+        aws_stubs.s3.add_client_error(method="list_objects_v2", service_error_code="NoSuchBucket", http_status_code=404)
+
+        with pytest.raises(ValueError, match="Unable to list existing items in AWS S3."):
+            list(iter_bucket(client=aws_stubs.s3.client, bucket_name=bucket_name))
+
+    @pytest.mark.unit
+    def test_should_list_shards_of_sub_prefixes_in_key_order(self):
+        keys = ["bank1/2023/b.csv", "bank1/2023/c/d.csv", "bank1/2024/b.csv", "bank1/2024/c/d.csv", "bank1/a.csv"]
+        client = ListingClient(keys=keys)
+
+        items = list_bucket_sharded(client=client, bucket_name=bucket_name, prefix="bank1/", max_depth=1)
+
+        assert items == [BucketItem(key=key, last_modified=modified) for key in keys]
+        assert sorted(client.listings) == [("bank1/", "/"), ("bank1/2023/", None), ("bank1/2024/", None)]
+
+    @pytest.mark.unit
+    def test_should_list_shards_concurrently(self):
+        keys = [f"bank1/{year}/{n:03d}.csv" for year in range(2010, 2026) for n in range(20)] + ["bank1/z.csv"]
+        client = ListingClient(keys=keys)
+
+        items = iter_bucket_sharded(client=client, bucket_name=bucket_name, prefix="bank1", concurrency=4)
+
+        assert [item.key for item in items] == sorted(keys)
+        assert client.max_running > 1
+
+    @pytest.mark.unit
+    def test_should_fail_if_a_shard_cannot_be_listed(self, aws_stubs: AwsStubs):
+        aws_stubs.s3.add_response(
+            method="list_objects_v2", service_response=listing_page(keys=[], common_prefixes=["bank1/2024/"])
+        )
+        aws_stubs.s3.add_client_error(method="list_objects_v2", service_error_code="AccessDenied", http_status_code=403)
+
+        with pytest.raises(ValueError, match="Unable to list existing items in AWS S3."):
+            list_bucket_sharded(client=aws_stubs.s3.client, bucket_name=bucket_name, prefix="bank1/", max_depth=1)
+
+    @pytest.mark.unit
+    def test_should_upload_files_below_the_threshold_using_a_single_put(self, aws_stubs: AwsStubs, tmp_path):
+        path = tmp_path / "small.csv"
+        path.write_bytes(b"a;b")
+        with open(path, "rb") as data:
+            aws_stubs.s3.add_response(
+                method="put_object",
+                expected_params={"Bucket": bucket_name, "Key": object_key, "Body": data, "Metadata": {"peer": "bank1"}},
+                service_response={"ETag": '"small"'},
+            )
+
+            item = upload_file(
+                client=aws_stubs.s3.client, bucket_name=bucket_name, key=object_key, data=data, metadata={"peer": "bank1"}
+            )
+
+        assert item == BucketItem(key=object_key, etag='"small"')
+        aws_stubs.s3.assert_no_pending_responses()
+
+    @pytest.mark.unit
+    @pytest.mark.parametrize("seekable", [True, False])
+    def test_should_upload_large_files_in_concurrent_parts(self, seekable: bool):
+        part_size = MULTIPART_UPLOAD_MIN_PART_SIZE
+        content = b"x" * (3 * part_size + 10)
+        data = BytesIO(content) if seekable else NonSeekableStream(content=content, max_read=64 * 1024)
+        s3 = LocalS3Client()
+
+        upload_file(
+            client=s3,  # type: ignore
+            bucket_name=bucket_name,
+            key=object_key,
+            data=data,  # type: ignore
+            multipart_threshold=part_size,
+            part_size=part_size,
+            max_in_flight_parts=3,
+        )
+
+        assert s3.objects == {(bucket_name, object_key): len(content)}
+        # create, 4 parts and complete
+        assert s3.requests == 6
+
+    @pytest.mark.unit
+    def test_should_abort_large_uploads_if_a_part_fails(self, aws_stubs: AwsStubs):
+        part_size = MULTIPART_UPLOAD_MIN_PART_SIZE
+        aws_stubs.s3.add_response(
+            method="create_multipart_upload",
+            expected_params={"Bucket": bucket_name, "Key": object_key, "Metadata": {"peer": "bank1"}},
+            service_response={"UploadId": upload_id},
+        )
+        aws_stubs.s3.add_client_error(method="upload_part", service_error_code="InternalError", http_status_code=500)
+        aws_stubs.s3.add_response(
+            method="abort_multipart_upload",
+            expected_params={"Bucket": bucket_name, "Key": object_key, "UploadId": upload_id},
+            service_response={},
+        )
+
+        with pytest.raises(ValueError, match="S3 file upload failed."):
+            upload_file(
+                client=aws_stubs.s3.client,
+                bucket_name=bucket_name,
+                key=object_key,
+                data=BytesIO(b"x" * (part_size + 1)),
+                metadata={"peer": "bank1"},
+                multipart_threshold=part_size,
+                part_size=part_size,
+                max_in_flight_parts=1,
+            )
+
+        aws_stubs.s3.assert_no_pending_responses()
+
+    @pytest.mark.unit
+    def test_should_copy_objects_concurrently_and_report_each_copy(self):
+        s3 = LocalS3Client()
+        for n in range(50):
+            s3.objects[("categorized", f"bank1/{n:02d}.csv")] = n
+        copies = [
+            ObjectCopy(
+                source_bucket_name="categorized",
+                source_key=f"bank1/{n:02d}.csv",
+                destination_bucket_name="temp",
+                destination_key=f"request/bank1/{n:02d}.csv",
+            )
+            for n in range(51)
+        ]
+
+        results = copy_objects(client=s3, copies=iter(copies), concurrency=8)  # type: ignore
+
+        assert [result.copy for result in results] == copies
+        assert [result.item.key for result in results[:50]] == [copy.destination_key for copy in copies[:50]]
+        assert results[50].item is None and results[50].error == "Copying S3 object failed."
+        assert {key: size for (bucket, key), size in s3.objects.items() if bucket == "temp"} == {
+            f"request/bank1/{n:02d}.csv": n for n in range(50)
+        }
+
+    @pytest.mark.unit
+    def test_should_copy_objects_too_large_for_a_single_copy_in_parts(self):
+        s3 = LocalS3Client()
+        size = 6 * 1024 * 1024 * 1024 + 1
+        s3.objects[("incoming", "bank1/huge.csv")] = size
+
+        item = copy_object(
+            client=s3,  # type: ignore
+            source_bucket_name="incoming",
+            source_key="bank1/huge.csv",
+            destination_bucket_name="categorized",
+            destination_key="bank1/category/huge.csv",
+        )
+
+        assert item.key == "bank1/category/huge.csv"
+        assert s3.objects[("categorized", "bank1/category/huge.csv")] == size
+        # rejected copy, head, create, parts and complete
+        assert s3.requests == 4 + -(-size // MULTIPART_COPY_DEFAULT_PART_SIZE)
+
+    @pytest.mark.unit
+    def test_should_abort_copying_in_parts_if_the_connection_fails(self, aws_stubs: AwsStubs, mocker):
+        aws_stubs.s3.add_response(
+            method="head_object",
+            expected_params={"Bucket": "incoming", "Key": object_key},
+            service_response={"ContentLength": 10, "ETag": '"source"'},
+        )
+        aws_stubs.s3.add_response(
+            method="create_multipart_upload",
+            expected_params={"Bucket": bucket_name, "Key": object_key},
+            service_response={"UploadId": upload_id},
+        )
+        aws_stubs.s3.add_response(
+            method="abort_multipart_upload",
+            expected_params={"Bucket": bucket_name, "Key": object_key, "UploadId": upload_id},
+            service_response={},
+        )
+        mocker.patch.object(
+            aws_stubs.s3.client, "upload_part_copy", side_effect=EndpointConnectionError(endpoint_url="https://s3")
+        )
+
+        with pytest.raises(EndpointConnectionError):
+            copy_object(
+                client=aws_stubs.s3.client,
+                source_bucket_name="incoming",
+                source_key=object_key,
+                destination_bucket_name=bucket_name,
+                destination_key=object_key,
+                size=10,
+                multipart_threshold=0,
+            )
+
+        aws_stubs.s3.assert_no_pending_responses()
+
+    @pytest.mark.unit
+    def test_should_abort_copying_in_parts_if_a_part_fails(self, aws_stubs: AwsStubs):
+        aws_stubs.s3.add_response(
+            method="head_object",
+            expected_params={"Bucket": "incoming", "Key": object_key},
+            service_response={"ContentLength": 10, "ETag": '"source"', "Metadata": {"peer": "bank1"}, "ContentType": "text/csv"},
+        )
+        aws_stubs.s3.add_response(
+            method="create_multipart_upload",
+            expected_params={"Bucket": bucket_name, "Key": object_key, "Metadata": {"peer": "bank1"}, "ContentType": "text/csv"},
+            service_response={"UploadId": upload_id},
+        )
+        aws_stubs.s3.add_client_error(
+            method="upload_part_copy",
+            service_error_code="PreconditionFailed",
+            http_status_code=412,
+            expected_params={
+                "Bucket": bucket_name, "Key": object_key, "UploadId": upload_id, "PartNumber": 1,
+                "CopySource": {"Bucket": "incoming", "Key": object_key}, "CopySourceRange": "bytes=0-9",
+                "CopySourceIfMatch": '"source"',
+            },
+        )
+        aws_stubs.s3.add_response(
+            method="abort_multipart_upload",
+            expected_params={"Bucket": bucket_name, "Key": object_key, "UploadId": upload_id},
+            service_response={},
+        )
+
+        with pytest.raises(ValueError, match="Copying S3 object failed."):
+            copy_object(
+                client=aws_stubs.s3.client,
+                source_bucket_name="incoming",
+                source_key=object_key,
+                destination_bucket_name=bucket_name,
+                destination_key=object_key,
+                size=10,
+                multipart_threshold=0,
+            )
+
+        aws_stubs.s3.assert_no_pending_responses()
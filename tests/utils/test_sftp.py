@@ -1,10 +1,97 @@
+import hashlib
+import os
+import random
+import threading
+import time
+from io import StringIO
+import typing
+from io import BytesIO
+
+import paramiko
+from typing import Dict, List, Tuple
+
 import pytest
 
-from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
 from cryptography.hazmat.primitives import serialization
 
-from utils.sftp import is_useable_private_key
+from test_utils.fixtures import Fixtures
+from test_utils.local_sftp_server import LocalSftpServer
+from utils.pull_listing_cache import PullListingCache
+from utils.sftp import (
+    SFTP_TRANSPORT_BULK_WINDOW_SIZE, SSH_CONNECTION_POOL, SftpAfterDownloadSettings, SftpFileItem, SftpReadSettings, SftpRetrySettings, SftpStripe, SftpStripeSettings,
+    SftpTransportSettings, SftpWalkSettings, SshConnectionPool, _list_folder, _ordered_items, _pkey_class_candidates, _preferred_algorithms,
+    _visit_files_using_client, convert_to_pkey, download_new_files, is_useable_private_key, path_matcher, sftp_transport_settings
+)
+
+
+class FakeSftpFile(BytesIO):
+    def prefetch(self, file_size=None, max_concurrent_requests=None) -> None:
+        self.prefetched = (file_size, max_concurrent_requests)
+
+
+class FakeSftpClient:
+    """Minimal stand-in for paramiko's SFTPClient serving files from a dict."""
+
+    def __init__(self, files: Dict[str, bytes], channels: List["FakeSftpClient"]):
+        self.files = files
+        self.opened: List[str] = []
+        channels.append(self)
+
+    def open(self, location: str, mode: str, bufsize: int = -1) -> "FakeSftpFile":
+        if location not in self.files:
+            raise FileNotFoundError(location)
+        self.opened.append(location)
+        return FakeSftpFile(self.files[location])
+
+    def __enter__(self) -> "FakeSftpClient":
+        return self
+
+    def __exit__(self, *args) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class FakeSshClient:
+    def __init__(self, files: Dict[str, bytes]):
+        self.files = files
+        self.channels: List[FakeSftpClient] = []
+        self.active = True
+
+    def open_sftp(self) -> FakeSftpClient:
+        if not self.active:
+            raise paramiko.SSHException("SSH session not active")
+        return FakeSftpClient(files=self.files, channels=self.channels)
+
+    def get_transport(self) -> "FakeSshClient":
+        return self
+
+    def is_active(self) -> bool:
+        return self.active
+
+    def is_authenticated(self) -> bool:
+        return True
+
+
+
+class FakePooledSshClient:
+    def __init__(self):
+        self.active = True
+        self.closed = False
+
+    def get_transport(self) -> "FakePooledSshClient":
+        return self
+
+    def is_active(self) -> bool:
+        return self.active and not self.closed
+
+    def is_authenticated(self) -> bool:
+        return True
 
+    def close(self) -> None:
+        self.closed = True
 
 
 class Test_SFTP_Module:
@@ -36,3 +123,758 @@ class Test_SFTP_Module:
 
         assert is_useable_private_key(input=private_key_bytes.decode("utf-8")) is True
 
+
+    @pytest.mark.unit
+    @pytest.mark.parametrize("private_key, format, expected", [
+        (rsa.generate_private_key(public_exponent=65537, key_size=2048), serialization.PrivateFormat.TraditionalOpenSSL, (paramiko.RSAKey,)),
+        (rsa.generate_private_key(public_exponent=65537, key_size=2048), serialization.PrivateFormat.OpenSSH, (paramiko.RSAKey,)),
+        (ec.generate_private_key(ec.SECP256R1()), serialization.PrivateFormat.TraditionalOpenSSL, (paramiko.ECDSAKey,)),
+        (ec.generate_private_key(ec.SECP384R1()), serialization.PrivateFormat.OpenSSH, (paramiko.ECDSAKey,)),
+        (ed25519.Ed25519PrivateKey.generate(), serialization.PrivateFormat.OpenSSH, (paramiko.Ed25519Key,)),
+    ])
+    def test_should_detect_private_key_types_without_trial_parsing(self, private_key, format, expected):
+        private_key_pem = private_key.private_bytes(
+            encoding=serialization.Encoding.PEM, format=format, encryption_algorithm=serialization.NoEncryption()
+        ).decode("utf-8")
+
+        assert _pkey_class_candidates(input=private_key_pem) == expected
+        assert isinstance(convert_to_pkey(input=private_key_pem), expected[0])
+
+    @pytest.mark.unit
+    def test_should_parse_private_keys_only_once(self, mocker):
+        _, private_key = Fixtures.generate_rsa_keys()
+        parse = mocker.spy(paramiko.RSAKey, "from_private_key")
+
+        first = convert_to_pkey(input=private_key.decode("utf-8"))
+        assert is_useable_private_key(input=private_key.decode("utf-8"))
+
+        assert convert_to_pkey(input=private_key.decode("utf-8")) is first
+        assert parse.call_count == 1
+
+    @pytest.mark.unit
+    def test_should_reuse_pooled_connections(self, tmp_path):
+        (tmp_path / "a.csv").write_bytes(b"a")
+        _, private_key = Fixtures.generate_rsa_keys()
+
+        with LocalSftpServer(root=tmp_path) as server:
+            try:
+                for _ in range(2):
+                    downloaded = download_new_files(
+                        sftp_user="user",
+                        sftp_host=server.host,
+                        sftp_port=server.port,
+                        ssh_private_key=private_key.decode("utf-8"),
+                        remote_folder=".",
+                        download_eligable=lambda sftp_item: True,
+                        download_handler=lambda sftp_item, content: content.read(),
+                        reuse_connection=True,
+                    )
+                    assert [item.filename for item in downloaded] == ["a.csv"]
+
+                assert len(server.transports) == 1
+            finally:
+                SSH_CONNECTION_POOL.close()
+
+    @pytest.mark.unit
+    def test_should_evict_idle_and_dead_connections_from_the_pool(self):
+        now = {"seconds": 0.0}
+        pool = SshConnectionPool(max_idle_seconds=60, monotonic=lambda: now["seconds"])
+        idle, dead, alive = FakePooledSshClient(), FakePooledSshClient(), FakePooledSshClient()
+
+        pool.release(key=("idle",), ssh=idle)  # type: ignore
+        now["seconds"] = 30
+        pool.release(key=("dead",), ssh=dead)  # type: ignore
+        pool.release(key=("alive",), ssh=alive)  # type: ignore
+        dead.active = False
+
+        now["seconds"] = 61
+        assert pool.acquire(key=("idle",)) is None
+        assert idle.closed
+        assert pool.acquire(key=("dead",)) is None
+        assert dead.closed
+        assert pool.acquire(key=("alive",)) is alive
+        assert not alive.closed
+
+    @pytest.mark.unit
+    def test_should_resolve_transport_profiles_and_apply_overrides(self):
+        assert sftp_transport_settings().window_size == SFTP_TRANSPORT_BULK_WINDOW_SIZE
+        assert sftp_transport_settings({"profile": "default"}) == SftpTransportSettings()
+
+        settings = sftp_transport_settings({"profile": "compressed", "ciphers": ["aes256-ctr"], "window-size": 4096})
+
+        assert settings.compress is True
+        assert settings.ciphers == ["aes256-ctr"]
+        assert settings.window_size == 4096
+
+    @pytest.mark.unit
+    def test_should_reject_unknown_transport_profiles(self):
+        with pytest.raises(ValueError):
+            sftp_transport_settings({"profile": "warp-speed"})
+
+    @pytest.mark.unit
+    def test_should_prefer_configured_algorithms_and_keep_the_remaining_ones(self):
+        preferred = _preferred_algorithms(preferred=["c", "unknown", "b"], supported=("a", "b", "c"))
+
+        assert preferred == ("c", "b", "a")
+
+    @pytest.mark.unit
+    def test_should_negotiate_according_to_transport_settings(self, tmp_path):
+        (tmp_path / "a.csv").write_bytes(b"a")
+        _, private_key = Fixtures.generate_rsa_keys()
+
+        with LocalSftpServer(root=tmp_path) as server:
+            downloaded = download_new_files(
+                sftp_user="user",
+                sftp_host=server.host,
+                sftp_port=server.port,
+                ssh_private_key=private_key.decode("utf-8"),
+                remote_folder=".",
+                download_eligable=lambda sftp_item: True,
+                download_handler=lambda sftp_item, content: content.read(),
+                transport_settings=SftpTransportSettings(
+                    ciphers=["aes256-ctr"], macs=["hmac-sha2-512"], window_size=SFTP_TRANSPORT_BULK_WINDOW_SIZE
+                ),
+            )
+
+            assert [item.filename for item in downloaded] == ["a.csv"]
+            assert server.transports[0].remote_cipher == "aes256-ctr"
+            assert server.transports[0].remote_mac == "hmac-sha2-512"
+
+    @pytest.mark.unit
+    def test_should_download_files_over_multiple_channels_and_keep_their_order(self):
+        files = {f"./{n}.csv": f"content {n}".encode() for n in range(20)}
+        items = [Fixtures.create_sftp_file_item(filename=f"{n}.csv", location=f"./{n}.csv") for n in range(20)]
+        ssh_client = FakeSshClient(files=files)
+
+        received: Dict[str, bytes] = {}
+        lock = threading.Lock()
+
+        def callback(sftp_file_item: SftpFileItem, content: typing.BinaryIO) -> None:
+            with lock:
+                received[sftp_file_item.location] = content.read()
+
+        visited = _visit_files_using_client(ssh_client=ssh_client, sftp_file_items=items, callback=callback, concurrency=4)  # type: ignore
+
+        assert visited == items
+        assert received == files
+        assert len(ssh_client.channels) == 4
+        assert sum(len(channel.opened) for channel in ssh_client.channels) == len(items)
+
+    @pytest.mark.unit
+    def test_should_isolate_failures_of_single_files_when_downloading_concurrently(self):
+        files = {"./1.csv": b"1", "./3.csv": b"3", "./4.csv": b"4"}
+        items = [Fixtures.create_sftp_file_item(filename=f"{n}.csv", location=f"./{n}.csv") for n in range(1, 5)]
+        ssh_client = FakeSshClient(files=files)
+
+        def callback(sftp_file_item: SftpFileItem, content: typing.BinaryIO) -> None:
+            if sftp_file_item.filename == "4.csv":
+                raise ValueError("upload failed")
+
+        visited = _visit_files_using_client(ssh_client=ssh_client, sftp_file_items=items, callback=callback, concurrency=3)  # type: ignore
+
+        assert [item.filename for item in visited] == ["1.csv", "3.csv"]
+
+    @pytest.mark.unit
+    def test_should_reconnect_and_retry_files_interrupted_by_a_dropped_connection(self):
+        files = {f"./{n}.csv": f"content {n}".encode() for n in range(4)}
+        items = [Fixtures.create_sftp_file_item(filename=f"{n}.csv", location=f"./{n}.csv") for n in range(4)]
+        dropping, replacement = FakeSshClient(files=files), FakeSshClient(files=files)
+        received: Dict[str, bytes] = {}
+        outcomes: Dict[str, Tuple[str, int]] = {}
+
+        def callback(sftp_file_item: SftpFileItem, content: typing.BinaryIO) -> None:
+            if sftp_file_item.filename == "2.csv" and dropping.active:
+                dropping.active = False
+                raise EOFError()
+            received[sftp_file_item.location] = content.read()
+
+        def reconnect(dropped: FakeSshClient) -> FakeSshClient:
+            assert dropped is dropping
+            return replacement
+
+        visited = _visit_files_using_client(
+            ssh_client=dropping, sftp_file_items=items, callback=callback, reconnect=reconnect,  # type: ignore
+            retry_settings=SftpRetrySettings(backoff_seconds=0),
+            download_outcome=lambda item, outcome, retries: outcomes.__setitem__(item.filename, (outcome, retries))
+        )
+
+        assert visited == items
+        assert received == files
+        assert outcomes == {"0.csv": ("downloaded", 0), "1.csv": ("downloaded", 0), "2.csv": ("downloaded", 1), "3.csv": ("downloaded", 0)}
+        assert [channel.opened for channel in replacement.channels] == [["./2.csv", "./3.csv"]]
+
+    @pytest.mark.unit
+    def test_should_give_up_on_files_after_the_configured_number_of_attempts(self):
+        files = {"./1.csv": b"1"}
+        items = [Fixtures.create_sftp_file_item(filename="1.csv", location="./1.csv")]
+        clients = [FakeSshClient(files=files) for _ in range(3)]
+        outcomes = []
+
+        def callback(sftp_file_item: SftpFileItem, content: typing.BinaryIO) -> None:
+            for client in clients:
+                if client.active:
+                    client.active = False
+                    raise paramiko.SSHException("Server connection dropped")
+
+        visited = _visit_files_using_client(
+            ssh_client=clients[0], sftp_file_items=items, callback=callback,  # type: ignore
+            reconnect=lambda dropped: clients[clients.index(dropped) + 1],
+            retry_settings=SftpRetrySettings(attempts=2, backoff_seconds=0),
+            download_outcome=lambda item, outcome, retries: outcomes.append((outcome, retries))
+        )
+
+        assert visited == []
+        assert outcomes == [("failed", 1)]
+        assert clients[2].active
+
+    @pytest.mark.unit
+    def test_should_delay_retries_exponentially_with_jitter(self, monkeypatch):
+        monkeypatch.setattr(random, "uniform", lambda low, high: high)
+        settings = SftpRetrySettings(backoff_seconds=1, max_backoff_seconds=5)
+
+        assert [settings.backoff(retry=n) for n in range(1, 5)] == [1, 2, 4, 5]
+
+    @pytest.mark.unit
+    def test_should_skip_files_rejected_right_before_downloading(self):
+        files = {f"./{n}.csv": b"x" for n in range(4)}
+        items = [Fixtures.create_sftp_file_item(filename=f"{n}.csv", location=f"./{n}.csv", size=n) for n in range(4)]
+        ssh_client = FakeSshClient(files=files)
+
+        visited = _visit_files_using_client(
+            ssh_client=ssh_client, sftp_file_items=items, callback=lambda item, content: None,  # type: ignore
+            may_start_download=lambda item: (item.size or 0) < 2
+        )
+
+        assert [item.filename for item in visited] == ["0.csv", "1.csv"]
+        assert ssh_client.channels[0].opened == ["./0.csv", "./1.csv"]
+
+    @pytest.mark.unit
+    @pytest.mark.parametrize("download_order, expected", [
+        ("listing", ["b.csv", "a.csv", "c.csv"]),
+        ("smallest-first", ["a.csv", "c.csv", "b.csv"]),
+        ("oldest-first", ["c.csv", "b.csv", "a.csv"]),
+    ])
+    def test_should_order_downloads(self, download_order, expected):
+        items = [
+            Fixtures.create_sftp_file_item(filename="b.csv", location="./b.csv", size=300, last_modified=200),
+            Fixtures.create_sftp_file_item(filename="a.csv", location="./a.csv", size=100, last_modified=300),
+            Fixtures.create_sftp_file_item(filename="c.csv", location="./c.csv", size=200, last_modified=100),
+        ]
+
+        assert [item.filename for item in _ordered_items(sftp_file_items=items, download_order=download_order)] == expected
+
+    @pytest.mark.unit
+    @pytest.mark.parametrize("read_settings", [
+        SftpReadSettings(prefetch=False),
+        SftpReadSettings(),
+        SftpReadSettings(max_concurrent_prefetch_requests=4, read_size=4096, buffer_size=8192),
+    ])
+    def test_should_download_identical_content_regardless_of_read_settings(self, tmp_path, read_settings: SftpReadSettings):
+        content = os.urandom(300 * 1024 + 7)
+        os.makedirs(tmp_path / "download")
+        (tmp_path / "download" / "positions.csv").write_bytes(content)
+        _, private_key = Fixtures.generate_rsa_keys()
+
+        received: Dict[str, bytes] = {}
+
+        def callback(sftp_file_item: SftpFileItem, file_content: typing.BinaryIO) -> None:
+            received[sftp_file_item.location] = file_content.read()
+
+        with LocalSftpServer(root=tmp_path) as server:
+            downloaded = download_new_files(
+                sftp_user="user",
+                sftp_host=server.host,
+                sftp_port=server.port,
+                ssh_private_key=private_key.decode("utf-8"),
+                remote_folder="./download",
+                download_eligable=lambda sftp_item: True,
+                download_handler=callback,
+                read_settings=read_settings,
+            )
+
+        assert [item.location for item in downloaded] == ["./download/positions.csv"]
+        assert received["./download/positions.csv"] == content
+
+    @pytest.mark.unit
+    def test_should_walk_folders_breadth_first_and_survive_symlink_cycles(self, tmp_path):
+        download = tmp_path / "download"
+        os.makedirs(download / "sub" / "deeper")
+        (download / "a.csv").write_bytes(b"a")
+        (download / ".hidden").write_bytes(b"hidden")
+        (download / "sub" / "b.csv").write_bytes(b"bb")
+        (download / "sub" / "deeper" / "c.csv").write_bytes(b"ccc")
+        os.symlink(download, download / "sub" / "loop")
+        os.symlink(download / "sub" / "b.csv", download / "link.csv")
+        os.symlink(download / "missing.csv", download / "dangling.csv")
+
+        _, private_key = Fixtures.generate_rsa_keys()
+        with LocalSftpServer(root=tmp_path) as server:
+            with paramiko.SSHClient() as ssh:
+                ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+                ssh.connect(server.host, port=server.port, username="user", pkey=paramiko.RSAKey.from_private_key(StringIO(private_key.decode("utf-8"))))
+                with ssh.open_sftp() as sftp:
+                    walk = _list_folder(sftp=sftp, remote_folder="./download")
+                    first = next(walk)
+                    items = [first] + list(walk)
+
+        locations = {item.location: item.size for item in items}
+        assert locations == {
+            "./download/a.csv": 1,
+            "./download/link.csv": 2,
+            "./download/sub/b.csv": 2,
+            "./download/sub/deeper/c.csv": 3,
+        }
+        # breadth-first: files of the top level folder come before files in sub folders
+        assert [item.location.count("/") for item in items] == sorted(item.location.count("/") for item in items)
+
+    @pytest.mark.unit
+    def test_should_apply_walk_settings_without_listing_excluded_folders(self, tmp_path):
+        for folder in ["exports/deep/deeper", "exports/archive/2019", "other", "ignored"]:
+            os.makedirs(tmp_path / folder)
+        for file in [
+            "exports/a.csv",
+            "exports/a.part",
+            "exports/b.txt",
+            "exports/deep/c.csv",
+            "exports/deep/deeper/d.csv",
+            "exports/archive/2019/e.csv",
+            "other/f.csv",
+            "other/old.csv",
+            "ignored/g.csv",
+        ]:
+            (tmp_path / file).write_bytes(b"x")
+        now = time.time()
+        os.utime(tmp_path / "other" / "old.csv", (now - 3 * 86400, now - 3 * 86400))
+
+        walk_settings = SftpWalkSettings(
+            folders=["./exports", "./other"],
+            include=["*.csv", "re:\\.part$"],
+            exclude=["archive", "*.part"],
+            max_depth=1,
+            max_age_days=2,
+        )
+
+        _, private_key = Fixtures.generate_rsa_keys()
+        with LocalSftpServer(root=tmp_path) as server:
+            with paramiko.SSHClient() as ssh:
+                ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+                ssh.connect(server.host, port=server.port, username="user", pkey=paramiko.RSAKey.from_private_key(StringIO(private_key.decode("utf-8"))))
+                with ssh.open_sftp() as sftp:
+                    listed = []
+                    listdir_attr = sftp.listdir_attr
+                    sftp.listdir_attr = lambda path: listed.append(path) or listdir_attr(path=path)
+                    items = list(_list_folder(sftp=sftp, remote_folder="./ignored", walk_settings=walk_settings))
+
+        assert [item.location for item in items] == ["./exports/a.csv", "./exports/deep/c.csv", "./other/f.csv"]
+        assert listed == ["./exports", "./exports/deep", "./other"]
+
+    @pytest.mark.unit
+    def test_should_stop_the_walk_once_out_of_time(self, tmp_path):
+        os.makedirs(tmp_path / "download" / "sub")
+        (tmp_path / "download" / "a.csv").write_bytes(b"x")
+        (tmp_path / "download" / "sub" / "b.csv").write_bytes(b"x")
+        time_left = [True, False]
+
+        _, private_key = Fixtures.generate_rsa_keys()
+        with LocalSftpServer(root=tmp_path) as server:
+            with paramiko.SSHClient() as ssh:
+                ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+                ssh.connect(server.host, port=server.port, username="user", pkey=paramiko.RSAKey.from_private_key(StringIO(private_key.decode("utf-8"))))
+                with ssh.open_sftp() as sftp:
+                    items = list(_list_folder(sftp=sftp, remote_folder="./download", may_continue=lambda: time_left.pop(0)))
+
+        assert [item.location for item in items] == ["./download/a.csv"]
+        assert time_left == []
+
+    @pytest.mark.unit
+    @pytest.mark.parametrize("pattern, path, expected", [
+        ("archive", "exports/archive", True),
+        ("archive", "exports/archived", False),
+        ("exports/*/old", "exports/2019/old", True),
+        ("exports/*/old", "other/2019/old", False),
+        ("re:^exports/\\d{4}$", "exports/2019", True),
+        ("re:^exports/\\d{4}$", "exports/2019/a.csv", False),
+    ])
+    def test_should_match_walk_patterns(self, pattern, path, expected):
+        assert path_matcher(patterns=[pattern])(path) is expected
+
+    @pytest.mark.unit
+    def test_should_only_list_directories_which_changed_since_the_previous_walk(self, tmp_path):
+        os.makedirs(tmp_path / "download" / "static")
+        os.makedirs(tmp_path / "download" / "active")
+        (tmp_path / "download" / "static" / "a.csv").write_bytes(b"a")
+        (tmp_path / "download" / "active" / "b.csv").write_bytes(b"b")
+        listing_cache = PullListingCache(peer_id="peer")
+        later = lambda: time.time() + 3600  # noqa: E731
+
+        _, private_key = Fixtures.generate_rsa_keys()
+        with LocalSftpServer(root=tmp_path) as server:
+            with paramiko.SSHClient() as ssh:
+                ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+                ssh.connect(server.host, port=server.port, username="user", pkey=paramiko.RSAKey.from_private_key(StringIO(private_key.decode("utf-8"))))
+                with ssh.open_sftp() as sftp:
+                    listed = []
+                    listdir_attr = sftp.listdir_attr
+                    sftp.listdir_attr = lambda path: listed.append(path) or listdir_attr(path=path)
+
+                    first = list(_list_folder(sftp=sftp, remote_folder="./download", listing_cache=listing_cache, now=later))
+                    assert len(listed) == 3
+
+                    listed.clear()
+                    listing_cache = PullListingCache.deserialize(peer_id="peer", data=listing_cache.serialize())
+                    unchanged = list(_list_folder(sftp=sftp, remote_folder="./download", listing_cache=listing_cache, now=later))
+                    assert listed == []
+                    assert unchanged == first
+
+                    (tmp_path / "download" / "active" / "c.csv").write_bytes(b"c")
+                    os.utime(tmp_path / "download" / "active", (time.time() + 10, time.time() + 10))
+                    listing_cache = PullListingCache.deserialize(peer_id="peer", data=listing_cache.serialize())
+                    changed = list(_list_folder(sftp=sftp, remote_folder="./download", listing_cache=listing_cache, now=later))
+
+        assert listed == ["./download/active"]
+        assert sorted(item.location for item in changed) == [
+            "./download/active/b.csv",
+            "./download/active/c.csv",
+            "./download/static/a.csv",
+        ]
+
+    @staticmethod
+    def _download_all(server: LocalSftpServer, private_key: bytes, after_download: SftpAfterDownloadSettings, failed_items: List[SftpFileItem]) -> List[SftpFileItem]:
+        def consume(sftp_item: SftpFileItem, content: typing.BinaryIO) -> None:
+            if sftp_item.filename == "broken.csv":
+                raise IOError("upload failed")
+            content.read()
+
+        return download_new_files(
+            sftp_user="user",
+            sftp_host=server.host,
+            sftp_port=server.port,
+            ssh_private_key=private_key.decode("utf-8"),
+            remote_folder="./download",
+            download_eligable=lambda sftp_item: True,
+            download_handler=consume,
+            after_download=after_download,
+            after_download_failed=failed_items.append,
+        )
+
+    @pytest.mark.unit
+    def test_should_archive_downloaded_files_only(self, tmp_path):
+        os.makedirs(tmp_path / "download" / "sub")
+        (tmp_path / "download" / "a.csv").write_bytes(b"a")
+        (tmp_path / "download" / "broken.csv").write_bytes(b"b")
+        (tmp_path / "download" / "sub" / "a.csv").write_bytes(b"c")
+        os.utime(tmp_path / "download" / "a.csv", (0, 1_700_000_000))
+        os.utime(tmp_path / "download" / "sub" / "a.csv", (0, 1_700_000_001))
+        _, private_key = Fixtures.generate_rsa_keys()
+        failed_items: List[SftpFileItem] = []
+
+        with LocalSftpServer(root=tmp_path) as server:
+            downloaded = self._download_all(server, private_key, SftpAfterDownloadSettings(action="archive", archive_folder="done"), failed_items)
+
+        assert len(downloaded) == 2
+        assert failed_items == []
+        assert sorted(os.listdir(tmp_path / "download")) == ["broken.csv", "sub"]
+        assert os.listdir(tmp_path / "download" / "sub") == []
+        assert (tmp_path / "done" / "download" / "a_(2023-11-14_22-13-20_UTC).csv").read_bytes() == b"a"
+        assert (tmp_path / "done" / "download" / "sub" / "a_(2023-11-14_22-13-21_UTC).csv").read_bytes() == b"c"
+
+    @pytest.mark.unit
+    def test_should_archive_previously_pulled_files_after_storing_the_downloads_until_out_of_time(self, tmp_path):
+        os.makedirs(tmp_path / "download")
+        for name in ("a.csv", "b.csv", "c.csv"):
+            (tmp_path / "download" / name).write_bytes(b"x")
+        _, private_key = Fixtures.generate_rsa_keys()
+        stored: List[List[str]] = []
+        time_left = [True, True, False]
+
+        def record_stored(sftp_items: List[SftpFileItem]) -> None:
+            stored.append(sorted(os.listdir(tmp_path / "download")))
+
+        with LocalSftpServer(root=tmp_path) as server:
+            downloaded = download_new_files(
+                sftp_user="user",
+                sftp_host=server.host,
+                sftp_port=server.port,
+                ssh_private_key=private_key.decode("utf-8"),
+                remote_folder="./download",
+                download_eligable=lambda sftp_item: sftp_item.filename != "a.csv",
+                download_handler=lambda sftp_item, content: content.read(),
+                after_download=SftpAfterDownloadSettings(action="delete"),
+                downloads_stored=record_stored,
+                may_apply_after_download=lambda: time_left.pop(0),
+            )
+
+        assert sorted(item.filename for item in downloaded) == ["b.csv", "c.csv"]
+        # all files were still in place once the downloads were stored
+        assert stored == [["a.csv", "b.csv", "c.csv"]]
+        # the previously pulled file is deleted first, the last file is left to the next run
+        assert "a.csv" not in os.listdir(tmp_path / "download")
+        assert len(os.listdir(tmp_path / "download")) == 1
+
+    @pytest.mark.unit
+    def test_should_not_pull_archived_files_again_with_the_default_settings(self, tmp_path):
+        (tmp_path / "a.csv").write_bytes(b"a")
+        os.utime(tmp_path / "a.csv", (0, 1_700_000_000))
+        _, private_key = Fixtures.generate_rsa_keys()
+        pulled: List[str] = []
+
+        def pull(server: LocalSftpServer) -> List[SftpFileItem]:
+            return download_new_files(
+                sftp_user="user",
+                sftp_host=server.host,
+                sftp_port=server.port,
+                ssh_private_key=private_key.decode("utf-8"),
+                remote_folder=None,
+                download_eligable=lambda sftp_item: sftp_item.location not in pulled,
+                download_handler=lambda sftp_item, content: pulled.append(sftp_item.location) or content.read(),
+                after_download=SftpAfterDownloadSettings(action="archive"),
+            )
+
+        with LocalSftpServer(root=tmp_path) as server:
+            first = pull(server)
+            second = pull(server)
+
+        assert [item.filename for item in first] == ["a.csv"]
+        assert second == []
+        assert os.listdir(tmp_path / "archive") == ["a_(2023-11-14_22-13-20_UTC).csv"]
+
+    @pytest.mark.unit
+    def test_should_delete_downloaded_files(self, tmp_path):
+        os.makedirs(tmp_path / "download")
+        (tmp_path / "download" / "a.csv").write_bytes(b"a")
+        (tmp_path / "download" / "broken.csv").write_bytes(b"b")
+        _, private_key = Fixtures.generate_rsa_keys()
+
+        with LocalSftpServer(root=tmp_path) as server:
+            self._download_all(server, private_key, SftpAfterDownloadSettings(action="delete"), [])
+
+        assert os.listdir(tmp_path / "download") == ["broken.csv"]
+
+    @pytest.mark.unit
+    def test_should_report_files_which_cannot_be_archived(self, tmp_path):
+        os.makedirs(tmp_path / "download")
+        (tmp_path / "download" / "a.csv").write_bytes(b"a")
+        (tmp_path / "download" / "b.csv").write_bytes(b"b")
+        (tmp_path / "done").write_bytes(b"not a folder")
+        _, private_key = Fixtures.generate_rsa_keys()
+        failed_items: List[SftpFileItem] = []
+
+        with LocalSftpServer(root=tmp_path) as server:
+            downloaded = self._download_all(server, private_key, SftpAfterDownloadSettings(action="archive", archive_folder="done"), failed_items)
+
+        assert sorted(item.filename for item in failed_items) == ["a.csv", "b.csv"]
+        assert failed_items == downloaded
+        assert sorted(os.listdir(tmp_path / "download")) == ["a.csv", "b.csv"]
+
+    @pytest.mark.unit
+    def test_should_compute_the_sha256_of_downloaded_files_while_streaming(self, tmp_path):
+        os.makedirs(tmp_path / "download")
+        content = os.urandom(100 * 1024 + 3)
+        (tmp_path / "download" / "a.csv").write_bytes(content)
+        _, private_key = Fixtures.generate_rsa_keys()
+        digests = []
+
+        def consume(sftp_item: SftpFileItem, file_content: typing.BinaryIO) -> None:
+            while file_content.read(4096):
+                pass
+            digests.append(sftp_item.sha256)
+
+        with LocalSftpServer(root=tmp_path) as server:
+            downloaded = download_new_files(
+                sftp_user="user",
+                sftp_host=server.host,
+                sftp_port=server.port,
+                ssh_private_key=private_key.decode("utf-8"),
+                remote_folder="./download",
+                download_eligable=lambda sftp_item: True,
+                download_handler=consume,
+                skip_known_content=lambda sftp_item: True,
+            )
+
+        # the local server does not provide SHA-256 digests, so the file is downloaded anyway
+        assert [item.sha256 for item in downloaded] == digests == [hashlib.sha256(content).hexdigest()]
+
+    @pytest.mark.unit
+    def test_should_skip_downloading_known_content_if_the_server_provides_digests(self, tmp_path, monkeypatch):
+        monkeypatch.setitem(paramiko.sftp_server._hash_class, "sha256", hashlib.sha256)
+        os.makedirs(tmp_path / "download")
+        known, unknown = os.urandom(1024), os.urandom(1024)
+        (tmp_path / "download" / "known.csv").write_bytes(known)
+        (tmp_path / "download" / "unknown.csv").write_bytes(unknown)
+        _, private_key = Fixtures.generate_rsa_keys()
+        checked = []
+
+        def skip_known_content(sftp_item: SftpFileItem) -> bool:
+            checked.append(sftp_item.filename)
+            return sftp_item.sha256 == hashlib.sha256(known).hexdigest()
+
+        with LocalSftpServer(root=tmp_path) as server:
+            downloaded = download_new_files(
+                sftp_user="user",
+                sftp_host=server.host,
+                sftp_port=server.port,
+                ssh_private_key=private_key.decode("utf-8"),
+                remote_folder="./download",
+                download_eligable=lambda sftp_item: True,
+                download_handler=lambda sftp_item, content: content.read(),
+                skip_known_content=skip_known_content,
+            )
+
+        assert sorted(checked) == ["known.csv", "unknown.csv"]
+        assert [item.filename for item in downloaded] == ["unknown.csv"]
+
+    @pytest.mark.unit
+    def test_should_only_read_the_bytes_following_the_resume_offset(self, tmp_path):
+        os.makedirs(tmp_path / "download")
+        content = os.urandom(200 * 1024)
+        (tmp_path / "download" / "rolling.csv").write_bytes(content)
+        (tmp_path / "download" / "other.csv").write_bytes(content)
+        _, private_key = Fixtures.generate_rsa_keys()
+        received = {}
+
+        def consume(sftp_item: SftpFileItem, file_content: typing.BinaryIO) -> None:
+            offset = file_content.tell()
+            received[sftp_item.filename] = (offset, file_content.read(), sftp_item.sha256)
+
+        with LocalSftpServer(root=tmp_path) as server:
+            download_new_files(
+                sftp_user="user",
+                sftp_host=server.host,
+                sftp_port=server.port,
+                ssh_private_key=private_key.decode("utf-8"),
+                remote_folder="./download",
+                download_eligable=lambda sftp_item: True,
+                download_handler=consume,
+                resume_offset=lambda sftp_item: 150 * 1024 if sftp_item.filename == "rolling.csv" else 0,
+            )
+
+        assert received["rolling.csv"] == (150 * 1024, content[150 * 1024:], None)
+        assert received["other.csv"] == (0, content, hashlib.sha256(content).hexdigest())
+
+    @pytest.mark.unit
+    def test_should_read_large_files_in_stripes_over_multiple_connections(self, tmp_path):
+        os.makedirs(tmp_path / "download")
+        content = os.urandom(11 * 1024 * 1024)
+        (tmp_path / "download" / "large.csv").write_bytes(content)
+        (tmp_path / "download" / "small.csv").write_bytes(b"a;b")
+        _, private_key = Fixtures.generate_rsa_keys()
+        streamed, striped = [], {}
+
+        def consume_stripes(sftp_item: SftpFileItem, stripes: typing.Iterator[SftpStripe]) -> None:
+            for stripe in stripes:
+                assert stripe.sha256 == hashlib.sha256(stripe.data).digest()
+                striped[stripe.index] = stripe
+
+        with LocalSftpServer(root=tmp_path) as server:
+            downloaded = download_new_files(
+                sftp_user="user",
+                sftp_host=server.host,
+                sftp_port=server.port,
+                ssh_private_key=private_key.decode("utf-8"),
+                remote_folder="./download",
+                download_eligable=lambda sftp_item: True,
+                download_handler=lambda sftp_item, content: streamed.append((sftp_item.filename, content.read())),
+                stripe_settings=SftpStripeSettings(min_size=1024 * 1024, connections=2, stripe_size=1),
+                striped_download_handler=consume_stripes,
+            )
+
+            assert len(server.transports) == 3
+
+        assert sorted(item.filename for item in downloaded) == ["large.csv", "small.csv"]
+        assert streamed == [("small.csv", b"a;b")]
+        assert sorted(striped) == [0, 1, 2]
+        assert [striped[index].offset for index in range(3)] == [0, 5 * 1024 * 1024, 10 * 1024 * 1024]
+        assert b"".join(striped[index].data for index in range(3)) == content
+
+    @pytest.mark.unit
+    def test_should_fail_striped_downloads_of_files_changing_while_being_read(self, tmp_path):
+        os.makedirs(tmp_path / "download")
+        (tmp_path / "download" / "large.csv").write_bytes(os.urandom(6 * 1024 * 1024))
+        _, private_key = Fixtures.generate_rsa_keys()
+
+        def consume_stripes(sftp_item: SftpFileItem, stripes: typing.Iterator[SftpStripe]) -> None:
+            with open(tmp_path / "download" / "large.csv", "ab") as f:
+                f.write(b"appended")
+            for _ in stripes:
+                pass
+
+        with LocalSftpServer(root=tmp_path) as server:
+            downloaded = download_new_files(
+                sftp_user="user",
+                sftp_host=server.host,
+                sftp_port=server.port,
+                ssh_private_key=private_key.decode("utf-8"),
+                remote_folder="./download",
+                download_eligable=lambda sftp_item: True,
+                download_handler=lambda sftp_item, content: content.read(),
+                stripe_settings=SftpStripeSettings(min_size=1024 * 1024, connections=2, stripe_size=1),
+                striped_download_handler=consume_stripes,
+            )
+
+        assert downloaded == []
+
+    @pytest.mark.unit
+    def test_should_fail_striped_downloads_if_a_reader_fails_unexpectedly(self, tmp_path, mocker):
+        os.makedirs(tmp_path / "download")
+        (tmp_path / "download" / "large.csv").write_bytes(os.urandom(6 * 1024 * 1024))
+        _, private_key = Fixtures.generate_rsa_keys()
+        mocker.patch("utils.sftp.SftpStripe", side_effect=RuntimeError("unexpected"))
+        downloaded: List[List[SftpFileItem]] = []
+
+        def pull(server: LocalSftpServer) -> None:
+            downloaded.append(download_new_files(
+                sftp_user="user",
+                sftp_host=server.host,
+                sftp_port=server.port,
+                ssh_private_key=private_key.decode("utf-8"),
+                remote_folder="./download",
+                download_eligable=lambda sftp_item: True,
+                download_handler=lambda sftp_item, content: content.read(),
+                stripe_settings=SftpStripeSettings(min_size=1024 * 1024, connections=2, stripe_size=1),
+                striped_download_handler=lambda sftp_item, stripes: list(stripes),
+            ))
+
+        with LocalSftpServer(root=tmp_path) as server:
+            # the download must fail instead of waiting for stripes which never arrive
+            puller = threading.Thread(target=pull, args=(server,), daemon=True)
+            puller.start()
+            puller.join(timeout=30)
+            assert not puller.is_alive()
+
+        assert downloaded == [[]]
+
+    @pytest.mark.unit
+    def test_should_resume_downloading_the_remaining_files_after_reconnecting(self, tmp_path):
+        os.makedirs(tmp_path / "download")
+        for n in range(4):
+            (tmp_path / "download" / f"{n}.csv").write_bytes(f"content {n}".encode())
+        _, private_key = Fixtures.generate_rsa_keys()
+        received: Dict[str, bytes] = {}
+        retried: Dict[str, int] = {}
+
+        with LocalSftpServer(root=tmp_path) as server:
+
+            def drop_connection_once(sftp_item: SftpFileItem) -> bool:
+                if sftp_item.filename == "2.csv" and len(server.transports) == 1:
+                    server.transports[0].close()
+                return True
+
+            downloaded = download_new_files(
+                sftp_user="user",
+                sftp_host=server.host,
+                sftp_port=server.port,
+                ssh_private_key=private_key.decode("utf-8"),
+                remote_folder="./download",
+                download_eligable=lambda sftp_item: True,
+                download_handler=lambda sftp_item, content: received.__setitem__(sftp_item.filename, content.read()),
+                download_order="oldest-first",
+                may_start_download=drop_connection_once,
+                retry_settings=SftpRetrySettings(backoff_seconds=0.2),
+                download_outcome=lambda sftp_item, outcome, retries: retried.__setitem__(sftp_item.filename, retries),
+            )
+
+            assert len(server.transports) == 2
+
+        assert sorted(item.filename for item in downloaded) == ["0.csv", "1.csv", "2.csv", "3.csv"]
+        assert received == {f"{n}.csv": f"content {n}".encode() for n in range(4)}
+        assert retried["2.csv"] >= 1